@@ -12,19 +12,25 @@ from __future__ import annotations
 import argparse
 import base64
 import csv
+import gzip
+import hashlib
+import http.client
 import itertools
 import json
+import math
 import mimetypes
 import os
 import re
+import sqlite3
 import sys
+import threading
 import time
-import urllib.error
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 import urllib.parse
-import urllib.request
 from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Any, Callable
+from typing import Any, Callable, Iterator
 
 
 AGES = ["18", "28", "42"]
@@ -94,21 +100,299 @@ def setting_or_env(settings: dict[str, Any], setting_name: str, env_name: str) -
     return str(value).strip()
 
 
-def post_json(url: str, headers: dict[str, str], payload: dict[str, Any], timeout: int = 180) -> dict[str, Any]:
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(url, data=data, headers=headers | {"Content-Type": "application/json"}, method="POST")
+UserAgent = "multiImageClient-describe-eval/1.0"
+RetryStatuses = (429, 500, 502, 503, 504)
+MaxIdlePerHost = 16
+IdempotentMethods = ("GET", "HEAD", "OPTIONS")
+StaleConnectionErrors = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+
+class RequestFailed(Exception):
+    """A transport failure, with how far the request got before it."""
+
+    def __init__(self, cause: Exception, sent: bool, answered: bool, reused: bool) -> None:
+        super().__init__(str(cause))
+        self.cause = cause
+        self.sent = sent
+        self.answered = answered
+        self.reused = reused
+
+
+class HttpClient:
+    """
+    Keep-alive connections pooled per host, gzip responses, and retries.
+
+    At most `retries` retries are made per request. A retry waits for the
+    server's Retry-After or an exponential backoff. A request is retried when
+    it gets a RetryStatuses code or fails before it was sent. GET requests are
+    also retried after any transport failure. Provider calls are paid POSTs,
+    so one that may have reached the server is only sent again in two cases.
+    The first is a pooled connection the server had closed before answering
+    (RemoteDisconnected, broken pipe, or reset): it is re-sent at once, and
+    this still counts as a retry. The second is a timeout, and only when
+    retry_timeouts=True. With http2=True requests go through httpx instead
+    (pip install "httpx[http2]").
+    """
+
+    def __init__(self, timeout: float, retries: int = 2, retry_backoff: float = 2.0, http2: bool = False, retry_timeouts: bool = False) -> None:
+        if retries < 0 or retry_backoff < 0:
+            raise ValueError("retries and retry_backoff must not be negative.")
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retry_timeouts = retry_timeouts
+        self.connections_opened = 0
+        self._idle: dict[tuple[str, str, int], list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+        self._timeouts: tuple[type[Exception], ...] = (TimeoutError,)
+        self._httpx: Any = None
+        if http2:
+            try:
+                import httpx
+                import h2  # noqa: F401  httpx only negotiates HTTP/2 when h2 is installed.
+            except ImportError as ex:
+                raise RuntimeError('--http2 needs httpx with HTTP/2 support: pip install "httpx[http2]"') from ex
+            self._httpx = httpx.Client(http2=True, timeout=timeout)
+            self._timeouts += (httpx.TimeoutException,)
+
+    def _resend_delay(self, method: str, failure: RequestFailed, attempt: int) -> float | None:
+        """Seconds to wait before sending again, or None when it is not safe to."""
+        if failure.reused and not failure.answered and isinstance(failure.cause, StaleConnectionErrors):
+            return 0.0
+        if not failure.sent or method in IdempotentMethods:
+            return self.retry_backoff * 2**attempt
+        if self.retry_timeouts and isinstance(failure.cause, self._timeouts):
+            return self.retry_backoff * 2**attempt
+        return None
+
+    def request(self, method: str, url: str, headers: dict[str, str], body: bytes | None = None) -> tuple[int, bytes]:
+        """Send one request and return (status, decoded body)."""
+        headers = {"User-Agent": UserAgent, "Accept-Encoding": "gzip"} | headers
+        attempt = 0
+        while True:
+            try:
+                status, retry_after, data = self._send(method, url, headers, body)
+            except RequestFailed as failure:
+                delay = self._resend_delay(method, failure, attempt)
+                if attempt >= self.retries or delay is None:
+                    raise failure.cause from None
+            else:
+                if status not in RetryStatuses or attempt >= self.retries:
+                    return status, data
+                delay = retry_after if retry_after is not None else self.retry_backoff * 2**attempt
+            attempt += 1
+            print(f"[http] retry {attempt}/{self.retries} for {urllib.parse.urlsplit(url).netloc} in {delay:g}s", flush=True)
+            time.sleep(delay)
+
+    def _send(self, method: str, url: str, headers: dict[str, str], body: bytes | None) -> tuple[int, float | None, bytes]:
+        """Make one attempt; transport failures are raised as RequestFailed."""
+        if self._httpx is not None:
+            import httpx
+            try:
+                response = self._httpx.request(method, url, headers=headers, content=body)
+            except httpx.TransportError as ex:
+                sent = not isinstance(ex, (httpx.ConnectError, httpx.ConnectTimeout))
+                raise RequestFailed(ex, sent, answered=False, reused=False) from ex
+            return response.status_code, parse_retry_after(response.headers.get("Retry-After")), response.content
+
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname or "", parts.port or (443 if parts.scheme == "https" else 80))
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        connection, reused = self._acquire(key)
+        sent = answered = False
+        try:
+            if not reused:
+                connection.connect()
+            connection.request(method, target, body=body, headers=headers)
+            sent = True
+            response = connection.getresponse()
+            answered = True
+            data = response.read()
+        except (OSError, http.client.HTTPException) as ex:
+            connection.close()
+            raise RequestFailed(ex, sent, answered, reused) from ex
+        if response.getheader("Content-Encoding", "").lower() == "gzip":
+            data = gzip.decompress(data)
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(key, connection)
+        return response.status, parse_retry_after(response.getheader("Retry-After")), data
+
+    def _acquire(self, key: tuple[str, str, int]) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+            self.connections_opened += 1
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout), False
+        if scheme == "http":
+            return http.client.HTTPConnection(host, port, timeout=self.timeout), False
+        raise ValueError(f"Unsupported URL scheme: {scheme}")
+
+    def _release(self, key: tuple[str, str, int], connection: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < MaxIdlePerHost:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for idle in self._idle.values():
+                for connection in idle:
+                    connection.close()
+            self._idle.clear()
+        if self._httpx is not None:
+            self._httpx.close()
+
+
+def parse_retry_after(value: str | None) -> float | None:
     try:
-        with urllib.request.urlopen(req, timeout=timeout) as res:
-            return json.loads(res.read().decode("utf-8"))
-    except urllib.error.HTTPError as ex:
-        body = ex.read().decode("utf-8", errors="replace")
-        raise RuntimeError(f"HTTP {ex.code} from {url}: {body}") from ex
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+_clients: dict[tuple[Any, ...], HttpClient] = {}
+_clients_lock = threading.Lock()
+
 
+def http_client(args: argparse.Namespace) -> HttpClient:
+    """Return the shared client for the timeout, retry, and HTTP/2 options in args."""
+    key = (args.timeout, args.retries, args.retry_backoff, args.http2, args.retry_timeouts)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = HttpClient(args.timeout, args.retries, args.retry_backoff, args.http2, args.retry_timeouts)
+    return client
 
-def download_url(url: str, timeout: int = 180) -> bytes:
-    req = urllib.request.Request(url, headers={"User-Agent": "multiImageClient-describe-eval/1.0"})
-    with urllib.request.urlopen(req, timeout=timeout) as res:
-        return res.read()
+
+def http_request(method: str, url: str, headers: dict[str, str], body: bytes | None, args: argparse.Namespace) -> bytes:
+    status, data = http_client(args).request(method, url, headers, body)
+    if status >= 400:
+        raise RuntimeError(f"HTTP {status} from {url}: {data.decode('utf-8', errors='replace')}")
+    return data
+
+
+def post_json(url: str, headers: dict[str, str], payload: dict[str, Any], args: argparse.Namespace) -> dict[str, Any]:
+    data = json.dumps(payload).encode("utf-8")
+    return json.loads(http_request("POST", url, headers | {"Content-Type": "application/json"}, data, args).decode("utf-8"))
+
+
+def get_json(url: str, headers: dict[str, str], args: argparse.Namespace) -> dict[str, Any]:
+    return json.loads(http_request("GET", url, headers, None, args).decode("utf-8"))
+
+
+def download_url(url: str, args: argparse.Namespace) -> bytes:
+    return http_request("GET", url, {}, None, args)
+
+
+ResponseCacheSchema = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_used ON responses(used);
+"""
+
+
+class ResponseCache:
+    """
+    Provider responses stored in SQLite under a sha256 of the request inputs.
+
+    A hit updates the entry's last-use time. After each write, the least
+    recently used entries are evicted until the stored responses fit in
+    max_bytes. With refresh=True every lookup misses, so each call is made
+    again and its entry replaced.
+    """
+
+    def __init__(self, path: Path, max_bytes: int, refresh: bool = False) -> None:
+        if max_bytes < 0:
+            raise ValueError("max_bytes must not be negative.")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(ResponseCacheSchema)
+
+    @staticmethod
+    def key(kind: str, content_sha256: str, endpoint: str, model: str, prompt: str, parameters: dict[str, Any]) -> str:
+        material = json.dumps([kind, content_sha256, endpoint, model, prompt, parameters], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = None if self.refresh else self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE responses SET used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key: str, kind: str, endpoint: str, model: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, kind, endpoint, model, response, len(response.encode("utf-8")), now, now),
+                )
+                (total,) = self._db.execute("SELECT COALESCE(SUM(bytes), 0) FROM responses").fetchone()
+                if total > self.max_bytes:
+                    kept = 0
+                    evicted = []
+                    for row_key, size in self._db.execute("SELECT key, bytes FROM responses ORDER BY used DESC").fetchall():
+                        kept += size
+                        if kept > self.max_bytes:
+                            evicted.append((row_key,))
+                    self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_caches: dict[tuple[Any, ...], ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def response_cache(args: argparse.Namespace) -> ResponseCache | None:
+    """Return the shared response cache for args, or None when --response-cache is blank."""
+    if not args.response_cache:
+        return None
+    key = (str(Path(args.response_cache).resolve()), args.cache_max_mb, args.refresh_cache)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = ResponseCache(Path(args.response_cache), int(args.cache_max_mb * 1024**2), args.refresh_cache)
+    return cache
+
+
+def print_cache_summary(args: argparse.Namespace) -> None:
+    cache = response_cache(args)
+    if cache is not None:
+        print(f"[cache] hits={cache.hits} misses={cache.misses} refresh={cache.refresh}: {cache.path}")
 
 
 def image_data_uri(path: Path) -> tuple[str, str, str]:
@@ -140,12 +424,12 @@ def generate_openai(case: Case, settings: dict[str, Any], args: argparse.Namespa
     }
     if args.openai_moderation:
         payload["moderation"] = args.openai_moderation
-    response = post_json("https://api.openai.com/v1/images/generations", {"Authorization": f"Bearer {api_key}"}, payload, args.timeout)
+    response = post_json(f"{args.openai_base_url}/v1/images/generations", {"Authorization": f"Bearer {api_key}"}, payload, args)
     item = (response.get("data") or [{}])[0]
     if item.get("b64_json"):
         return base64.b64decode(item["b64_json"])
     if item.get("url"):
-        return download_url(item["url"], args.timeout)
+        return download_url(item["url"], args)
     raise RuntimeError(f"OpenAI image response had no b64_json or url: {response}")
 
 
@@ -162,12 +446,12 @@ def generate_grok(case: Case, settings: dict[str, Any], args: argparse.Namespace
         "n": 1,
         "response_format": "b64_json",
     }
-    response = post_json("https://api.x.ai/v1/images/generations", {"Authorization": f"Bearer {api_key}"}, payload, args.timeout)
+    response = post_json("https://api.x.ai/v1/images/generations", {"Authorization": f"Bearer {api_key}"}, payload, args)
     item = (response.get("data") or [{}])[0]
     if item.get("b64_json"):
         return base64.b64decode(item["b64_json"])
     if item.get("url"):
-        return download_url(item["url"], args.timeout)
+        return download_url(item["url"], args)
     raise RuntimeError(f"xAI image response had no b64_json or url: {response}")
 
 
@@ -177,18 +461,46 @@ GENERATORS: dict[str, Callable[[Case, dict[str, Any], argparse.Namespace], bytes
 }
 
 
-def generate_images(cases: list[Case], settings: dict[str, Any], args: argparse.Namespace, images_dir: Path) -> None:
+def generate_images(cases: list[Case], settings: dict[str, Any], args: argparse.Namespace, images_dir: Path, run_dir: Path) -> int:
+    """
+    Generate each missing image and return the number of failures.
+
+    An image only appears once it is complete, so a rerun skips finished cases
+    and retries the ones that failed or were cut off. Every attempt is
+    appended to generate_results.jsonl.
+    """
     images_dir.mkdir(parents=True, exist_ok=True)
     selected = cases[: args.limit] if args.limit else cases
     generator = GENERATORS[args.generator]
-    for idx, case in enumerate(selected, 1):
-        path = images_dir / f"{case.case_id}.png"
-        if path.exists() and not args.overwrite:
-            print(f"[generate {idx}/{len(selected)}] skip existing {path.name}")
-            continue
-        print(f"[generate {idx}/{len(selected)}] {case.case_id}: {case.prompt}", flush=True)
-        path.write_bytes(generator(case, settings, args))
-        time.sleep(args.sleep)
+    failures = 0
+    with (run_dir / "generate_results.jsonl").open("a", encoding="utf-8") as results:
+        for idx, case in enumerate(selected, 1):
+            path = images_dir / f"{case.case_id}.png"
+            if path.exists() and not args.overwrite:
+                print(f"[generate {idx}/{len(selected)}] skip existing {path.name}")
+                continue
+            print(f"[generate {idx}/{len(selected)}] {case.case_id}: {case.prompt}", flush=True)
+            started = time.perf_counter()
+            try:
+                partial = path.with_suffix(".png.partial")
+                partial.write_bytes(generator(case, settings, args))
+                os.replace(partial, path)
+                error = ""
+            except Exception as ex:
+                failures += 1
+                error = str(ex)
+                print(f"[generate {idx}/{len(selected)}] failed {case.case_id}: {error}", flush=True)
+            record = {
+                "case_id": case.case_id,
+                "generator": args.generator,
+                "prompt_sha256": prompt_sha256(case.prompt),
+                "error": error,
+                "generate_seconds": round(time.perf_counter() - started, 3),
+            }
+            results.write(json.dumps(record, ensure_ascii=False) + "\n")
+            results.flush()
+            time.sleep(args.sleep)
+    return failures
 
 
 def extract_text_from_response(response: dict[str, Any]) -> str:
@@ -295,27 +607,46 @@ def build_score_prompt(case: Case, response_text: str) -> str:
     )
 
 
-def score_description_with_llm(case: Case, text: str, settings: dict[str, Any], args: argparse.Namespace) -> dict[str, Any]:
-    api_key = setting_or_env(settings, "OpenAIApiKey", "OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("Missing OpenAIApiKey or OPENAI_API_KEY for LLM scoring.")
-    payload = {
+def score_payload(prompt: str, args: argparse.Namespace) -> dict[str, Any]:
+    return {
         "model": args.score_judge_model,
-        "messages": [{"role": "user", "content": build_score_prompt(case, text)}],
+        "messages": [{"role": "user", "content": prompt}],
         "temperature": 0,
         "max_tokens": args.score_max_tokens,
         "response_format": {"type": "json_object"},
     }
-    response = post_json("https://api.openai.com/v1/chat/completions", {"Authorization": f"Bearer {api_key}"}, payload, args.timeout)
+
+
+def score_cache_key(prompt: str, text: str, args: argparse.Namespace) -> str:
+    text_sha256 = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return ResponseCache.key("score", text_sha256, "openai", args.score_judge_model, prompt, {"max_tokens": args.score_max_tokens})
+
+
+def parse_llm_score(response: dict[str, Any]) -> dict[str, Any]:
     return normalize_llm_score(extract_json_object(extract_text_from_response(response)))
 
 
-def describe_openai(image_path: Path, settings: dict[str, Any], args: argparse.Namespace) -> str:
+def score_description_with_llm(case: Case, text: str, settings: dict[str, Any], args: argparse.Namespace) -> dict[str, Any]:
+    prompt = build_score_prompt(case, text)
+    cache = response_cache(args)
+    if cache is not None:
+        key = score_cache_key(prompt, text, args)
+        cached = cache.get(key)
+        if cached is not None:
+            return json.loads(cached)
     api_key = setting_or_env(settings, "OpenAIApiKey", "OPENAI_API_KEY")
     if not api_key:
-        raise RuntimeError("Missing OpenAIApiKey or OPENAI_API_KEY.")
+        raise RuntimeError("Missing OpenAIApiKey or OPENAI_API_KEY for LLM scoring.")
+    response = post_json(f"{args.openai_base_url}/v1/chat/completions", {"Authorization": f"Bearer {api_key}"}, score_payload(prompt, args), args)
+    score = parse_llm_score(response)
+    if cache is not None:
+        cache.put(key, "score", "openai", args.score_judge_model, json.dumps(score, ensure_ascii=False))
+    return score
+
+
+def openai_describe_payload(image_path: Path, args: argparse.Namespace) -> dict[str, Any]:
     data_uri, _, _ = image_data_uri(image_path)
-    payload = {
+    return {
         "model": args.openai_vision_model,
         "input": [{
             "role": "user",
@@ -326,7 +657,14 @@ def describe_openai(image_path: Path, settings: dict[str, Any], args: argparse.N
         }],
         "max_output_tokens": args.max_tokens,
     }
-    return extract_text_from_response(post_json("https://api.openai.com/v1/responses", {"Authorization": f"Bearer {api_key}"}, payload, args.timeout))
+
+
+def describe_openai(image_path: Path, settings: dict[str, Any], args: argparse.Namespace) -> str:
+    api_key = setting_or_env(settings, "OpenAIApiKey", "OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("Missing OpenAIApiKey or OPENAI_API_KEY.")
+    payload = openai_describe_payload(image_path, args)
+    return extract_text_from_response(post_json(f"{args.openai_base_url}/v1/responses", {"Authorization": f"Bearer {api_key}"}, payload, args))
 
 
 def describe_grok(image_path: Path, settings: dict[str, Any], args: argparse.Namespace) -> str:
@@ -345,7 +683,7 @@ def describe_grok(image_path: Path, settings: dict[str, Any], args: argparse.Nam
         }],
         "max_output_tokens": args.max_tokens,
     }
-    return extract_text_from_response(post_json("https://api.x.ai/v1/responses", {"Authorization": f"Bearer {api_key}"}, payload, args.timeout))
+    return extract_text_from_response(post_json("https://api.x.ai/v1/responses", {"Authorization": f"Bearer {api_key}"}, payload, args))
 
 
 def describe_gemini(image_path: Path, settings: dict[str, Any], args: argparse.Namespace) -> str:
@@ -359,17 +697,14 @@ def describe_gemini(image_path: Path, settings: dict[str, Any], args: argparse.N
         "contents": [{"role": "user", "parts": [{"text": args.describe_prompt}, {"inline_data": {"mime_type": mime, "data": b64}}]}],
         "generationConfig": {"maxOutputTokens": args.max_tokens, "temperature": 0.0, "thinkingConfig": {"thinkingBudget": 0}},
     }
-    response = post_json(url, {}, payload, args.timeout)
+    response = post_json(url, {}, payload, args)
     parts = response.get("candidates", [{}])[0].get("content", {}).get("parts", [])
     return "\n".join(part.get("text", "") for part in parts).strip() or json.dumps(response, ensure_ascii=False)
 
 
-def describe_claude(image_path: Path, settings: dict[str, Any], args: argparse.Namespace) -> str:
-    api_key = setting_or_env(settings, "AnthropicApiKey", "ANTHROPIC_API_KEY")
-    if not api_key:
-        raise RuntimeError("Missing AnthropicApiKey or ANTHROPIC_API_KEY.")
+def claude_describe_payload(image_path: Path, args: argparse.Namespace) -> dict[str, Any]:
     _, b64, mime = image_data_uri(image_path)
-    payload = {
+    return {
         "model": args.claude_vision_model,
         "max_tokens": args.max_tokens,
         "temperature": 0.0,
@@ -381,10 +716,21 @@ def describe_claude(image_path: Path, settings: dict[str, Any], args: argparse.N
             ],
         }],
     }
-    response = post_json("https://api.anthropic.com/v1/messages", {"x-api-key": api_key, "anthropic-version": "2023-06-01"}, payload, args.timeout)
+
+
+def claude_text(response: dict[str, Any]) -> str:
     return "\n".join(item.get("text", "") for item in response.get("content", []) if item.get("type") == "text").strip() or json.dumps(response, ensure_ascii=False)
 
 
+def describe_claude(image_path: Path, settings: dict[str, Any], args: argparse.Namespace) -> str:
+    api_key = setting_or_env(settings, "AnthropicApiKey", "ANTHROPIC_API_KEY")
+    if not api_key:
+        raise RuntimeError("Missing AnthropicApiKey or ANTHROPIC_API_KEY.")
+    payload = claude_describe_payload(image_path, args)
+    response = post_json(f"{args.anthropic_base_url}/v1/messages", {"x-api-key": api_key, "anthropic-version": "2023-06-01"}, payload, args)
+    return claude_text(response)
+
+
 def encode_multipart(fields: dict[str, str], files: dict[str, tuple[str, str, bytes]]) -> tuple[bytes, str]:
     boundary = f"----multiImageClientDescribeEval{int(time.time() * 1000)}"
     lines: list[bytes] = []
@@ -403,17 +749,8 @@ def describe_ideogram(image_path: Path, settings: dict[str, Any], args: argparse
     mime = mimetypes.guess_type(image_path.name)[0] or "image/png"
     fields = {"describe_model_version": args.ideogram_describe_model} if args.ideogram_describe_model else {}
     body, boundary = encode_multipart(fields, {"image_file": (image_path.name, mime, image_path.read_bytes())})
-    req = urllib.request.Request(
-        "https://api.ideogram.ai/describe",
-        data=body,
-        headers={"Api-Key": api_key, "Content-Type": f"multipart/form-data; boundary={boundary}"},
-        method="POST",
-    )
-    try:
-        with urllib.request.urlopen(req, timeout=args.timeout) as res:
-            response = json.loads(res.read().decode("utf-8"))
-    except urllib.error.HTTPError as ex:
-        raise RuntimeError(f"HTTP {ex.code} from Ideogram describe: {ex.read().decode('utf-8', errors='replace')}") from ex
+    headers = {"Api-Key": api_key, "Content-Type": f"multipart/form-data; boundary={boundary}"}
+    response = json.loads(http_request("POST", "https://api.ideogram.ai/describe", headers, body, args).decode("utf-8"))
     descriptions = response.get("descriptions") or []
     return "\n".join(d.get("text", "") for d in descriptions).strip() or json.dumps(response, ensure_ascii=False)
 
@@ -426,6 +763,285 @@ DESCRIBERS: dict[str, Callable[[Path, dict[str, Any], argparse.Namespace], str]]
     "ideogram": describe_ideogram,
 }
 
+DescribeModelArgs = {
+    "openai": "openai_vision_model",
+    "grok": "grok_vision_model",
+    "gemini": "gemini_vision_model",
+    "claude": "claude_vision_model",
+    "ideogram": "ideogram_describe_model",
+}
+
+
+def describe_cache_key(endpoint: str, image_path: Path, args: argparse.Namespace) -> str:
+    image_sha256 = hashlib.sha256(image_path.read_bytes()).hexdigest()
+    model = getattr(args, DescribeModelArgs[endpoint])
+    return ResponseCache.key("describe", image_sha256, endpoint, model, args.describe_prompt, {"max_tokens": args.max_tokens, "detail": args.detail})
+
+
+def describe_cached(endpoint: str, image_path: Path, settings: dict[str, Any], args: argparse.Namespace) -> tuple[str, bool]:
+    """Return (text, cached): the response cache's text for this request, or a new call's."""
+    cache = response_cache(args)
+    if cache is None:
+        return DESCRIBERS[endpoint](image_path, settings, args), False
+    key = describe_cache_key(endpoint, image_path, args)
+    text = cache.get(key)
+    if text is not None:
+        return text, True
+    text = DESCRIBERS[endpoint](image_path, settings, args)
+    cache.put(key, "describe", endpoint, getattr(args, DescribeModelArgs[endpoint]), text)
+    return text, False
+
+
+BatchEndpoints = {"openai": ("openai", "/v1/responses"), "claude": ("anthropic", "/v1/messages")}
+BatchMaxBytes = 150 * 1024**2
+BatchMaxRequests = 10_000
+OpenAIBatchEndStates = ("completed", "failed", "expired", "cancelled")
+
+
+def batch_headers(provider: str, settings: dict[str, Any]) -> dict[str, str]:
+    if provider == "openai":
+        api_key = setting_or_env(settings, "OpenAIApiKey", "OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("Missing OpenAIApiKey or OPENAI_API_KEY.")
+        return {"Authorization": f"Bearer {api_key}"}
+    api_key = setting_or_env(settings, "AnthropicApiKey", "ANTHROPIC_API_KEY")
+    if not api_key:
+        raise RuntimeError("Missing AnthropicApiKey or ANTHROPIC_API_KEY.")
+    return {"x-api-key": api_key, "anthropic-version": "2023-06-01"}
+
+
+def batch_request_line(provider: str, custom_id: str, url_path: str, body: dict[str, Any]) -> str:
+    if provider == "openai":
+        return json.dumps({"custom_id": custom_id, "method": "POST", "url": url_path, "body": body}, ensure_ascii=False)
+    return json.dumps({"custom_id": custom_id, "params": body}, ensure_ascii=False)
+
+
+def submit_batch(provider: str, url_path: str, requests_path: Path, headers: dict[str, str], args: argparse.Namespace) -> str:
+    data = requests_path.read_bytes()
+    if provider == "openai":
+        body, boundary = encode_multipart({"purpose": "batch"}, {"file": (requests_path.name, "application/jsonl", data)})
+        upload_headers = headers | {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        upload = json.loads(http_request("POST", f"{args.openai_base_url}/v1/files", upload_headers, body, args).decode("utf-8"))
+        payload = {"input_file_id": upload["id"], "endpoint": url_path, "completion_window": "24h"}
+        return post_json(f"{args.openai_base_url}/v1/batches", headers, payload, args)["id"]
+    requests = [json.loads(line) for line in data.decode("utf-8").splitlines()]
+    return post_json(f"{args.anthropic_base_url}/v1/messages/batches", headers, {"requests": requests}, args)["id"]
+
+
+def batch_status(provider: str, batch_id: str, headers: dict[str, str], args: argparse.Namespace) -> tuple[dict[str, Any], str, bool]:
+    """Return (batch, status, ended) for a submitted batch."""
+    if provider == "openai":
+        batch = get_json(f"{args.openai_base_url}/v1/batches/{batch_id}", headers, args)
+        return batch, batch.get("status", ""), batch.get("status") in OpenAIBatchEndStates
+    batch = get_json(f"{args.anthropic_base_url}/v1/messages/batches/{batch_id}", headers, args)
+    return batch, batch.get("processing_status", ""), batch.get("processing_status") == "ended"
+
+
+def batch_results(provider: str, batch: dict[str, Any], headers: dict[str, str], args: argparse.Namespace) -> Iterator[tuple[str, dict[str, Any] | None, str]]:
+    """Yield (custom_id, response body, error) for each result line of an ended batch."""
+    if provider == "openai":
+        for file_key in ("output_file_id", "error_file_id"):
+            if not batch.get(file_key):
+                continue
+            content = http_request("GET", f"{args.openai_base_url}/v1/files/{batch[file_key]}/content", headers, None, args)
+            for line in content.decode("utf-8").splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response") or {}
+                if item.get("error") or response.get("status_code") != 200:
+                    yield item["custom_id"], None, json.dumps(item.get("error") or response, ensure_ascii=False)
+                else:
+                    yield item["custom_id"], response["body"], ""
+        return
+    content = http_request("GET", batch["results_url"], headers, None, args)
+    for line in content.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        result = item["result"]
+        if result.get("type") == "succeeded":
+            yield item["custom_id"], result["message"], ""
+        else:
+            yield item["custom_id"], None, json.dumps(result, ensure_ascii=False)
+
+
+def run_batches(
+    provider: str,
+    url_path: str,
+    bodies: dict[str, dict[str, Any]],
+    settings: dict[str, Any],
+    args: argparse.Namespace,
+    batch_dir: Path,
+    name: str,
+    on_batch: Callable[[dict[str, dict[str, Any] | str]], None] | None = None,
+) -> dict[str, dict[str, Any] | str]:
+    """
+    Send bodies (custom_id -> request body) through the provider's batch API.
+
+    Requests are written to JSONL files of at most BatchMaxBytes and
+    BatchMaxRequests each, named by a digest of their content. A submitted
+    batch's id is kept next to its file until its results are read, so a rerun
+    with the same requests polls that batch instead of submitting it again.
+    Returns custom_id -> response body, or error text for a request that
+    failed or never ran. on_batch, when given, receives each batch's part of
+    that mapping as soon as the batch ends.
+    """
+    if not bodies:
+        return {}
+    headers = batch_headers(provider, settings)
+    batch_dir.mkdir(parents=True, exist_ok=True)
+    chunks: list[list[tuple[str, str]]] = [[]]
+    size = 0
+    for custom_id, body in bodies.items():
+        line = batch_request_line(provider, custom_id, url_path, body)
+        line_bytes = len(line.encode("utf-8")) + 1
+        if chunks[-1] and (size + line_bytes > BatchMaxBytes or len(chunks[-1]) >= BatchMaxRequests):
+            chunks.append([])
+            size = 0
+        chunks[-1].append((custom_id, line))
+        size += line_bytes
+
+    jobs: dict[str, tuple[Path, list[str]]] = {}
+    for chunk in chunks:
+        content = "".join(line + "\n" for _, line in chunk).encode("utf-8")
+        stem = f"{name}-{hashlib.sha256(content).hexdigest()[:16]}"
+        requests_path = batch_dir / f"{stem}.jsonl"
+        state_path = batch_dir / f"{stem}.batch.json"
+        if state_path.exists():
+            batch_id = json.loads(state_path.read_text(encoding="utf-8"))["id"]
+            print(f"[batch] resume {provider} {batch_id}: {requests_path.name}", flush=True)
+        else:
+            requests_path.write_bytes(content)
+            batch_id = submit_batch(provider, url_path, requests_path, headers, args)
+            state_path.write_text(json.dumps({"provider": provider, "id": batch_id}) + "\n", encoding="utf-8")
+            print(f"[batch] submitted {provider} {batch_id}: {len(chunk)} requests in {requests_path.name}", flush=True)
+        jobs[batch_id] = (state_path, [custom_id for custom_id, _ in chunk])
+
+    results: dict[str, dict[str, Any] | str] = {}
+    while jobs:
+        for batch_id, (state_path, custom_ids) in list(jobs.items()):
+            batch, status, ended = batch_status(provider, batch_id, headers, args)
+            if not ended:
+                print(f"[batch] {provider} {batch_id}: {status} {json.dumps(batch.get('request_counts') or {})}", flush=True)
+                continue
+            for custom_id, body, error in batch_results(provider, batch, headers, args):
+                results[custom_id] = body if body is not None else error
+            for custom_id in custom_ids:
+                results.setdefault(custom_id, f"{provider} batch {batch_id} ended {status} without a result")
+            if on_batch is not None:
+                on_batch({custom_id: results[custom_id] for custom_id in custom_ids})
+            state_path.unlink()
+            del jobs[batch_id]
+            print(f"[batch] {provider} {batch_id}: {status}", flush=True)
+        if jobs:
+            time.sleep(args.batch_poll)
+    return results
+
+
+def batch_custom_id(kind: str, *parts: str) -> str:
+    """
+    A custom_id derived from what the request asks, not its position, so a
+    rerun with fewer requests left rebuilds the same batch files and resumes
+    their batches. Fits Anthropic's 64-character [A-Za-z0-9_-] limit.
+    """
+    return f"{kind}-{hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()[:32]}"
+
+
+def batch_scores(items: list[tuple[Case, str]], settings: dict[str, Any], args: argparse.Namespace, batch_dir: Path) -> list[dict[str, Any] | str]:
+    """LLM scores for (case, text) items through one OpenAI batch; error text where scoring failed."""
+    cache = response_cache(args)
+    scores: list[dict[str, Any] | str] = [""] * len(items)
+    bodies: dict[str, dict[str, Any]] = {}
+    indexes: dict[str, list[int]] = {}
+    keys: dict[int, str] = {}
+    for index, (case, text) in enumerate(items):
+        prompt = build_score_prompt(case, text)
+        if cache is not None:
+            keys[index] = score_cache_key(prompt, text, args)
+            cached = cache.get(keys[index])
+            if cached is not None:
+                scores[index] = json.loads(cached)
+                continue
+        custom_id = batch_custom_id("score", prompt)
+        bodies[custom_id] = score_payload(prompt, args)
+        indexes.setdefault(custom_id, []).append(index)
+    for custom_id, result in run_batches("openai", "/v1/chat/completions", bodies, settings, args, batch_dir, "score").items():
+        for index in indexes[custom_id]:
+            scores[index] = score_result(result, keys.get(index), args)
+    return scores
+
+
+def score_result(result: dict[str, Any] | str, cache_key: str | None, args: argparse.Namespace) -> dict[str, Any] | str:
+    """Parse one score batch result, caching it under cache_key; error text on failure."""
+    if isinstance(result, str):
+        return result
+    try:
+        score = parse_llm_score(result)
+    except Exception as ex:
+        return str(ex)
+    cache = response_cache(args)
+    if cache is not None and cache_key is not None:
+        cache.put(cache_key, "score", "openai", args.score_judge_model, json.dumps(score, ensure_ascii=False))
+    return score
+
+
+def batch_describe(
+    tasks: dict[int, tuple[Case, str, Path]],
+    settings: dict[str, Any],
+    args: argparse.Namespace,
+    batch_dir: Path,
+    emit: Callable[[dict[str, Any]], None],
+) -> None:
+    """
+    Describe openai and claude tasks through their batch APIs or the cache.
+
+    Each unscored record goes to emit as soon as it exists: cached ones
+    right away, the others when their batch ends.
+    """
+    cache = response_cache(args)
+    started = time.perf_counter()
+    records: dict[int, dict[str, Any]] = {}
+    bodies: dict[str, dict[str, dict[str, Any]]] = {endpoint: {} for endpoint in BatchEndpoints}
+    keys: dict[int, str] = {}
+    indexes: dict[str, int] = {}
+    for index, (case, endpoint, image_path) in tasks.items():
+        records[index] = {"case": asdict(case), "endpoint": endpoint, "text": "", "score": {}, "error": "", "describe_seconds": 0.0, "describe_cached": False}
+        if cache is not None:
+            keys[index] = describe_cache_key(endpoint, image_path, args)
+            text = cache.get(keys[index])
+            if text is not None:
+                records[index].update(text=text, describe_cached=True)
+                emit(records[index])
+                continue
+        payload = openai_describe_payload(image_path, args) if endpoint == "openai" else claude_describe_payload(image_path, args)
+        custom_id = batch_custom_id("describe", case.case_id, endpoint)
+        bodies[endpoint][custom_id] = payload
+        indexes[custom_id] = index
+
+    def run(endpoint: str) -> None:
+        provider, url_path = BatchEndpoints[endpoint]
+
+        def ended(results: dict[str, dict[str, Any] | str]) -> None:
+            for custom_id, result in results.items():
+                index = indexes[custom_id]
+                record = records[index]
+                # A batch answers all at once, so its latency is the turnaround.
+                record["describe_seconds"] = round(time.perf_counter() - started, 3)
+                if isinstance(result, str):
+                    record["error"] = result
+                else:
+                    record["text"] = extract_text_from_response(result) if endpoint == "openai" else claude_text(result)
+                    if cache is not None:
+                        cache.put(keys[index], "describe", endpoint, getattr(args, DescribeModelArgs[endpoint]), record["text"])
+                emit(record)
+
+        run_batches(provider, url_path, bodies[endpoint], settings, args, batch_dir, f"describe-{endpoint}", ended)
+
+    with ThreadPoolExecutor(max_workers=len(BatchEndpoints)) as executor:
+        for future in [executor.submit(run, endpoint) for endpoint in BatchEndpoints]:
+            future.result()
+
 
 def has_any(text: str, terms: list[str]) -> bool:
     lower = text.lower()
@@ -498,34 +1114,244 @@ def score_description(case: Case, text: str, settings: dict[str, Any] | None = N
     return score_description_rules(case, text)
 
 
+def describe_one(case: Case, endpoint: str, image_path: Path, settings: dict[str, Any], args: argparse.Namespace, with_score: bool = True) -> dict[str, Any]:
+    started = time.perf_counter()
+    cached = False
+    try:
+        text, cached = describe_cached(endpoint, image_path, settings, args)
+        latency = time.perf_counter() - started
+        score = score_description(case, text, settings, args) if with_score else {}
+        record = {"case": asdict(case), "endpoint": endpoint, "text": text, "score": score, "error": ""}
+    except Exception as ex:
+        latency = time.perf_counter() - started
+        record = {"case": asdict(case), "endpoint": endpoint, "text": "", "score": {}, "error": str(ex)}
+    record["describe_seconds"] = round(latency, 3)
+    record["describe_cached"] = cached
+    # The endpoint's slot stays held through the delay, so --sleep spaces out
+    # calls to each endpoint. Cached descriptions made no call.
+    if not cached:
+        time.sleep(args.sleep)
+    return record
+
+
+def percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def print_latency_summary(records: list[dict[str, Any]], endpoints: list[str]) -> None:
+    for endpoint in endpoints:
+        latencies = [r["describe_seconds"] for r in records if r["endpoint"] == endpoint and not r["error"] and not r["describe_cached"]]
+        errors = sum(1 for r in records if r["endpoint"] == endpoint and r["error"])
+        cached = sum(1 for r in records if r["endpoint"] == endpoint and r["describe_cached"])
+        if not latencies:
+            print(f"[latency] {endpoint}: no successful calls, {errors} errors, {cached} cached")
+            continue
+        print(
+            f"[latency] {endpoint}: n={len(latencies)} errors={errors} cached={cached} "
+            + " ".join(f"p{p}={percentile(latencies, p):.2f}s" for p in (50, 90, 99))
+            + f" max={max(latencies):.2f}s"
+        )
+
+
+def describe_in_order(tasks: list[tuple[Case, str, Path]], settings: dict[str, Any], args: argparse.Namespace, with_score: bool = True) -> Iterator[dict[str, Any]]:
+    """
+    Yield describe_one records in task order.
+
+    Calls run concurrently, at most --endpoint-concurrency per endpoint and
+    --concurrency overall. Each record is yielded as soon as every record
+    before it has arrived.
+    """
+    pending = list(range(len(tasks)))
+    in_flight: dict[Future[dict[str, Any]], int] = {}
+    busy: Counter[str] = Counter()
+    arrived: dict[int, dict[str, Any]] = {}
+    next_index = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        while pending or in_flight:
+            for index in list(pending):
+                if len(in_flight) >= args.concurrency:
+                    break
+                case, endpoint, image_path = tasks[index]
+                if busy[endpoint] >= args.endpoint_concurrency:
+                    continue
+                print(f"[describe {index + 1}/{len(tasks)}] {endpoint}: {case.case_id}", flush=True)
+                in_flight[executor.submit(describe_one, case, endpoint, image_path, settings, args, with_score)] = index
+                busy[endpoint] += 1
+                pending.remove(index)
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = in_flight.pop(future)
+                busy[tasks[index][1]] -= 1
+                arrived[index] = future.result()
+            while next_index in arrived:
+                yield arrived.pop(next_index)
+                next_index += 1
+
+
+def with_score(record: dict[str, Any], score: dict[str, Any] | str) -> dict[str, Any]:
+    """A copy of an unscored record with its score, or with the error text scoring gave."""
+    scored = {key: value for key, value in record.items() if key != "score_pending"}
+    if isinstance(score, str):
+        scored["error"] = f"score failed: {score}"
+    else:
+        scored["score"] = score
+    return scored
+
+
+def describe_batched(
+    tasks: list[tuple[Case, str, Path]],
+    unscored: list[dict[str, Any]],
+    settings: dict[str, Any],
+    args: argparse.Namespace,
+    run_dir: Path,
+    emit: Callable[[dict[str, Any]], None],
+) -> None:
+    """
+    --batch: describe openai and claude tasks through the batch APIs while the
+    other endpoints are called directly. Every record goes to emit as soon as
+    it exists: direct ones as they arrive, batched ones when their batch ends.
+
+    Rules scores are computed on the spot. LLM scores go through one more
+    batch once every description is in, so until then records are emitted
+    with score_pending set; each is emitted again once scored. unscored holds
+    such records left by an earlier run, which are scored without being
+    described again. emit may be called from several threads.
+    """
+    batch_dir = run_dir / "batches"
+    batched = {index: task for index, task in enumerate(tasks) if task[1] in BatchEndpoints}
+    direct = [task for index, task in enumerate(tasks) if index not in batched]
+    pending = list(unscored)
+    lock = threading.Lock()
+
+    def described(record: dict[str, Any]) -> None:
+        if not record["error"]:
+            if args.score_mode == "llm":
+                record["score_pending"] = True
+                with lock:
+                    pending.append(record)
+            else:
+                record["score"] = score_description_rules(Case(**record["case"]), record["text"])
+        emit(record)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(batch_describe, batched, settings, args, batch_dir, described)
+        for record in describe_in_order(direct, settings, args, with_score=False):
+            described(record)
+        future.result()
+
+    items = [(Case(**record["case"]), record["text"]) for record in pending]
+    for record, score in zip(pending, batch_scores(items, settings, args, batch_dir)):
+        emit(with_score(record, score))
+
+
+def prompt_sha256(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def result_key(record: dict[str, Any]) -> tuple[str, str, str]:
+    return record["case"]["case_id"], record["endpoint"], record["describe_prompt_sha256"]
+
+
+def load_results(path: Path) -> dict[tuple[str, str, str], dict[str, Any]]:
+    """
+    Latest record per result_key from an append-only results file, in the
+    order each key first appeared. A last line cut off mid-write is removed
+    from the file so the next append starts on a fresh line. Records written
+    before results were keyed by describe prompt have no
+    describe_prompt_sha256; they raise instead of being silently skipped.
+    """
+    if not path.exists():
+        return {}
+    data = path.read_bytes()
+    if data and not data.endswith(b"\n"):
+        complete = data[: data.rfind(b"\n") + 1]
+        print(f"[describe] dropping an incomplete last line from {path}", flush=True)
+        with path.open("r+b") as f:
+            f.truncate(len(complete))
+        data = complete
+    latest: dict[tuple[str, str, str], dict[str, Any]] = {}
+    for number, line in enumerate(data.decode("utf-8").splitlines(), 1):
+        if line.strip():
+            record = json.loads(line)
+            if "describe_prompt_sha256" not in record:
+                raise ValueError(
+                    f"{path} line {number} has no describe_prompt_sha256; it was written before results were keyed "
+                    "by describe prompt. Re-key the file by adding \"describe_prompt_sha256\": the sha256 of the "
+                    "describe prompt it used to every line, or delete it (evaluate_generated_sample.py "
+                    "--overwrite-results) to start over."
+                )
+            latest[result_key(record)] = record
+    return latest
+
+
 def describe_images(cases: list[Case], settings: dict[str, Any], args: argparse.Namespace, images_dir: Path, run_dir: Path) -> None:
     endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
     unknown = sorted(set(endpoints) - set(DESCRIBERS))
     if unknown:
         raise ValueError(f"Unknown endpoints: {', '.join(unknown)}")
+    if args.concurrency < 1 or args.endpoint_concurrency < 1:
+        raise ValueError("--concurrency and --endpoint-concurrency must be positive.")
     selected = cases[: args.limit] if args.limit else cases
     results_path = run_dir / "describe_results.jsonl"
     summary_path = run_dir / "describe_summary.csv"
-    rows: list[dict[str, Any]] = []
+
+    # describe_results.jsonl is append-only. A (case, endpoint, describe
+    # prompt) key whose latest record has no error is done and skipped; keys
+    # that failed or never ran are described again. The summary always holds
+    # the latest record of every key for the current prompt.
+    prompt_hash = prompt_sha256(args.describe_prompt)
+    latest = load_results(results_path)
+    # A --batch run with LLM scoring first records descriptions with
+    # score_pending set; those are scored, not described, on a rerun.
+    tasks: list[tuple[Case, str, Path]] = []
+    unscored: list[dict[str, Any]] = []
+    done = 0
+    for case in selected:
+        image_path = images_dir / f"{case.case_id}.png"
+        if not image_path.exists():
+            print(f"[describe] missing image for {case.case_id}; expected {image_path}")
+            continue
+        for endpoint in endpoints:
+            previous = latest.get((case.case_id, endpoint, prompt_hash))
+            if previous is not None and previous.get("score_pending"):
+                unscored.append(previous)
+            elif previous is not None and not previous["error"]:
+                done += 1
+            else:
+                tasks.append((case, endpoint, image_path))
+    print(f"[describe] {done} already done, {len(unscored)} to score, {len(tasks)} to run", flush=True)
+
+    def summary_rows() -> list[dict[str, Any]]:
+        return [flatten_result(record) for record in latest.values() if record.get("describe_prompt_sha256") == prompt_hash]
+
+    written: dict[tuple[str, str, str], dict[str, Any]] = {}
+    lock = threading.Lock()
     with results_path.open("a", encoding="utf-8") as results:
-        for case in selected:
-            image_path = images_dir / f"{case.case_id}.png"
-            if not image_path.exists():
-                print(f"[describe] missing image for {case.case_id}; expected {image_path}")
-                continue
-            for endpoint in endpoints:
-                print(f"[describe] {endpoint}: {case.case_id}", flush=True)
-                try:
-                    text = DESCRIBERS[endpoint](image_path, settings, args)
-                    score = score_description(case, text, settings, args)
-                    record = {"case": asdict(case), "endpoint": endpoint, "text": text, "score": score, "error": ""}
-                except Exception as ex:
-                    record = {"case": asdict(case), "endpoint": endpoint, "text": "", "score": {}, "error": str(ex)}
+
+        def append(record: dict[str, Any]) -> None:
+            record["describe_prompt_sha256"] = prompt_hash
+            with lock:
                 results.write(json.dumps(record, ensure_ascii=False) + "\n")
                 results.flush()
-                rows.append(flatten_result(record))
-                time.sleep(args.sleep)
-    write_summary(summary_path, rows)
+                latest[result_key(record)] = written[result_key(record)] = record
+                write_summary(summary_path, summary_rows())
+
+        if args.batch:
+            describe_batched(tasks, unscored, settings, args, run_dir, append)
+        else:
+            for record in unscored:
+                try:
+                    score: dict[str, Any] | str = score_description(Case(**record["case"]), record["text"], settings, args)
+                except Exception as ex:
+                    score = str(ex)
+                append(with_score(record, score))
+            for record in describe_in_order(tasks, settings, args):
+                append(record)
+    write_summary(summary_path, summary_rows())
+    print_latency_summary(list(written.values()), endpoints)
+    print_cache_summary(args)
 
 
 def flatten_result(record: dict[str, Any]) -> dict[str, Any]:
@@ -591,10 +1417,12 @@ def write_summary(path: Path, rows: list[dict[str, Any]]) -> None:
         "style_body_reason",
         "error",
     ]
-    with path.open("w", encoding="utf-8", newline="") as f:
+    partial = path.with_suffix(".csv.partial")
+    with partial.open("w", encoding="utf-8", newline="") as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
         writer.writerows(rows)
+    os.replace(partial, path)
 
 
 def parse_args(argv: list[str]) -> argparse.Namespace:
@@ -608,8 +1436,21 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
     parser.add_argument("--endpoints", default="openai,grok,gemini,claude,ideogram", help="Comma-separated describers.")
     parser.add_argument("--describe-prompt", default=DEFAULT_DESCRIBE_PROMPT, help="Generic prompt sent to describers.")
     parser.add_argument("--overwrite", action="store_true", help="Overwrite existing generated images.")
-    parser.add_argument("--sleep", type=float, default=0.5, help="Delay between paid API calls.")
+    parser.add_argument("--sleep", type=float, default=0.5, help="Delay between paid API calls to the same endpoint.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Describe calls in flight across all endpoints.")
+    parser.add_argument("--endpoint-concurrency", type=int, default=2, help="Describe calls in flight per endpoint.")
     parser.add_argument("--timeout", type=int, default=240, help="HTTP timeout in seconds.")
+    parser.add_argument("--retries", type=int, default=2, help="Retries for dropped connections, timeouts, 429, and 5xx.")
+    parser.add_argument("--retry-backoff", type=float, default=2.0, help="First retry delay in seconds; doubles per retry.")
+    parser.add_argument("--retry-timeouts", action="store_true", help="Also retry POSTs that timed out; the provider may already have billed them.")
+    parser.add_argument("--http2", action="store_true", help='Use HTTP/2 through httpx (pip install "httpx[http2]").')
+    parser.add_argument("--response-cache", default="saves/describe-eval/response-cache.sqlite", help="SQLite cache of describe and LLM score responses; blank to disable.")
+    parser.add_argument("--refresh-cache", action="store_true", help="Ignore cached responses, call the providers again, and replace the entries.")
+    parser.add_argument("--cache-max-mb", type=float, default=256, help="Evict least recently used responses past this size.")
+    parser.add_argument("--batch", action="store_true", help="Send openai and claude describe calls and LLM score calls through the providers' batch APIs.")
+    parser.add_argument("--batch-poll", type=float, default=30, help="Seconds between batch status checks.")
+    parser.add_argument("--openai-base-url", default="https://api.openai.com", help="OpenAI API base URL.")
+    parser.add_argument("--anthropic-base-url", default="https://api.anthropic.com", help="Anthropic API base URL.")
     parser.add_argument("--max-tokens", type=int, default=1200, help="Max output tokens for describers.")
     parser.add_argument("--score-mode", choices=["llm", "rules"], default="llm", help="Use an LLM text judge or the old keyword rules scorer.")
     parser.add_argument("--score-judge-model", default="gpt-4.1-mini", help="Cheap text model used to score describer responses.")
@@ -644,10 +1485,12 @@ def main(argv: list[str]) -> int:
     if not args.generate and not args.describe:
         print("No paid API calls made. Add --generate and/or --describe to run the harness.")
         return 0
-    if args.generate:
-        generate_images(cases, settings, args, images_dir)
+    failures = generate_images(cases, settings, args, images_dir, run_dir) if args.generate else 0
     if args.describe:
         describe_images(cases, settings, args, images_dir, run_dir)
+    if failures:
+        print(f"{failures} images failed to generate; rerun to retry them.")
+        return 1
     print("done")
     return 0
 
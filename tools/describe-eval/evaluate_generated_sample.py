@@ -174,6 +174,12 @@ def read_jsonl(path: Path) -> list[dict[str, Any]]:
         return [json.loads(line) for line in f if line.strip()]
 
 
+def current_results(path: Path, describe_prompt: str) -> list[dict[str, Any]]:
+    """Latest describe result per case and endpoint for this describe prompt."""
+    prompt_hash = describe_eval.prompt_sha256(describe_prompt)
+    return [record for record in describe_eval.load_results(path).values() if record.get("describe_prompt_sha256") == prompt_hash]
+
+
 def make_describe_args(args: argparse.Namespace) -> SimpleNamespace:
     defaults = describe_eval.parse_args([])
     for key, value in vars(args).items():
@@ -326,7 +332,7 @@ def draw_endpoint_aggregate_table(
 
 
 def render_by_image(run_dir: Path, describe_prompt: str) -> None:
-    records = read_jsonl(run_dir / "describe_results.jsonl")
+    records = current_results(run_dir / "describe_results.jsonl", describe_prompt)
     sources = {row["case_id"]: row for row in read_jsonl(run_dir / "source_images.jsonl")}
     by_case: dict[str, list[dict[str, Any]]] = {}
     for record in records:
@@ -406,7 +412,7 @@ def render_by_image(run_dir: Path, describe_prompt: str) -> None:
 
 
 def render_by_endpoint(run_dir: Path, describe_prompt: str) -> None:
-    records = read_jsonl(run_dir / "describe_results.jsonl")
+    records = current_results(run_dir / "describe_results.jsonl", describe_prompt)
     sources = {row["case_id"]: row for row in read_jsonl(run_dir / "source_images.jsonl")}
     by_endpoint: dict[str, list[dict[str, Any]]] = {}
     for record in records:
@@ -470,13 +476,17 @@ def render_reports(run_dir: Path, describe_prompt: str) -> None:
 
 
 def rescore_results(source_results: Path, settings: dict[str, Any], args: argparse.Namespace, run_dir: Path) -> None:
-    source_records = read_jsonl(source_results)
+    source_records = current_results(source_results, args.describe_prompt)
     if not source_records:
-        raise FileNotFoundError(f"No describe results to rescore: {source_results}")
+        raise FileNotFoundError(f"No describe results for the current describe prompt to rescore: {source_results}")
 
     results_path = run_dir / "describe_results.jsonl"
     summary_path = run_dir / "describe_summary.csv"
     rows: list[dict[str, Any]] = []
+    batched = None
+    if args.batch and args.score_mode == "llm":
+        items = [(describe_eval.Case(**record["case"]), record.get("text", "")) for record in source_records if not record.get("error")]
+        batched = iter(describe_eval.batch_scores(items, settings, args, run_dir / "batches"))
     with results_path.open("w", encoding="utf-8") as results:
         for index, record in enumerate(source_records, 1):
             endpoint = record.get("endpoint", "")
@@ -486,14 +496,15 @@ def rescore_results(source_results: Path, settings: dict[str, Any], args: argpar
                 rescored = {**record, "score": {}}
             else:
                 try:
-                    score = describe_eval.score_description(case, record.get("text", ""), settings, args)
-                    rescored = {**record, "score": score, "error": ""}
+                    score = next(batched) if batched is not None else describe_eval.score_description(case, record.get("text", ""), settings, args)
                 except Exception as ex:
-                    rescored = {**record, "score": {}, "error": f"score failed: {ex}"}
+                    score = str(ex)
+                rescored = describe_eval.with_score({**record, "score": {}, "error": ""}, score)
             results.write(json.dumps(rescored, ensure_ascii=False) + "\n")
             results.flush()
             rows.append(describe_eval.flatten_result(rescored))
     describe_eval.write_summary(summary_path, rows)
+    describe_eval.print_cache_summary(args)
 
 
 def parse_args(argv: list[str]) -> argparse.Namespace:
@@ -509,7 +520,18 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
     parser.add_argument("--report", action="store_true", help="Render report PNGs from describe_results.jsonl.")
     parser.add_argument("--overwrite-results", action="store_true", help="Delete previous describe outputs before running.")
     parser.add_argument("--sleep", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--endpoint-concurrency", type=int, default=2)
     parser.add_argument("--timeout", type=int, default=240)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--retry-backoff", type=float, default=2.0)
+    parser.add_argument("--retry-timeouts", action="store_true", help="Also retry POSTs that timed out.")
+    parser.add_argument("--http2", action="store_true", help='Use HTTP/2 through httpx (pip install "httpx[http2]").')
+    parser.add_argument("--response-cache", default="saves/describe-eval/response-cache.sqlite", help="SQLite cache of describe and LLM score responses; blank to disable.")
+    parser.add_argument("--refresh-cache", action="store_true", help="Ignore cached responses and replace them.")
+    parser.add_argument("--cache-max-mb", type=float, default=256)
+    parser.add_argument("--batch", action="store_true", help="Send openai and claude describe calls and LLM score calls through batch APIs.")
+    parser.add_argument("--batch-poll", type=float, default=30)
     parser.add_argument("--max-tokens", type=int, default=1200)
     parser.add_argument("--score-mode", choices=["llm", "rules"], default="llm")
     parser.add_argument("--score-judge-model", default="gpt-4.1-mini")
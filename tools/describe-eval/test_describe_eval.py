@@ -0,0 +1,617 @@
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import asdict
+import email
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import random
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import describe_eval
+import evaluate_generated_sample
+
+
+class ConcurrencyProbe:
+    """Fake describer that records how many calls overlap."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.active: dict[str, int] = {}
+        self.peak: dict[str, int] = {}
+        self.peak_total = 0
+
+    def describer(self, endpoint: str):
+        def describe(image_path: Path, settings: dict, args) -> str:
+            with self.lock:
+                self.active[endpoint] = self.active.get(endpoint, 0) + 1
+                self.peak[endpoint] = max(self.peak.get(endpoint, 0), self.active[endpoint])
+                self.peak_total = max(self.peak_total, sum(self.active.values()))
+            time.sleep(random.uniform(0.001, 0.02))
+            with self.lock:
+                self.active[endpoint] -= 1
+            if endpoint == "grok" and "japanese" in image_path.name:
+                raise RuntimeError("HTTP 500 from stub")
+            return f"two people wearing shirts, {image_path.stem}"
+
+        return describe
+
+
+class DescribeFanOutTests(unittest.TestCase):
+    def test_results_keep_case_endpoint_order_within_limits(self) -> None:
+        probe = ConcurrencyProbe()
+        endpoints = ["openai", "grok", "gemini"]
+        cases = describe_eval.build_cases()[4:10]
+        args = describe_eval.parse_args([
+            "--endpoints", ",".join(endpoints),
+            "--score-mode", "rules",
+            "--sleep", "0",
+            "--concurrency", "4",
+            "--endpoint-concurrency", "2",
+            "--response-cache", "",
+        ])
+        with tempfile.TemporaryDirectory() as directory:
+            run_dir = Path(directory)
+            images_dir = run_dir / "images"
+            images_dir.mkdir()
+            for case in cases:
+                (images_dir / f"{case.case_id}.png").write_bytes(b"png")
+            fakes = {endpoint: probe.describer(endpoint) for endpoint in endpoints}
+            with mock.patch.dict(describe_eval.DESCRIBERS, fakes):
+                describe_eval.describe_images(cases, {}, args, images_dir, run_dir)
+
+            records = [json.loads(line) for line in (run_dir / "describe_results.jsonl").read_text(encoding="utf-8").splitlines()]
+            summary = (run_dir / "describe_summary.csv").read_text(encoding="utf-8").splitlines()
+
+        self.assertEqual(
+            [(case.case_id, endpoint) for case in cases for endpoint in endpoints],
+            [(record["case"]["case_id"], record["endpoint"]) for record in records],
+        )
+        self.assertEqual(len(records) + 1, len(summary))
+        self.assertEqual(
+            [(case.case_id, "grok") for case in cases if case.ethnicity_key == "japanese"],
+            [(record["case"]["case_id"], record["endpoint"]) for record in records if record["error"]],
+        )
+        self.assertTrue(all(record["describe_seconds"] >= 0 for record in records))
+        self.assertLessEqual(max(probe.peak.values()), 2)
+        self.assertLessEqual(probe.peak_total, 4)
+        self.assertEqual(2.0, describe_eval.percentile([1.0, 2.0, 3.0, 4.0], 50))
+        self.assertEqual(4.0, describe_eval.percentile([1.0, 2.0, 3.0, 4.0], 99))
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def test_describe_reads_through_and_refreshes(self) -> None:
+        calls: list[tuple[str, str]] = []
+
+        def describer(endpoint: str):
+            def describe(image_path: Path, settings: dict, args) -> str:
+                calls.append((endpoint, image_path.name))
+                return f"two men, {image_path.stem}"
+
+            return describe
+
+        cases = describe_eval.build_cases()[:2]
+        with tempfile.TemporaryDirectory() as directory:
+            run_dir = Path(directory)
+            images_dir = run_dir / "images"
+            images_dir.mkdir()
+            for case in cases:
+                (images_dir / f"{case.case_id}.png").write_bytes(case.case_id.encode("utf-8"))
+            argv = ["--endpoints", "openai,claude", "--score-mode", "rules", "--sleep", "0", "--response-cache", str(run_dir / "cache.sqlite")]
+            fakes = {endpoint: describer(endpoint) for endpoint in ("openai", "claude")}
+            caches = []
+
+            def run(*extra: str) -> list[dict]:
+                args = describe_eval.parse_args(argv + list(extra))
+                (run_dir / "describe_results.jsonl").unlink(missing_ok=True)
+                with mock.patch.dict(describe_eval.DESCRIBERS, fakes):
+                    describe_eval.describe_images(cases, {}, args, images_dir, run_dir)
+                caches.append(describe_eval.response_cache(args))
+                return [json.loads(line) for line in (run_dir / "describe_results.jsonl").read_text(encoding="utf-8").splitlines()]
+
+            first = run()
+            self.assertEqual(4, len(calls))
+            second = run()
+            self.assertEqual(4, len(calls))
+            run("--claude-vision-model", "other-model")
+            self.assertEqual(6, len(calls))
+            refreshed = run("--refresh-cache")
+            self.assertEqual(10, len(calls))
+            for cache in caches:
+                cache.close()
+
+        self.assertEqual([False] * 4, [record["describe_cached"] for record in first])
+        self.assertEqual([True] * 4, [record["describe_cached"] for record in second])
+        self.assertEqual([record["text"] for record in first], [record["text"] for record in second])
+        self.assertEqual([False] * 4, [record["describe_cached"] for record in refreshed])
+
+    def test_llm_scores_are_cached_by_text_and_judge(self) -> None:
+        judged = {"categories": {category: {"score": 1, "extracted": "x", "reason": "y"} for category in describe_eval.ScoreCategories}}
+        reply = {"choices": [{"message": {"content": json.dumps(judged)}}]}
+        case = describe_eval.build_cases()[0]
+        with tempfile.TemporaryDirectory() as directory:
+            args = describe_eval.parse_args(["--response-cache", str(Path(directory) / "cache.sqlite")])
+            with mock.patch.object(describe_eval, "post_json", return_value=reply) as post:
+                first = describe_eval.score_description(case, "two men", {"OpenAIApiKey": "key"}, args)
+                second = describe_eval.score_description(case, "two men", {}, args)
+                describe_eval.score_description(case, "two women", {"OpenAIApiKey": "key"}, args)
+            describe_eval.response_cache(args).close()
+
+        self.assertEqual(2, post.call_count)
+        self.assertEqual(first, second)
+        self.assertEqual(6.0, first["score"])
+
+    def test_evicts_least_recently_used(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            cache = describe_eval.ResponseCache(Path(directory) / "cache.sqlite", max_bytes=25)
+            keys = [cache.key("describe", str(n), "openai", "model", "prompt", {}) for n in range(3)]
+            cache.put(keys[0], "describe", "openai", "model", "a" * 10)
+            cache.put(keys[1], "describe", "openai", "model", "b" * 10)
+            time.sleep(0.01)
+            self.assertEqual("a" * 10, cache.get(keys[0]))
+            cache.put(keys[2], "describe", "openai", "model", "c" * 10)
+            found = [cache.get(key) for key in keys]
+            cache.close()
+
+        self.assertEqual(["a" * 10, None, "c" * 10], found)
+
+
+class ResumeTests(unittest.TestCase):
+    def test_reruns_skip_done_keys_and_retry_failures(self) -> None:
+        calls: list[tuple[str, str]] = []
+
+        def describer(endpoint: str):
+            def describe(image_path: Path, settings: dict, args) -> str:
+                calls.append((endpoint, image_path.stem))
+                # Only the first grok call for the second case fails.
+                if calls.count(("grok", cases[1].case_id)) == 1 and (endpoint, image_path.stem) == ("grok", cases[1].case_id):
+                    raise RuntimeError("HTTP 503 from stub")
+                return f"two men, {endpoint}"
+
+            return describe
+
+        cases = describe_eval.build_cases()[:3]
+        fakes = {endpoint: describer(endpoint) for endpoint in ("openai", "grok")}
+        with tempfile.TemporaryDirectory() as directory:
+            run_dir = Path(directory)
+            images_dir = run_dir / "images"
+            images_dir.mkdir()
+            for case in cases:
+                (images_dir / f"{case.case_id}.png").write_bytes(b"png")
+            argv = ["--endpoints", "openai,grok", "--score-mode", "rules", "--sleep", "0", "--response-cache", ""]
+            results_path = run_dir / "describe_results.jsonl"
+            summary_path = run_dir / "describe_summary.csv"
+
+            def run(*extra: str) -> list[tuple[str, str]]:
+                before = len(calls)
+                with mock.patch.dict(describe_eval.DESCRIBERS, fakes):
+                    describe_eval.describe_images(cases, {}, describe_eval.parse_args(argv + list(extra)), images_dir, run_dir)
+                return calls[before:]
+
+            self.assertEqual(6, len(run()))
+            first_summary = summary_path.read_text(encoding="utf-8").splitlines()
+            # An interrupted write leaves a cut-off last line.
+            with results_path.open("a", encoding="utf-8") as results:
+                results.write('{"case": {"case_id"')
+            self.assertEqual([("grok", cases[1].case_id)], run())
+            self.assertEqual([], run())
+            summary = summary_path.read_text(encoding="utf-8").splitlines()
+            lines = results_path.read_text(encoding="utf-8").splitlines()
+            self.assertEqual(6, len(run("--describe-prompt", "Describe the people.")))
+            prompt_summary = summary_path.read_text(encoding="utf-8").splitlines()
+
+        self.assertEqual(7, len(first_summary))
+        self.assertIn("HTTP 503 from stub", first_summary[4])
+        self.assertEqual(7, len(summary))
+        self.assertEqual(first_summary[:4] + first_summary[5:], summary[:4] + summary[5:])
+        self.assertNotIn("HTTP 503", summary[4])
+        self.assertEqual(7, len(lines))
+        self.assertEqual(7, len(prompt_summary))
+
+    def test_rescore_reads_latest_records_for_the_current_prompt(self) -> None:
+        cases = describe_eval.build_cases()[:2]
+        args = describe_eval.parse_args(["--score-mode", "rules", "--response-cache", ""])
+        current = describe_eval.prompt_sha256(args.describe_prompt)
+        other = describe_eval.prompt_sha256("Describe the people.")
+
+        def record(case, prompt_hash: str, text: str, error: str = "") -> dict:
+            return {
+                "case": asdict(case),
+                "endpoint": "openai",
+                "text": text,
+                "error": error,
+                "describe_prompt_sha256": prompt_hash,
+            }
+
+        with tempfile.TemporaryDirectory() as directory:
+            run_dir = Path(directory)
+            source = run_dir / "source_results.jsonl"
+            lines = [
+                record(cases[0], current, "", "HTTP 503 from stub"),
+                record(cases[1], current, "two men, first"),
+                record(cases[0], other, "two men, other prompt"),
+                record(cases[0], current, "two men, retried"),
+            ]
+            source.write_text("".join(json.dumps(line) + "\n" for line in lines) + '{"case": {"case_id"', encoding="utf-8")
+            evaluate_generated_sample.rescore_results(source, {}, args, run_dir)
+            rescored = [json.loads(line) for line in (run_dir / "describe_results.jsonl").read_text(encoding="utf-8").splitlines()]
+
+        self.assertEqual(
+            [(cases[0].case_id, "two men, retried"), (cases[1].case_id, "two men, first")],
+            [(line["case"]["case_id"], line["text"]) for line in rescored],
+        )
+        self.assertTrue(all(line["score"] and not line["error"] for line in rescored))
+
+    def test_results_without_a_prompt_hash_fail_closed(self) -> None:
+        cases = describe_eval.build_cases()[:1]
+        baseline = {"case": asdict(cases[0]), "endpoint": "openai", "text": "two men", "score": {}, "error": ""}
+        calls: list[str] = []
+
+        def describe(image_path: Path, settings: dict, args) -> str:
+            calls.append(image_path.stem)
+            return "two men"
+
+        with tempfile.TemporaryDirectory() as directory:
+            run_dir = Path(directory)
+            images_dir = run_dir / "images"
+            images_dir.mkdir()
+            (images_dir / f"{cases[0].case_id}.png").write_bytes(b"png")
+            results_path = run_dir / "describe_results.jsonl"
+            results_path.write_text(json.dumps(baseline) + "\n", encoding="utf-8")
+            args = describe_eval.parse_args(["--endpoints", "openai", "--score-mode", "rules", "--sleep", "0", "--response-cache", ""])
+
+            with mock.patch.dict(describe_eval.DESCRIBERS, {"openai": describe}):
+                with self.assertRaisesRegex(ValueError, "describe_prompt_sha256") as raised:
+                    describe_eval.describe_images(cases, {}, args, images_dir, run_dir)
+            with self.assertRaisesRegex(ValueError, "overwrite-results"):
+                evaluate_generated_sample.current_results(results_path, args.describe_prompt)
+            with self.assertRaises(ValueError):
+                evaluate_generated_sample.rescore_results(results_path, {}, args, run_dir / "rescored")
+
+        self.assertIn(str(results_path), str(raised.exception))
+        self.assertEqual([], calls)
+
+    def test_generate_retries_only_missing_images(self) -> None:
+        attempts: list[str] = []
+
+        def generate(case, settings: dict, args) -> bytes:
+            attempts.append(case.case_id)
+            if case.case_id == cases[1].case_id and attempts.count(case.case_id) == 1:
+                raise RuntimeError("HTTP 500 from stub")
+            return b"png"
+
+        cases = describe_eval.build_cases()[:3]
+        with tempfile.TemporaryDirectory() as directory:
+            run_dir = Path(directory)
+            args = describe_eval.parse_args(["--sleep", "0"])
+            with mock.patch.dict(describe_eval.GENERATORS, {args.generator: generate}):
+                first = describe_eval.generate_images(cases, {}, args, run_dir / "images", run_dir)
+                second = describe_eval.generate_images(cases, {}, args, run_dir / "images", run_dir)
+            log = [json.loads(line) for line in (run_dir / "generate_results.jsonl").read_text(encoding="utf-8").splitlines()]
+            images = sorted(path.name for path in (run_dir / "images").iterdir())
+
+        self.assertEqual((1, 0), (first, second))
+        self.assertEqual([case.case_id for case in cases] + [cases[1].case_id], attempts)
+        self.assertEqual(["", "HTTP 500 from stub", "", ""], [record["error"] for record in log])
+        self.assertEqual(sorted(f"{case.case_id}.png" for case in cases), images)
+
+
+class StubProvider(BaseHTTPRequestHandler):
+    """
+    Keep-alive JSON endpoint; every reply is gzip. /flaky fails once with 503,
+    /slow answers after 1.5 s, and /closing closes the connection after its
+    reply without saying so.
+    """
+
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    requests: list[str] = []
+
+    def setup(self) -> None:
+        super().setup()
+        type(self).connections += 1
+
+    def do_POST(self) -> None:
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).requests.append(self.path)
+        if self.path == "/slow":
+            time.sleep(1.5)
+        if self.path == "/closing":
+            self.close_connection = True
+        if self.path == "/flaky" and type(self).requests.count("/flaky") == 1:
+            self.send_response(503)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = gzip.compress(json.dumps({"echo": payload, "encoding": self.headers["Accept-Encoding"]}).encode("utf-8"))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class HttpClientTests(unittest.TestCase):
+    def setUp(self) -> None:
+        StubProvider.connections = 0
+        StubProvider.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubProvider)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, client, path: str) -> tuple[int, bytes]:
+        return client.request("POST", f"{self.base}{path}", {"Content-Type": "application/json"}, b"{}")
+
+    def test_post_timeout_is_not_sent_again(self) -> None:
+        client = describe_eval.HttpClient(timeout=1, retries=2, retry_backoff=0)
+        try:
+            self.assertEqual(200, self.post(client, "/describe")[0])
+            with self.assertRaises(TimeoutError):
+                self.post(client, "/slow")
+            time.sleep(1)
+        finally:
+            client.close()
+
+        self.assertEqual(["/describe", "/slow"], StubProvider.requests)
+
+    def test_stale_pooled_connection_is_resent_within_retries(self) -> None:
+        client = describe_eval.HttpClient(timeout=5, retries=1, retry_backoff=0)
+        strict = describe_eval.HttpClient(timeout=5, retries=0, retry_backoff=0)
+        try:
+            self.post(client, "/closing")
+            self.post(strict, "/closing")
+            time.sleep(0.2)
+            self.assertEqual(200, self.post(client, "/describe")[0])
+            with self.assertRaises((OSError, describe_eval.http.client.HTTPException)):
+                self.post(strict, "/describe")
+        finally:
+            client.close()
+            strict.close()
+
+        self.assertEqual(["/closing", "/closing", "/describe"], StubProvider.requests)
+        self.assertEqual(2, client.connections_opened)
+
+    def test_reuses_connection_decodes_gzip_and_retries(self) -> None:
+        base = self.base
+        args = describe_eval.parse_args(["--retries", "1", "--retry-backoff", "0"])
+        client = describe_eval.http_client(args)
+        try:
+            responses = [describe_eval.post_json(f"{base}/describe", {}, {"n": n}, args) for n in range(3)]
+            flaky = describe_eval.post_json(f"{base}/flaky", {}, {"n": 3}, args)
+        finally:
+            client.close()
+
+        self.assertEqual([{"n": n} for n in range(3)], [response["echo"] for response in responses])
+        self.assertEqual("gzip", responses[0]["encoding"])
+        self.assertEqual({"n": 3}, flaky["echo"])
+        self.assertEqual(["/describe"] * 3 + ["/flaky"] * 2, StubProvider.requests)
+        self.assertEqual(1, StubProvider.connections)
+        self.assertEqual(1, client.connections_opened)
+        self.assertIs(client, describe_eval.http_client(args))
+
+    def test_http2_without_httpx_fails_closed(self) -> None:
+        with mock.patch.dict("sys.modules", {"httpx": None}):
+            with self.assertRaisesRegex(RuntimeError, "httpx"):
+                describe_eval.HttpClient(10, http2=True)
+
+
+class BatchProvider(BaseHTTPRequestHandler):
+    """
+    Stand-in for the OpenAI and Anthropic batch APIs. Each batch reports
+    in_progress once, then ends. The first Claude request in a batch errors.
+    """
+
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    files: dict[str, list[dict]] = {}
+    batches: dict[str, dict] = {}
+    posts: list[str] = []
+
+    def reply(self, payload, status: int = 200) -> None:
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        with self.lock:
+            type(self).posts.append(self.path)
+            if self.path == "/v1/files":
+                message = email.message_from_bytes(f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + data)
+                parts = {part.get_param("name", header="Content-Disposition"): part.get_payload(decode=True) for part in message.get_payload()}
+                assert parts["purpose"] == b"batch"
+                file_id = f"file-{len(self.files)}"
+                self.files[file_id] = [json.loads(line) for line in parts["file"].decode("utf-8").splitlines()]
+                return self.reply({"id": file_id})
+            if self.path == "/v1/batches":
+                request = json.loads(data)
+                batch_id = f"batch-{len(self.batches)}"
+                self.batches[batch_id] = {"id": batch_id, "status": "validating", "endpoint": request["endpoint"], "lines": self.files[request["input_file_id"]]}
+                return self.reply({"id": batch_id})
+            if self.path == "/v1/messages/batches":
+                batch_id = f"msgbatch-{len(self.batches)}"
+                self.batches[batch_id] = {"id": batch_id, "processing_status": "in_progress", "lines": json.loads(data)["requests"]}
+                return self.reply({"id": batch_id})
+        self.reply({"error": "unexpected call"}, 404)
+
+    def do_GET(self) -> None:
+        parts = self.path.strip("/").split("/")
+        with self.lock:
+            if parts[:2] == ["v1", "batches"]:
+                batch = self.batches[parts[2]]
+                batch["status"] = "in_progress" if batch["status"] == "validating" else "completed"
+                return self.reply({"id": batch["id"], "status": batch["status"], "output_file_id": f"out-{batch['id']}" if batch["status"] == "completed" else None})
+            if parts[:2] == ["v1", "files"]:
+                batch = self.batches[parts[2].removeprefix("out-")]
+                return self.reply("".join(json.dumps(self.openai_result(batch, line)) + "\n" for line in batch["lines"]).encode("utf-8"))
+            if parts[:3] == ["v1", "messages", "batches"] and len(parts) == 4:
+                batch = self.batches[parts[3]]
+                if batch["processing_status"] == "in_progress":
+                    batch["processing_status"] = "canceling"
+                    return self.reply({"id": batch["id"], "processing_status": "in_progress"})
+                results_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/messages/batches/{batch['id']}/results"
+                return self.reply({"id": batch["id"], "processing_status": "ended", "results_url": results_url})
+            if parts[:3] == ["v1", "messages", "batches"] and parts[4:] == ["results"]:
+                lines = self.batches[parts[3]]["lines"]
+                return self.reply("".join(json.dumps(self.claude_result(n, line)) + "\n" for n, line in enumerate(lines)).encode("utf-8"))
+        self.reply({"error": "unexpected call"}, 404)
+
+    @staticmethod
+    def openai_result(batch: dict, line: dict) -> dict:
+        if batch["endpoint"] == "/v1/responses":
+            body = {"output_text": f"two men in jackets, openai {line['custom_id']}"}
+        else:
+            judged = {"categories": {category: {"score": 1, "extracted": "x", "reason": "y"} for category in describe_eval.ScoreCategories}}
+            body = {"choices": [{"message": {"content": json.dumps(judged)}}]}
+        return {"id": f"r-{line['custom_id']}", "custom_id": line["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}
+
+    @staticmethod
+    def claude_result(n: int, line: dict) -> dict:
+        if n == 0:
+            return {"custom_id": line["custom_id"], "result": {"type": "errored", "error": {"type": "error", "error": {"type": "overloaded_error"}}}}
+        message = {"content": [{"type": "text", "text": f"two men in jackets, claude {line['custom_id']}"}]}
+        return {"custom_id": line["custom_id"], "result": {"type": "succeeded", "message": message}}
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class BatchModeTests(unittest.TestCase):
+    def setUp(self) -> None:
+        BatchProvider.files.clear()
+        BatchProvider.batches.clear()
+        BatchProvider.posts.clear()
+
+    def test_batches_describe_and_score_calls(self) -> None:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), BatchProvider)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        cases = describe_eval.build_cases()[:2]
+        settings = {"OpenAIApiKey": "key", "AnthropicApiKey": "key"}
+        grok_calls: list[str] = []
+
+        def describe_grok(image_path: Path, settings: dict, args) -> str:
+            grok_calls.append(image_path.stem)
+            return f"two men in jackets, grok {image_path.stem}"
+
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                run_dir = Path(directory)
+                images_dir = run_dir / "images"
+                images_dir.mkdir()
+                for case in cases:
+                    (images_dir / f"{case.case_id}.png").write_bytes(case.case_id.encode("utf-8"))
+                args = describe_eval.parse_args([
+                    "--endpoints", "openai,claude,grok",
+                    "--batch", "--batch-poll", "0", "--sleep", "0",
+                    "--openai-base-url", base, "--anthropic-base-url", base,
+                    "--response-cache", str(run_dir / "cache.sqlite"),
+                ])
+                with mock.patch.dict(describe_eval.DESCRIBERS, {"grok": describe_grok}):
+                    describe_eval.describe_images(cases, settings, args, images_dir, run_dir)
+                    first_posts = list(BatchProvider.posts)
+                    (run_dir / "describe_results.jsonl").unlink()
+                    describe_eval.describe_images(cases, settings, args, images_dir, run_dir)
+                describe_eval.response_cache(args).close()
+
+                records = list(describe_eval.load_results(run_dir / "describe_results.jsonl").values())
+                summary = (run_dir / "describe_summary.csv").read_text(encoding="utf-8").splitlines()
+                batch_files = sorted(path.name for path in (run_dir / "batches").iterdir())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        # Two OpenAI batches (describe, then score) and one Claude batch.
+        self.assertEqual({"/v1/files": 2, "/v1/batches": 2, "/v1/messages/batches": 1}, Counter(first_posts))
+        # The rerun only resends the Claude request that errored.
+        self.assertEqual(["/v1/messages/batches"], BatchProvider.posts[len(first_posts):])
+        self.assertEqual(len(cases), len(grok_calls))
+        self.assertEqual(
+            sorted((case.case_id, endpoint) for case in cases for endpoint in ("openai", "claude", "grok")),
+            sorted((record["case"]["case_id"], record["endpoint"]) for record in records),
+        )
+        self.assertFalse(any(record.get("score_pending") for record in records))
+        errors = [record for record in records if record["error"]]
+        self.assertEqual(1, len(errors))
+        self.assertIn("overloaded_error", errors[0]["error"])
+        self.assertEqual("claude", errors[0]["endpoint"])
+        for record in records:
+            if not record["error"]:
+                self.assertIn(f"{record['endpoint']} ", record["text"])
+                self.assertEqual(6.0, record["score"]["score"])
+        self.assertEqual([True] * 3, [record["describe_cached"] for record in records if record["endpoint"] in ("openai", "claude") and not record["error"]])
+        self.assertEqual(len(records) + 1, len(summary))
+        self.assertEqual(4, len(batch_files))
+        self.assertTrue(all(name.endswith(".jsonl") for name in batch_files))
+
+    def test_records_are_written_before_batches_end(self) -> None:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), BatchProvider)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        cases = describe_eval.build_cases()[:2]
+        settings = {"OpenAIApiKey": "key", "AnthropicApiKey": "key"}
+        grok_calls: list[str] = []
+
+        def describe_grok(image_path: Path, settings: dict, args) -> str:
+            grok_calls.append(image_path.stem)
+            return f"two men in jackets, grok {image_path.stem}"
+
+        def killed(*arguments):
+            raise KeyboardInterrupt
+
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                run_dir = Path(directory)
+                images_dir = run_dir / "images"
+                images_dir.mkdir()
+                for case in cases:
+                    (images_dir / f"{case.case_id}.png").write_bytes(case.case_id.encode("utf-8"))
+                results_path = run_dir / "describe_results.jsonl"
+                args = describe_eval.parse_args([
+                    "--endpoints", "openai,grok",
+                    "--batch", "--batch-poll", "0", "--sleep", "0",
+                    "--openai-base-url", base, "--response-cache", "",
+                ])
+                with mock.patch.dict(describe_eval.DESCRIBERS, {"grok": describe_grok}):
+                    # The run dies while polling the describe batch.
+                    with mock.patch.object(describe_eval, "batch_status", killed):
+                        with self.assertRaises(KeyboardInterrupt):
+                            describe_eval.describe_images(cases, settings, args, images_dir, run_dir)
+                    interrupted = list(describe_eval.load_results(results_path).values())
+                    describe_eval.describe_images(cases, settings, args, images_dir, run_dir)
+                records = list(describe_eval.load_results(results_path).values())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        # The paid-for direct descriptions survive, unscored, and the rerun
+        # scores them without describing them again.
+        self.assertEqual([("grok", True)] * 2, [(record["endpoint"], record["score_pending"]) for record in interrupted])
+        self.assertEqual(2, len(grok_calls))
+        # One describe batch, polled again by the rerun, and one score batch.
+        self.assertEqual(["/v1/files", "/v1/batches"] * 2, BatchProvider.posts)
+        self.assertEqual(4, len(records))
+        for record in records:
+            self.assertNotIn("score_pending", record)
+            self.assertEqual(6.0, record["score"]["score"])
+
+
+if __name__ == "__main__":
+    unittest.main()
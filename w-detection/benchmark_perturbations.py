@@ -0,0 +1,304 @@
+"""Benchmark every perturbation and ordered pair across sizes and modes.
+
+Each case runs in a fresh spawned process, so its peak RSS is not inflated by
+earlier cases. A case builds a deterministic source image, runs the pipeline
+once untimed, then records wall time and CPU time over the timed repeats. Peak
+RSS is read after the source is built and again at the end, so the growth
+between the two is the memory the pipeline itself needed. Memoized codec
+round trips are cleared before every repeat, so JPEG and WebP steps are timed
+in full; their median encode and decode times are reported separately. Results go to a JSON
+baseline; a stored baseline can be compared against new results to flag
+regressions.
+"""
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import json
+import multiprocessing
+from pathlib import Path
+import platform
+import statistics
+import sys
+import time
+from typing import Any
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from generate_variants import Transforms
+from perturbation_codecs import round_trips
+
+
+BenchmarkVersion = 1
+
+DefaultSizes = ((256, 192), (1024, 768))
+DefaultModes = ("L", "RGB", "RGBA")
+
+
+def _peak_rss_bytes() -> int:
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            raise ctypes.WinError()
+        return counters.PeakWorkingSetSize
+
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes; Linux and the BSDs report kilobytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def make_source(size: tuple[int, int], mode: str) -> Image.Image:
+    """Return a deterministic image with gradients, edges, and fine noise."""
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width]
+    noise = np.random.default_rng(0).integers(-12, 13, (height, width, 4))
+    channels = np.stack(
+        [
+            x * 255 // max(1, width - 1),
+            y * 255 // max(1, height - 1),
+            ((x // 16 + y // 16) % 2) * 160 + 48,
+            128 + 96 * np.sin(x / 7.0) * np.cos(y / 11.0),
+        ],
+        axis=-1,
+    )
+    pixels = np.clip(channels + noise, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels).convert(mode)
+
+
+def case_key(mode: str, size: tuple[int, int], slugs: tuple[str, ...]) -> str:
+    return f"{mode} {size[0]}x{size[1]} {'>'.join(slugs)}"
+
+
+def run_case(mode: str, size: tuple[int, int], slugs: tuple[str, ...], repeat: int) -> dict[str, Any]:
+    """Time one pipeline in the current process and return its measurements."""
+    if repeat < 1:
+        raise ValueError("repeat must be positive")
+    by_slug = {spec.slug: spec for spec in Transforms}
+    pipeline = [by_slug[slug] for slug in slugs]
+    source = make_source(size, mode)
+
+    def run_pipeline() -> Image.Image:
+        result = source
+        for spec in pipeline:
+            transformed = spec.apply(result)
+            if result is not source:
+                result.close()
+            result = transformed
+        return result
+
+    setup_peak = _peak_rss_bytes()
+    run_pipeline().close()
+    wall_times = []
+    cpu_times = []
+    codec_statistics = []
+    for _ in range(repeat):
+        round_trips.clear()
+        wall_started = time.perf_counter()
+        cpu_started = time.process_time()
+        result = run_pipeline()
+        cpu_times.append(time.process_time() - cpu_started)
+        wall_times.append(time.perf_counter() - wall_started)
+        codec_statistics.append(round_trips.statistics)
+        result.close()
+
+    return {
+        "mode": mode,
+        "width": size[0],
+        "height": size[1],
+        "steps": list(slugs),
+        "repeat": repeat,
+        "wall_seconds_min": round(min(wall_times), 6),
+        "wall_seconds_median": round(statistics.median(wall_times), 6),
+        "cpu_seconds_median": round(statistics.median(cpu_times), 6),
+        "codec_encode_seconds_median": round(
+            statistics.median(item.encode_seconds for item in codec_statistics), 6
+        ),
+        "codec_decode_seconds_median": round(
+            statistics.median(item.decode_seconds for item in codec_statistics), 6
+        ),
+        "codec_encoded_bytes": codec_statistics[-1].encoded_bytes,
+        "setup_peak_rss_bytes": setup_peak,
+        "peak_rss_bytes": _peak_rss_bytes(),
+    }
+
+
+def plan_cases(
+    *,
+    sizes: tuple[tuple[int, int], ...],
+    modes: tuple[str, ...],
+    pairs: bool,
+    only: tuple[str, ...] = (),
+) -> list[tuple[str, tuple[int, int], tuple[str, ...]]]:
+    """List (mode, size, slugs) cases: every single, then every ordered pair.
+
+    only keeps the cases whose steps all contain one of the given substrings.
+    """
+    pipelines: list[tuple[str, ...]] = [(spec.slug,) for spec in Transforms]
+    if pairs:
+        pipelines += [(inner.slug, outer.slug) for inner in Transforms for outer in Transforms]
+    if only:
+        pipelines = [
+            slugs for slugs in pipelines
+            if all(any(fragment in slug for fragment in only) for slug in slugs)
+        ]
+    return [(mode, size, slugs) for size in sizes for mode in modes for slugs in pipelines]
+
+
+def compare(
+    current: dict[str, Any],
+    baseline: dict[str, Any],
+    *,
+    time_tolerance: float = 0.25,
+    memory_tolerance: float = 0.25,
+    minimum_seconds: float = 0.002,
+) -> list[dict[str, Any]]:
+    """Return the cases that got slower or larger than the baseline allows.
+
+    A time regression needs both the relative tolerance and minimum_seconds
+    of absolute growth, so sub-millisecond cases do not flag on noise.
+    """
+    regressions = []
+    for key, case in current["cases"].items():
+        previous = baseline["cases"].get(key)
+        if previous is None:
+            continue
+        before, after = previous["wall_seconds_min"], case["wall_seconds_min"]
+        if after > before * (1 + time_tolerance) and after - before > minimum_seconds:
+            regressions.append(
+                {"case": key, "metric": "wall_seconds_min", "baseline": before, "current": after}
+            )
+        before_rss = previous["peak_rss_bytes"] - previous["setup_peak_rss_bytes"]
+        after_rss = case["peak_rss_bytes"] - case["setup_peak_rss_bytes"]
+        if after_rss > max(before_rss, 1 << 20) * (1 + memory_tolerance):
+            regressions.append(
+                {"case": key, "metric": "pipeline_rss_growth_bytes", "baseline": before_rss, "current": after_rss}
+            )
+    return regressions
+
+
+def benchmark(
+    output: Path,
+    *,
+    sizes: tuple[tuple[int, int], ...],
+    modes: tuple[str, ...],
+    pairs: bool,
+    only: tuple[str, ...],
+    repeat: int,
+    baseline: Path | None,
+) -> list[dict[str, Any]]:
+    if output.exists():
+        raise FileExistsError(f"Output file already exists: {output}")
+    stored = None
+    if baseline is not None:
+        stored = json.loads(baseline.read_text(encoding="utf-8"))
+        if stored.get("benchmark_version") != BenchmarkVersion:
+            raise ValueError(
+                f"baseline has benchmark_version {stored.get('benchmark_version')}, "
+                f"expected {BenchmarkVersion}"
+            )
+    cases = plan_cases(sizes=sizes, modes=modes, pairs=pairs, only=only)
+    if not cases:
+        raise ValueError("no benchmark cases match the given filters")
+
+    results: dict[str, Any] = {}
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, max_tasks_per_child=1) as executor:
+        for index, (mode, size, slugs) in enumerate(cases, start=1):
+            key = case_key(mode, size, slugs)
+            results[key] = executor.submit(run_case, mode, size, slugs, repeat).result()
+            print(
+                f"{index}/{len(cases)}: {key} "
+                f"{results[key]['wall_seconds_min'] * 1000:.1f} ms",
+                flush=True,
+            )
+
+    report = {
+        "benchmark_version": BenchmarkVersion,
+        "created_at_utc": datetime.now(timezone.utc).isoformat(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "repeat": repeat,
+        "cases": results,
+    }
+    regressions = [] if stored is None else compare(report, stored)
+    report["regressions"] = regressions
+    output.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    return regressions
+
+
+def _parse_size(text: str) -> tuple[int, int]:
+    width, separator, height = text.partition("x")
+    if not separator or not width.isdigit() or not height.isdigit() or int(width) < 1 or int(height) < 1:
+        raise argparse.ArgumentTypeError(f"size must look like 640x480, not {text!r}")
+    return int(width), int(height)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Time every perturbation and ordered pair and compare with a stored baseline."
+    )
+    parser.add_argument("output", type=Path, help="JSON file to write; must not exist.")
+    parser.add_argument("--size", type=_parse_size, action="append", dest="sizes")
+    parser.add_argument("--mode", choices=DefaultModes, action="append", dest="modes")
+    parser.add_argument("--pairs", action="store_true", help="Also time all ordered pairs.")
+    parser.add_argument(
+        "--only",
+        action="append",
+        default=[],
+        help="Keep cases whose every step slug contains one of these substrings.",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, help="Earlier output to compare against.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    regressions = benchmark(
+        args.output,
+        sizes=tuple(args.sizes or DefaultSizes),
+        modes=tuple(args.modes or DefaultModes),
+        pairs=args.pairs,
+        only=tuple(args.only),
+        repeat=args.repeat,
+        baseline=args.baseline,
+    )
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression['case']}: {regression['metric']} "
+            f"{regression['baseline']} -> {regression['current']}",
+            flush=True,
+        )
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,34 +3,238 @@
 from __future__ import annotations
 
 import argparse
+from collections.abc import Sequence
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-import hashlib
 import json
 from pathlib import Path
 import random
 import time
+from typing import Any
 
 from PIL import Image
 
-from generate_variants import Transforms
+from generate_variants import (
+    RunnerVersion,
+    TransformSpec,
+    Transforms,
+    add_cache_arguments,
+    add_resume_argument,
+)
+import image_perturbations as perturb
+from perturbation_cache import DefaultMaxBytes, PerturbationCache, module_stamp
+from perturbation_pipeline import compile_pipeline
+from variant_manifest import ManifestWriter, read_checkpointed, resume_run, sha256_file, verify_outputs
+from variant_metrics import DifferenceReference, MetricsVersion
+from variant_output import (
+    DefaultWriterThreads,
+    OutputFormat,
+    OutputWriter,
+    WrittenOutput,
+    add_output_arguments,
+    output_format_from_arguments,
+)
 
 
-def _sha256_file(path: Path) -> str:
-    digest = hashlib.sha256()
-    with path.open("rb") as source:
-        for block in iter(lambda: source.read(1024 * 1024), b""):
-            digest.update(block)
-    return digest.hexdigest()
+# Target number of trie groups per worker process, so uneven subtrees still
+# keep every worker busy.
+GroupsPerWorker = 4
 
+# run.json fields that must match for --resume to continue a run.
+ResumeKeys = (
+    "runner_version",
+    "seed_contract_version",
+    "metrics_version",
+    "source_sha256",
+    "image_count_expected",
+    "minimum_steps",
+    "maximum_steps",
+    "seed",
+    "fuse",
+    "output_format",
+)
 
-def _save_png_atomic(image: Image.Image, destination: Path) -> None:
-    temporary = destination.with_name(f".{destination.name}.partial")
-    try:
-        image.save(temporary, format="PNG")
-        temporary.replace(destination)
-    except Exception:
-        temporary.unlink(missing_ok=True)
-        raise
+
+def draw_pipelines(
+    seed: int,
+    count: int,
+    minimum_steps: int,
+    maximum_steps: int,
+) -> list[tuple[TransformSpec, ...]]:
+    """Draw every pipeline up front, in image order, from one seeded stream."""
+    rng = random.Random(seed)
+    pipelines = []
+    for _ in range(count):
+        step_count = rng.randint(minimum_steps, maximum_steps)
+        pipelines.append(tuple(rng.sample(Transforms, step_count)))
+    return pipelines
+
+
+@dataclass
+class PrefixNode:
+    spec: TransformSpec | None = None
+    children: dict[int, PrefixNode] = field(default_factory=dict)
+    # Images whose pipeline ends at this node.
+    image_numbers: list[int] = field(default_factory=list)
+
+    def add(self, image_number: int, pipeline: Sequence[TransformSpec]) -> None:
+        node = self
+        for spec in pipeline:
+            node = node.children.setdefault(spec.number, PrefixNode(spec))
+        node.image_numbers.append(image_number)
+
+    @property
+    def application_count(self) -> int:
+        """Transform applications needed to produce every image below this node."""
+        return sum(1 + child.application_count for child in self.children.values())
+
+
+def build_prefix_trie(pipelines: Sequence[tuple[int, Sequence[TransformSpec]]]) -> PrefixNode:
+    root = PrefixNode()
+    for image_number, pipeline in pipelines:
+        root.add(image_number, pipeline)
+    return root
+
+
+def _destination_stem(image_number: int, pipeline: Sequence[TransformSpec]) -> str:
+    order = "-".join(f"{spec.number:02d}" for spec in pipeline)
+    return f"random-{image_number:02d}__steps-{len(pipeline):02d}__order-{order}"
+
+
+def _record(
+    image_number: int,
+    pipeline: Sequence[TransformSpec],
+    written: WrittenOutput,
+    output_format: OutputFormat,
+    elapsed_seconds: float,
+    *,
+    fused_stages: list[dict[str, Any]] | None,
+    cached_steps: int | None,
+) -> dict[str, Any]:
+    return {
+        "status": "success",
+        "image_number": image_number,
+        "step_count": len(pipeline),
+        "application_order": [spec.slug for spec in pipeline],
+        "transforms": [
+            {
+                "number": spec.number,
+                "slug": spec.slug,
+                "function": spec.function_name,
+                "arguments": spec.recorded_arguments,
+            }
+            for spec in pipeline
+        ],
+        "fused_stages": fused_stages,
+        "cached_steps": cached_steps,
+        "relative_path": written.path.name,
+        "output_format": output_format.name,
+        "width": written.width,
+        "height": written.height,
+        "mode": written.mode,
+        "sha256": written.sha256,
+        "size_bytes": written.size_bytes,
+        "elapsed_seconds": round(elapsed_seconds, 6),
+        "metrics": written.metrics,
+    }
+
+
+def _generate_group(
+    group: list[tuple[int, list[int]]],
+    source_path: str,
+    output_directory: str,
+    source_hash: str,
+    fuse: bool,
+    cache_directory: str | None,
+    cache_max_bytes: int,
+    output_format: OutputFormat,
+    writer_threads: int,
+) -> list[dict[str, Any]]:
+    """Produce one group of images and return their manifest records.
+
+    Plain pipelines walk a prefix trie depth first, so each shared prefix is
+    computed once; an image's elapsed time is the sum of the steps on its path
+    plus its encode. Fused and cached pipelines run image by image. Saves run
+    on writer threads while the next transforms compute.
+    """
+    by_number = {spec.number: spec for spec in Transforms}
+    pipelines = [
+        (image_number, tuple(by_number[number] for number in numbers))
+        for image_number, numbers in group
+    ]
+    output = Path(output_directory)
+    with Image.open(source_path) as opened:
+        original = opened.copy()
+    reference = DifferenceReference(original)
+
+    # (image number, pipeline, elapsed before encoding, fused stages,
+    # cached steps, pending save)
+    queued: list[
+        tuple[int, Sequence[TransformSpec], float, list[dict[str, Any]] | None, int | None, Future[WrittenOutput]]
+    ] = []
+    with OutputWriter(output_format, writer_threads) as writer:
+        if not fuse and cache_directory is None:
+
+            def walk(node: PrefixNode, image: Image.Image, path: tuple[TransformSpec, ...], elapsed: float) -> None:
+                # Takes ownership of image. Children run first, so the image
+                # can go to the writer afterwards without a copy.
+                for child in node.children.values():
+                    started = time.perf_counter()
+                    transformed = child.spec.apply(image)
+                    step = time.perf_counter() - started
+                    walk(child, transformed, path + (child.spec,), elapsed + step)
+                for position, image_number in enumerate(node.image_numbers):
+                    last = position == len(node.image_numbers) - 1
+                    future = writer.submit(
+                        image if last else image.copy(),
+                        output / _destination_stem(image_number, path),
+                        reference.measure,
+                    )
+                    queued.append((image_number, path, elapsed, None, None, future))
+                if not node.image_numbers:
+                    image.close()
+
+            walk(build_prefix_trie(pipelines), original, (), 0.0)
+        else:
+            cache = None
+            if cache_directory is not None:
+                cache = PerturbationCache(Path(cache_directory), max_bytes=cache_max_bytes)
+            for image_number, pipeline in pipelines:
+                compiled = compile_pipeline(pipeline) if fuse else None
+                cached_steps = None
+                started = time.perf_counter()
+                if cache is not None:
+                    result, cached_steps = cache.run(source_hash, original, pipeline)
+                else:
+                    result = compiled.apply(original)
+                elapsed = time.perf_counter() - started
+                future = writer.submit(
+                    result,
+                    output / _destination_stem(image_number, pipeline),
+                    reference.measure,
+                )
+                fused_stages = None if compiled is None else compiled.fusion_report()
+                queued.append((image_number, pipeline, elapsed, fused_stages, cached_steps, future))
+            if cache is not None:
+                cache.close()
+            original.close()
+
+        records: list[dict[str, Any]] = []
+        for image_number, pipeline, elapsed, fused_stages, cached_steps, future in queued:
+            written = future.result()
+            records.append(
+                _record(
+                    image_number,
+                    pipeline,
+                    written,
+                    output_format,
+                    elapsed + written.encode_seconds,
+                    fused_stages=fused_stages,
+                    cached_steps=cached_steps,
+                )
+            )
+    return records
 
 
 def generate(
@@ -41,7 +245,20 @@ def generate(
     minimum_steps: int,
     maximum_steps: int,
     seed: int,
+    fuse: bool = False,
+    cache_directory: Path | None = None,
+    cache_max_bytes: int = DefaultMaxBytes,
+    workers: int = 1,
+    output_format: OutputFormat = OutputFormat(),
+    writer_threads: int = DefaultWriterThreads,
+    resume: bool = False,
 ) -> None:
+    """Write count random pipelines of the source under output.
+
+    With resume, output must hold an earlier run with the same source, seed,
+    step range, fuse setting, and output format; only the images missing from
+    its checkpointed manifest are produced.
+    """
     if not source.is_file():
         raise FileNotFoundError(f"Source image does not exist: {source}")
     if count < 1:
@@ -50,85 +267,108 @@ def generate(
         raise ValueError(
             f"steps must satisfy 1 <= minimum <= maximum <= {len(Transforms)}"
         )
-    if output.exists() and any(output.iterdir()):
+    if fuse and cache_directory is not None:
+        raise ValueError("fused pipelines cannot use the cache; pass only one of fuse and cache")
+    if workers < 1:
+        raise ValueError("workers must be positive")
+    if writer_threads < 1:
+        raise ValueError("writer threads must be positive")
+    if not resume and output.exists() and any(output.iterdir()):
         raise FileExistsError(f"Output directory must be absent or empty: {output}")
 
     output.mkdir(parents=True, exist_ok=True)
     manifest_path = output / "manifest.jsonl"
     run_path = output / "run.json"
-    rng = random.Random(seed)
+    pipelines = draw_pipelines(seed, count, minimum_steps, maximum_steps)
+    kept: list[dict[str, Any]] = []
+    if resume:
+        kept = read_checkpointed(manifest_path)
+        verify_outputs(output, kept)
+    done = {record["image_number"] for record in kept}
+    missing = [number for number in range(1, count + 1) if number not in done]
+    trie = build_prefix_trie([(number, pipelines[number - 1]) for number in missing])
     started_at = datetime.now(timezone.utc)
     run_record = {
         "status": "running",
+        "runner_version": RunnerVersion,
         "source_path": str(source.resolve()),
-        "source_sha256": _sha256_file(source),
+        "source_sha256": sha256_file(source),
         "image_count_expected": count,
         "minimum_steps": minimum_steps,
         "maximum_steps": maximum_steps,
         "seed": seed,
+        "seed_contract_version": perturb.SeedContractVersion,
+        "metrics_version": MetricsVersion,
+        "fuse": fuse,
+        "cache_directory": None if cache_directory is None else str(cache_directory.resolve()),
+        "workers": workers,
+        "output_format": output_format.manifest_entry(),
+        "writer_threads": writer_threads,
+        "transform_applications_unshared": sum(len(pipelines[number - 1]) for number in missing),
+        "transform_applications_planned": trie.application_count,
         "started_at_utc": started_at.isoformat(),
     }
+    if cache_directory is not None:
+        run_record["cache_module_stamp"] = module_stamp()
+    if resume:
+        run_record = resume_run(run_path, run_record, ResumeKeys)
+        run_record["records_kept"] = len(kept)
     run_path.write_text(
         json.dumps(run_record, indent=2, sort_keys=True) + "\n",
         encoding="utf-8",
     )
 
     try:
-        with Image.open(source) as opened:
-            original = opened.copy()
-
-        with manifest_path.open("x", encoding="utf-8") as manifest:
-            for image_number in range(1, count + 1):
-                step_count = rng.randint(minimum_steps, maximum_steps)
-                pipeline = rng.sample(Transforms, step_count)
-                order = "-".join(f"{spec.number:02d}" for spec in pipeline)
-                destination = output / (
-                    f"random-{image_number:02d}__steps-{step_count:02d}"
-                    f"__order-{order}.png"
-                )
+        groups = [
+            sorted(
+                (image_number, [spec.number for spec in pipelines[image_number - 1]])
+                for image_number in _image_numbers(node)
+            )
+            for node in _plan_groups(trie, workers)
+        ]
+        arguments = (
+            str(source),
+            str(output),
+            run_record["source_sha256"],
+            fuse,
+            None if cache_directory is None else str(cache_directory),
+            cache_max_bytes,
+            output_format,
+            writer_threads,
+        )
 
-                result = original.copy()
-                started = time.perf_counter()
-                for spec in pipeline:
-                    transformed = spec.apply(result)
-                    result.close()
-                    result = transformed
-                _save_png_atomic(result, destination)
-                elapsed = time.perf_counter() - started
+        # Groups finish out of order; records wait here until every earlier
+        # missing image number is written, so the records this run appends
+        # stay in image order.
+        pending: dict[int, dict[str, Any]] = {}
+        position = 0
+        with ManifestWriter(manifest_path, resume=resume) as manifest:
 
-                record = {
-                    "status": "success",
-                    "image_number": image_number,
-                    "step_count": step_count,
-                    "application_order": [spec.slug for spec in pipeline],
-                    "transforms": [
-                        {
-                            "number": spec.number,
-                            "slug": spec.slug,
-                            "function": spec.function_name,
-                            "arguments": spec.recorded_arguments,
-                        }
-                        for spec in pipeline
-                    ],
-                    "relative_path": destination.name,
-                    "width": result.width,
-                    "height": result.height,
-                    "mode": result.mode,
-                    "sha256": _sha256_file(destination),
-                    "elapsed_seconds": round(elapsed, 6),
-                }
-                manifest.write(
-                    json.dumps(record, sort_keys=True, separators=(",", ":")) + "\n"
-                )
-                manifest.flush()
-                result.close()
-                print(
-                    f"{image_number:02d}/{count}: {step_count:02d} steps "
-                    f"[{order}]",
-                    flush=True,
-                )
+            def accept(records: list[dict[str, Any]]) -> None:
+                nonlocal position
+                pending.update((record["image_number"], record) for record in records)
+                while position < len(missing) and missing[position] in pending:
+                    record = pending.pop(missing[position])
+                    manifest.append(record)
+                    order = "-".join(f"{item['number']:02d}" for item in record["transforms"])
+                    print(
+                        f"{record['image_number']:02d}/{count}: {record['step_count']:02d} steps "
+                        f"[{order}]",
+                        flush=True,
+                    )
+                    position += 1
+
+            if workers == 1:
+                for group in groups:
+                    accept(_generate_group(group, *arguments))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(_generate_group, group, *arguments) for group in groups]
+                    for future in as_completed(futures):
+                        accept(future.result())
+            if pending or position != len(missing):
+                raise RuntimeError("worker groups did not return every image exactly once")
 
-        original.close()
         completed_at = datetime.now(timezone.utc)
         run_record.update(
             {
@@ -160,6 +400,35 @@ def generate(
         raise
 
 
+def _plan_groups(trie: PrefixNode, workers: int) -> list[PrefixNode]:
+    """Split the trie into subtrees that can run in separate processes.
+
+    Groups start as the root subtrees, which share nothing. While there are
+    fewer than GroupsPerWorker groups per worker, the largest group that
+    branches is replaced by its child subtrees, plus a group for any images
+    that end at it. Each new group recomputes the prefix above it.
+    """
+    groups = list(trie.children.values())
+    if workers == 1:
+        return groups
+    while len(groups) < workers * GroupsPerWorker:
+        splittable = [group for group in groups if group.children]
+        if not splittable:
+            break
+        largest = max(splittable, key=lambda group: len(_image_numbers(group)))
+        index = groups.index(largest)
+        ending = [PrefixNode(largest.spec, {}, largest.image_numbers)] if largest.image_numbers else []
+        groups[index : index + 1] = ending + list(largest.children.values())
+    return groups
+
+
+def _image_numbers(node: PrefixNode) -> list[int]:
+    numbers = list(node.image_numbers)
+    for child in node.children.values():
+        numbers.extend(_image_numbers(child))
+    return numbers
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Generate random, nonrepeating multi-transform pipelines."
@@ -170,6 +439,20 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--minimum-steps", type=int, default=5)
     parser.add_argument("--maximum-steps", type=int, default=len(Transforms))
     parser.add_argument("--seed", type=int, default=20260723)
+    parser.add_argument(
+        "--fuse",
+        action="store_true",
+        help="compose consecutive geometric and lookup steps; output is not byte-identical",
+    )
+    add_cache_arguments(parser)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes; each takes the images that share a first step.",
+    )
+    add_output_arguments(parser)
+    add_resume_argument(parser)
     return parser.parse_args()
 
 
@@ -182,6 +465,13 @@ def main() -> None:
         minimum_steps=args.minimum_steps,
         maximum_steps=args.maximum_steps,
         seed=args.seed,
+        fuse=args.fuse,
+        cache_directory=args.cache,
+        cache_max_bytes=args.cache_max_bytes,
+        workers=args.workers,
+        output_format=output_format_from_arguments(args),
+        writer_threads=args.writer_threads,
+        resume=args.resume,
     )
 
 
@@ -3,11 +3,13 @@
 from __future__ import annotations
 
 import argparse
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import deque
+from collections.abc import Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, as_completed, wait
 from dataclasses import dataclass
 from datetime import datetime, timezone
-import hashlib
 import json
+from multiprocessing import shared_memory
 import os
 from pathlib import Path
 import time
@@ -16,9 +18,30 @@ from typing import Any
 from PIL import Image
 
 import image_perturbations as perturb
+from perturbation_cache import DefaultMaxBytes, PerturbationCache, module_stamp
+from variant_manifest import ManifestWriter, read_checkpointed, resume_run, sha256_file, verify_outputs
+from variant_metrics import DifferenceReference, MetricsVersion
+from variant_output import (
+    DefaultWriterThreads,
+    OutputFormat,
+    OutputWriter,
+    WrittenOutput,
+    add_output_arguments,
+    output_format_from_arguments,
+)
+
 
+RunnerVersion = 6
 
-RunnerVersion = 1
+# run.json fields that must match for --resume to continue a run.
+ResumeKeys = (
+    "runner_version",
+    "seed_contract_version",
+    "metrics_version",
+    "source_sha256",
+    "transform_count",
+    "output_format",
+)
 
 
 @dataclass(frozen=True)
@@ -251,34 +274,59 @@ Transforms = (
 )
 
 
-def _sha256_file(path: Path) -> str:
-    digest = hashlib.sha256()
-    with path.open("rb") as source:
-        for block in iter(lambda: source.read(1024 * 1024), b""):
-            digest.update(block)
-    return digest.hexdigest()
+@dataclass(frozen=True)
+class SharedImage:
+    """Where a decoded image lives in shared memory, and how to rebuild it."""
 
+    name: str
+    mode: str
+    size: tuple[int, int]
+    palette_mode: str | None
+    palette: bytes | None
+    transparency: Any = None
+
+
+def _publish_image(image: Image.Image) -> tuple[shared_memory.SharedMemory, SharedImage]:
+    payload = image.tobytes()
+    segment = shared_memory.SharedMemory(create=True, size=max(1, len(payload)))
+    segment.buf[: len(payload)] = payload
+    paletted = image.mode in ("P", "PA")
+    return segment, SharedImage(
+        segment.name,
+        image.mode,
+        image.size,
+        image.palette.mode if paletted else None,
+        image.palette.tobytes() if paletted else None,
+        image.info.get("transparency"),
+    )
 
-def _save_png_atomic(image: Image.Image, destination: Path) -> None:
-    temporary = destination.with_name(f".{destination.name}.partial")
-    try:
-        image.save(temporary, format="PNG")
-        temporary.replace(destination)
-    except Exception:
-        temporary.unlink(missing_ok=True)
-        raise
+
+def _attach_image(shared: SharedImage) -> tuple[shared_memory.SharedMemory, Image.Image]:
+    """Attach to a published image; the caller closes the image, then the segment.
+
+    Modes with a matching raw layout map the segment without copying.
+    """
+    # Pool workers share the parent's resource tracker, so attaching here
+    # registers nothing new and the parent's unlink stays the only cleanup.
+    segment = shared_memory.SharedMemory(name=shared.name)
+    image = Image.frombuffer(shared.mode, shared.size, segment.buf, "raw", shared.mode, 0, 1)
+    if shared.palette is not None:
+        image.putpalette(shared.palette, rawmode=shared.palette_mode)
+    if shared.transparency is not None:
+        image.info["transparency"] = shared.transparency
+    return segment, image
 
 
 def _record_for_image(
     *,
     kind: str,
     pipeline: list[TransformSpec],
-    saved_path: Path,
-    relative_path: Path,
-    image: Image.Image,
+    written: WrittenOutput,
+    output_format: OutputFormat,
     elapsed_seconds: float,
+    cached_steps: int | None = None,
 ) -> dict[str, Any]:
-    return {
+    record = {
         "status": "success",
         "kind": kind,
         "application_order": [spec.slug for spec in pipeline],
@@ -291,150 +339,318 @@ def _record_for_image(
             }
             for spec in pipeline
         ],
-        "relative_path": relative_path.as_posix(),
-        "width": image.width,
-        "height": image.height,
-        "mode": image.mode,
-        "sha256": _sha256_file(saved_path),
+        "relative_path": f"{written.path.parent.name}/{written.path.name}",
+        "output_format": output_format.name,
+        "width": written.width,
+        "height": written.height,
+        "mode": written.mode,
+        "sha256": written.sha256,
+        "size_bytes": written.size_bytes,
         "elapsed_seconds": round(elapsed_seconds, 6),
+        "metrics": written.metrics,
     }
+    if cached_steps is not None:
+        record["cached_steps"] = cached_steps
+    return record
 
 
-def _single_filename(spec: TransformSpec) -> str:
-    return f"{spec.number:02d}__{spec.slug}.png"
+def _single_stem(spec: TransformSpec) -> str:
+    return f"{spec.number:02d}__{spec.slug}"
 
 
-def _pair_filename(inner: TransformSpec, outer: TransformSpec) -> str:
+def _pair_stem(inner: TransformSpec, outer: TransformSpec) -> str:
     return (
         f"inner-{inner.number:02d}__{inner.slug}"
-        f"__outer-{outer.number:02d}__{outer.slug}.png"
+        f"__outer-{outer.number:02d}__{outer.slug}"
     )
 
 
 def _generate_pair_group(
     inner_index: int,
-    singles_directory: str,
+    outer_indices: list[int],
+    inner_shared: SharedImage,
+    inner_cached_steps: int | None,
+    source_shared: SharedImage,
     pairs_directory: str,
+    source_hash: str,
+    cache_directory: str | None,
+    cache_max_bytes: int,
+    output_format: OutputFormat,
+    writer_threads: int,
 ) -> tuple[int, list[dict[str, Any]]]:
     inner = Transforms[inner_index]
-    single_path = Path(singles_directory) / _single_filename(inner)
-    if not single_path.is_file():
-        raise FileNotFoundError(f"Missing exact inner-stage image: {single_path}")
+    segment, inner_image = _attach_image(inner_shared)
+    source_segment, source_image = _attach_image(source_shared)
+    reference = DifferenceReference(source_image)
+    source_image.close()
+    del source_image
+    source_segment.close()
+
+    cache = None
+    if cache_directory is not None:
+        cache = PerturbationCache(Path(cache_directory), max_bytes=cache_max_bytes)
+    with OutputWriter(output_format, writer_threads) as writer:
+        records = _pair_records(
+            inner,
+            inner_image,
+            inner_cached_steps,
+            outer_indices,
+            Path(pairs_directory),
+            source_hash,
+            cache,
+            writer,
+            reference,
+        )
+
+    inner_image.close()
+    del inner_image
+    segment.close()
+    if cache is not None:
+        cache.close()
+    return inner_index, records
 
-    with Image.open(single_path) as opened:
-        inner_image = opened.copy()
 
-    records: list[dict[str, Any]] = []
-    pairs_path = Path(pairs_directory)
-    for outer in Transforms:
+def _pair_records(
+    inner: TransformSpec,
+    inner_image: Image.Image,
+    inner_cached_steps: int | None,
+    outer_indices: list[int],
+    pairs_path: Path,
+    source_hash: str,
+    cache: PerturbationCache | None,
+    writer: OutputWriter,
+    reference: DifferenceReference,
+) -> list[dict[str, Any]]:
+    """Apply each outer transform to the inner image, save, and return records.
+
+    inner_cached_steps is what the cache reported for the inner image, so a
+    pair that misses counts the inner step only when it was read, not run.
+    """
+    queued: list[tuple[TransformSpec, float, int | None, Future[WrittenOutput]]] = []
+    for outer in (Transforms[index] for index in outer_indices):
         started = time.perf_counter()
-        result = outer.apply(inner_image)
-        destination = pairs_path / _pair_filename(inner, outer)
-        _save_png_atomic(result, destination)
+        cached_steps = None
+        if cache is None:
+            result = outer.apply(inner_image)
+        else:
+            key = cache.key(source_hash, [inner, outer])
+            result = cache.get(key)
+            cached_steps = 2
+            if result is None:
+                result = outer.apply(inner_image)
+                cache.put(key, result)
+                cached_steps = min(inner_cached_steps or 0, 1)
         elapsed = time.perf_counter() - started
+        future = writer.submit(result, pairs_path / _pair_stem(inner, outer), reference.measure)
+        queued.append((outer, elapsed, cached_steps, future))
+
+    records = []
+    for outer, elapsed, cached_steps, future in queued:
+        written = future.result()
         records.append(
             _record_for_image(
                 kind="ordered_pair",
                 pipeline=[inner, outer],
-                saved_path=destination,
-                relative_path=Path("pairs") / destination.name,
-                image=result,
-                elapsed_seconds=elapsed,
+                written=written,
+                output_format=writer.output_format,
+                elapsed_seconds=elapsed + written.encode_seconds,
+                cached_steps=cached_steps,
             )
         )
-        result.close()
+    return records
 
-    inner_image.close()
-    return inner_index, records
 
+def _run_metadata(
+    source: Path,
+    source_hash: str,
+    started_at: datetime,
+    *,
+    workers: int,
+    cache_directory: Path | None,
+    output_format: OutputFormat,
+    writer_threads: int,
+) -> dict[str, Any]:
+    return {
+        "runner_version": RunnerVersion,
+        "seed_contract_version": perturb.SeedContractVersion,
+        "metrics_version": MetricsVersion,
+        "source_path": str(source.resolve()),
+        "source_sha256": source_hash,
+        "transform_count": len(Transforms),
+        "single_count_expected": len(Transforms),
+        "ordered_pair_count_expected": len(Transforms) ** 2,
+        "total_count_expected": len(Transforms) + len(Transforms) ** 2,
+        "workers": workers,
+        "cache_directory": None if cache_directory is None else str(cache_directory.resolve()),
+        "output_format": output_format.manifest_entry(),
+        "writer_threads": writer_threads,
+        "started_at_utc": started_at.isoformat(),
+        "status": "running",
+    }
 
-def _append_manifest_record(manifest, record: dict[str, Any]) -> None:
-    manifest.write(json.dumps(record, sort_keys=True, separators=(",", ":")) + "\n")
-    manifest.flush()
-    os.fsync(manifest.fileno())
 
+def generate(
+    source: Path,
+    output: Path,
+    workers: int,
+    *,
+    cache_directory: Path | None = None,
+    cache_max_bytes: int = DefaultMaxBytes,
+    output_format: OutputFormat = OutputFormat(),
+    writer_threads: int = DefaultWriterThreads,
+    resume: bool = False,
+) -> None:
+    """Write every single and ordered pair of Transforms under output.
 
-def generate(source: Path, output: Path, workers: int) -> None:
+    With resume, output must hold an earlier run of the same source, runner
+    version, and output format. Its checkpointed records are kept once their
+    files verify, and only the missing images are produced.
+    """
     if not source.is_file():
         raise FileNotFoundError(f"Source image does not exist: {source}")
     if workers < 1:
         raise ValueError("workers must be positive")
-    if output.exists() and any(output.iterdir()):
+    if writer_threads < 1:
+        raise ValueError("writer threads must be positive")
+    if not resume and output.exists() and any(output.iterdir()):
         raise FileExistsError(f"Output directory must be absent or empty: {output}")
 
     output.mkdir(parents=True, exist_ok=True)
     singles_directory = output / "singles"
     pairs_directory = output / "pairs"
-    singles_directory.mkdir()
-    pairs_directory.mkdir()
+    singles_directory.mkdir(exist_ok=resume)
+    pairs_directory.mkdir(exist_ok=resume)
     manifest_path = output / "manifest.jsonl"
     run_path = output / "run.json"
 
-    source_hash = _sha256_file(source)
+    source_hash = sha256_file(source)
     started_at = datetime.now(timezone.utc)
-    run_metadata = {
-        "runner_version": RunnerVersion,
-        "source_path": str(source.resolve()),
-        "source_sha256": source_hash,
-        "transform_count": len(Transforms),
-        "single_count_expected": len(Transforms),
-        "ordered_pair_count_expected": len(Transforms) ** 2,
-        "total_count_expected": len(Transforms) + len(Transforms) ** 2,
-        "workers": workers,
-        "started_at_utc": started_at.isoformat(),
-        "status": "running",
-    }
+    run_metadata = _run_metadata(
+        source,
+        source_hash,
+        started_at,
+        workers=workers,
+        cache_directory=cache_directory,
+        output_format=output_format,
+        writer_threads=writer_threads,
+    )
+    # Application orders already in the manifest.
+    done: set[tuple[str, ...]] = set()
+    if resume:
+        run_metadata = resume_run(run_path, run_metadata, ResumeKeys)
+        kept = read_checkpointed(manifest_path)
+        verify_outputs(output, kept)
+        done = {tuple(record["application_order"]) for record in kept}
+        run_metadata["records_kept"] = len(kept)
     run_path.write_text(
         json.dumps(run_metadata, indent=2, sort_keys=True) + "\n",
         encoding="utf-8",
     )
+    # Inner index -> outer indices whose pair is still missing.
+    missing_outers: dict[int, list[int]] = {}
+    for inner_index, inner in enumerate(Transforms):
+        outers = [index for index, outer in enumerate(Transforms) if (inner.slug, outer.slug) not in done]
+        if outers:
+            missing_outers[inner_index] = outers
 
+    # Decoded singles go to pair workers through shared memory; each segment
+    # is released once its pair group has finished.
+    segments: dict[int, shared_memory.SharedMemory] = {}
+    shared_singles: dict[int, SharedImage] = {}
+    single_cached_steps: dict[int, int | None] = {}
+    source_segment = None
     try:
         with Image.open(source) as opened:
             original = opened.copy()
+        reference = DifferenceReference(original)
 
-        with manifest_path.open("x", encoding="utf-8") as manifest:
-            for index, spec in enumerate(Transforms, start=1):
-                started = time.perf_counter()
-                result = spec.apply(original)
-                destination = singles_directory / _single_filename(spec)
-                _save_png_atomic(result, destination)
-                elapsed = time.perf_counter() - started
-                record = _record_for_image(
-                    kind="single",
-                    pipeline=[spec],
-                    saved_path=destination,
-                    relative_path=Path("singles") / destination.name,
-                    image=result,
-                    elapsed_seconds=elapsed,
-                )
-                _append_manifest_record(manifest, record)
-                result.close()
-                print(
-                    f"single {index:02d}/{len(Transforms)}: {destination.name}",
-                    flush=True,
-                )
-        original.close()
+        cache = None
+        if cache_directory is not None:
+            cache = PerturbationCache(cache_directory, max_bytes=cache_max_bytes)
+            run_metadata["cache_module_stamp"] = cache.stamp
+        with ManifestWriter(manifest_path, resume=resume) as manifest:
+            # Singles encode on the writer threads while the next transform
+            # runs; records are written in transform order as saves finish.
+            queued: deque[tuple[int, TransformSpec, float, int | None, Future[WrittenOutput]]] = deque()
+
+            def write_finished(wait: bool) -> None:
+                while queued and (wait or queued[0][4].done()):
+                    index, spec, elapsed, cached_steps, future = queued.popleft()
+                    written = future.result()
+                    record = _record_for_image(
+                        kind="single",
+                        pipeline=[spec],
+                        written=written,
+                        output_format=output_format,
+                        elapsed_seconds=elapsed + written.encode_seconds,
+                        cached_steps=cached_steps,
+                    )
+                    manifest.append(record)
+                    print(
+                        f"single {index:02d}/{len(Transforms)}: {written.path.name}",
+                        flush=True,
+                    )
+
+            with OutputWriter(output_format, writer_threads) as writer:
+                for index, spec in enumerate(Transforms, start=1):
+                    # A finished single is recomputed when its pairs still
+                    # need it as their inner image.
+                    single_missing = (spec.slug,) not in done
+                    if not single_missing and index - 1 not in missing_outers:
+                        continue
+                    started = time.perf_counter()
+                    cached_steps = None
+                    if cache is None:
+                        result = spec.apply(original)
+                    else:
+                        result, cached_steps = cache.run(source_hash, original, [spec])
+                    elapsed = time.perf_counter() - started
+                    if index - 1 in missing_outers:
+                        segments[index - 1], shared_singles[index - 1] = _publish_image(result)
+                        single_cached_steps[index - 1] = cached_steps
+                    if not single_missing:
+                        result.close()
+                        continue
+                    future = writer.submit(result, singles_directory / _single_stem(spec), reference.measure)
+                    queued.append((index, spec, elapsed, cached_steps, future))
+                    write_finished(wait=False)
+                write_finished(wait=True)
+            # Pair workers measure against the source too.
+            if missing_outers:
+                source_segment, source_shared = _publish_image(original)
+            original.close()
+            if cache is not None:
+                cache.close()
 
-        completed_groups = 0
-        with manifest_path.open("a", encoding="utf-8") as manifest:
+            completed_groups = 0
             with ProcessPoolExecutor(max_workers=workers) as executor:
                 futures = {
                     executor.submit(
                         _generate_pair_group,
                         inner_index,
-                        str(singles_directory),
+                        outer_indices,
+                        shared_singles[inner_index],
+                        single_cached_steps[inner_index],
+                        source_shared,
                         str(pairs_directory),
+                        source_hash,
+                        None if cache_directory is None else str(cache_directory),
+                        cache_max_bytes,
+                        output_format,
+                        writer_threads,
                     ): inner_index
-                    for inner_index in range(len(Transforms))
+                    for inner_index, outer_indices in missing_outers.items()
                 }
                 for future in as_completed(futures):
                     inner_index, records = future.result()
+                    segment = segments.pop(inner_index)
+                    segment.close()
+                    segment.unlink()
                     for record in records:
-                        _append_manifest_record(manifest, record)
+                        manifest.append(record)
                     completed_groups += 1
                     print(
-                        f"pair group {completed_groups:02d}/{len(Transforms)}: "
+                        f"pair group {completed_groups:02d}/{len(missing_outers)}: "
                         f"inner {Transforms[inner_index].number:02d} "
                         f"({len(records)} images)",
                         flush=True,
@@ -470,29 +686,361 @@ def generate(source: Path, output: Path, workers: int) -> None:
             encoding="utf-8",
         )
         raise
+    finally:
+        for segment in segments.values():
+            segment.close()
+            segment.unlink()
+        if source_segment is not None:
+            source_segment.close()
+            source_segment.unlink()
+
+
+SourceSuffixes = (".bmp", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp")
+
+# Corpus work units queued per worker process, so a worker that finishes a
+# unit starts the next one without waiting on the parent.
+UnitsPerWorker = 2
+
+
+def corpus_sources(paths: Sequence[Path]) -> list[Path]:
+    """Expand directories to the image files directly inside them."""
+    sources: list[Path] = []
+    for path in paths:
+        if path.is_dir():
+            sources.extend(
+                sorted(
+                    child
+                    for child in path.iterdir()
+                    if child.is_file() and child.suffix.lower() in SourceSuffixes
+                )
+            )
+        elif path.is_file():
+            sources.append(path)
+        else:
+            raise FileNotFoundError(f"Source image does not exist: {path}")
+    if not sources:
+        raise ValueError("corpus has no source images")
+    return sources
+
+
+def _generate_corpus_unit(
+    source_index: int,
+    inner_index: int,
+    source_shared: SharedImage,
+    source_output: str,
+    source_hash: str,
+    cache_directory: str | None,
+    cache_max_bytes: int,
+    output_format: OutputFormat,
+    writer_threads: int,
+) -> tuple[int, int, list[dict[str, Any]]]:
+    """Produce one source's single for one inner transform, then its pairs."""
+    inner = Transforms[inner_index]
+    segment, source_image = _attach_image(source_shared)
+    reference = DifferenceReference(source_image)
+    cache = None
+    if cache_directory is not None:
+        cache = PerturbationCache(Path(cache_directory), max_bytes=cache_max_bytes)
+    output = Path(source_output)
+    with OutputWriter(output_format, writer_threads) as writer:
+        started = time.perf_counter()
+        cached_steps = None
+        if cache is None:
+            single = inner.apply(source_image)
+        else:
+            single, cached_steps = cache.run(source_hash, source_image, [inner])
+        elapsed = time.perf_counter() - started
+        records = _pair_records(
+            inner,
+            single,
+            cached_steps,
+            list(range(len(Transforms))),
+            output / "pairs",
+            source_hash,
+            cache,
+            writer,
+            reference,
+        )
+        # The pairs are done with the single, so the writer can take it.
+        written = writer.submit(single, output / "singles" / _single_stem(inner), reference.measure).result()
+        records.insert(
+            0,
+            _record_for_image(
+                kind="single",
+                pipeline=[inner],
+                written=written,
+                output_format=output_format,
+                elapsed_seconds=elapsed + written.encode_seconds,
+                cached_steps=cached_steps,
+            ),
+        )
+
+    source_image.close()
+    del source_image
+    segment.close()
+    if cache is not None:
+        cache.close()
+    return source_index, inner_index, records
+
+
+def generate_corpus(
+    sources: Sequence[Path],
+    output: Path,
+    workers: int,
+    *,
+    cache_directory: Path | None = None,
+    cache_max_bytes: int = DefaultMaxBytes,
+    output_format: OutputFormat = OutputFormat(),
+    writer_threads: int = DefaultWriterThreads,
+) -> None:
+    """Run every source through the singles and pairs matrix on one pool.
+
+    Each source gets a directory named after its stem, laid out like a
+    generate run, and corpus.json indexes them. A work unit is one source and
+    one inner transform: the single and its ordered pairs. Units go out
+    largest source first, so the biggest images do not finish last. A source
+    is decoded once into shared memory when its first unit is queued and
+    released after its last unit. Its manifest holds records in unit
+    completion order.
+    """
+    if workers < 1:
+        raise ValueError("workers must be positive")
+    if writer_threads < 1:
+        raise ValueError("writer threads must be positive")
+    if not sources:
+        raise ValueError("corpus has no source images")
+    names = [source.stem for source in sources]
+    if len(set(names)) != len(names):
+        raise ValueError("corpus sources must have distinct file stems")
+    if output.exists() and any(output.iterdir()):
+        raise FileExistsError(f"Output directory must be absent or empty: {output}")
+
+    output.mkdir(parents=True, exist_ok=True)
+    index_path = output / "corpus.json"
+    entries = []
+    for source, name in zip(sources, names, strict=True):
+        with Image.open(source) as opened:
+            width, height = opened.size
+        entries.append(
+            {
+                "directory": name,
+                "source_path": str(source.resolve()),
+                "source_sha256": sha256_file(source),
+                "width": width,
+                "height": height,
+                "status": "pending",
+            }
+        )
+    started_at = datetime.now(timezone.utc)
+    corpus_index = {
+        "runner_version": RunnerVersion,
+        "seed_contract_version": perturb.SeedContractVersion,
+        "metrics_version": MetricsVersion,
+        "source_count": len(sources),
+        "sources": entries,
+        "workers": workers,
+        "cache_directory": None if cache_directory is None else str(cache_directory.resolve()),
+        "output_format": output_format.manifest_entry(),
+        "writer_threads": writer_threads,
+        "started_at_utc": started_at.isoformat(),
+        "status": "running",
+    }
+    index_path.write_text(json.dumps(corpus_index, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+
+    order = sorted(range(len(sources)), key=lambda number: -entries[number]["width"] * entries[number]["height"])
+    units = deque((source_index, inner_index) for source_index in order for inner_index in range(len(Transforms)))
+    remaining = {source_index: len(Transforms) for source_index in order}
+    segments: dict[int, shared_memory.SharedMemory] = {}
+    shared: dict[int, SharedImage] = {}
+    manifests: dict[int, ManifestWriter] = {}
+    runs: dict[int, dict[str, Any]] = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight: dict[Future[tuple[int, int, list[dict[str, Any]]]], int] = {}
+            while units or in_flight:
+                while units and len(in_flight) < workers * UnitsPerWorker:
+                    source_index, inner_index = units.popleft()
+                    directory = output / entries[source_index]["directory"]
+                    if source_index not in shared:
+                        (directory / "singles").mkdir(parents=True)
+                        (directory / "pairs").mkdir()
+                        runs[source_index] = _run_metadata(
+                            sources[source_index],
+                            entries[source_index]["source_sha256"],
+                            datetime.now(timezone.utc),
+                            workers=workers,
+                            cache_directory=cache_directory,
+                            output_format=output_format,
+                            writer_threads=writer_threads,
+                        )
+                        if cache_directory is not None:
+                            runs[source_index]["cache_module_stamp"] = module_stamp()
+                        (directory / "run.json").write_text(
+                            json.dumps(runs[source_index], indent=2, sort_keys=True) + "\n",
+                            encoding="utf-8",
+                        )
+                        with Image.open(sources[source_index]) as opened:
+                            decoded = opened.copy()
+                        segments[source_index], shared[source_index] = _publish_image(decoded)
+                        decoded.close()
+                        manifests[source_index] = ManifestWriter(directory / "manifest.jsonl")
+                        entries[source_index]["status"] = "running"
+                    future = executor.submit(
+                        _generate_corpus_unit,
+                        source_index,
+                        inner_index,
+                        shared[source_index],
+                        str(directory),
+                        entries[source_index]["source_sha256"],
+                        None if cache_directory is None else str(cache_directory),
+                        cache_max_bytes,
+                        output_format,
+                        writer_threads,
+                    )
+                    in_flight[future] = source_index
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    del in_flight[future]
+                    source_index, inner_index, records = future.result()
+                    for record in records:
+                        manifests[source_index].append(record)
+                    remaining[source_index] -= 1
+                    print(
+                        f"{entries[source_index]['directory']}: inner "
+                        f"{Transforms[inner_index].number:02d} ({len(records)} images)",
+                        flush=True,
+                    )
+                    if remaining[source_index]:
+                        continue
+                    manifests.pop(source_index).close()
+                    segment = segments.pop(source_index)
+                    segment.close()
+                    segment.unlink()
+                    del shared[source_index]
+                    completed_at = datetime.now(timezone.utc)
+                    run_started_at = datetime.fromisoformat(runs[source_index]["started_at_utc"])
+                    runs[source_index].update(
+                        {
+                            "status": "success",
+                            "completed_at_utc": completed_at.isoformat(),
+                            "elapsed_seconds": round((completed_at - run_started_at).total_seconds(), 6),
+                        }
+                    )
+                    (output / entries[source_index]["directory"] / "run.json").write_text(
+                        json.dumps(runs[source_index], indent=2, sort_keys=True) + "\n",
+                        encoding="utf-8",
+                    )
+                    entries[source_index]["status"] = "success"
+
+        completed_at = datetime.now(timezone.utc)
+        corpus_index.update(
+            {
+                "status": "success",
+                "completed_at_utc": completed_at.isoformat(),
+                "elapsed_seconds": round((completed_at - started_at).total_seconds(), 6),
+            }
+        )
+        index_path.write_text(json.dumps(corpus_index, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    except Exception as exception:
+        failure = {
+            "status": "failure",
+            "failed_at_utc": datetime.now(timezone.utc).isoformat(),
+            "failure_type": type(exception).__name__,
+            "failure_message": str(exception),
+        }
+        for source_index, run in runs.items():
+            if run["status"] == "running":
+                run.update(failure)
+                entries[source_index]["status"] = "failure"
+                (output / entries[source_index]["directory"] / "run.json").write_text(
+                    json.dumps(run, indent=2, sort_keys=True) + "\n",
+                    encoding="utf-8",
+                )
+        corpus_index.update(failure)
+        index_path.write_text(json.dumps(corpus_index, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        raise
+    finally:
+        for manifest in manifests.values():
+            manifest.close()
+        for segment in segments.values():
+            segment.close()
+            segment.unlink()
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description=(
             "Generate 30 single transforms and all 900 ordered two-transform "
-            "compositions from one source image."
+            "compositions from one source image, or from every image of a corpus."
         )
     )
-    parser.add_argument("source", type=Path)
+    parser.add_argument(
+        "sources",
+        type=Path,
+        nargs="+",
+        help="One source image, or several images and directories for a corpus run.",
+    )
     parser.add_argument("output", type=Path)
     parser.add_argument(
         "--workers",
         type=int,
         default=min(4, os.cpu_count() or 1),
-        help="Pair-generation worker processes (default: up to 4).",
+        help="Worker processes (default: up to 4).",
     )
+    add_cache_arguments(parser)
+    add_output_arguments(parser)
+    add_resume_argument(parser)
     return parser.parse_args()
 
 
+def add_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        help="Directory of a persistent result cache shared across runs.",
+    )
+    parser.add_argument(
+        "--cache-max-bytes",
+        type=int,
+        default=DefaultMaxBytes,
+        help="Evict least-recently-used cache entries beyond this total size.",
+    )
+
+
+def add_resume_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run in output, producing only missing images.",
+    )
+
+
 def main() -> None:
     args = parse_args()
-    generate(args.source, args.output, args.workers)
+    if len(args.sources) == 1 and not args.sources[0].is_dir():
+        generate(
+            args.sources[0],
+            args.output,
+            args.workers,
+            cache_directory=args.cache,
+            cache_max_bytes=args.cache_max_bytes,
+            output_format=output_format_from_arguments(args),
+            writer_threads=args.writer_threads,
+            resume=args.resume,
+        )
+        return
+    if args.resume:
+        raise ValueError("--resume applies to single-source runs only")
+    generate_corpus(
+        corpus_sources(args.sources),
+        args.output,
+        args.workers,
+        cache_directory=args.cache,
+        cache_max_bytes=args.cache_max_bytes,
+        output_format=output_format_from_arguments(args),
+        writer_threads=args.writer_threads,
+    )
 
 
 if __name__ == "__main__":
@@ -7,16 +7,55 @@ module intentionally has no watermark detection or targeted concealment logic.
 
 from __future__ import annotations
 
-from io import BytesIO
+from collections import OrderedDict
+import hashlib
 import math
-import random
+import threading
 from collections.abc import Callable, Sequence
+from typing import Any
 
-from PIL import Image, ImageDraw, ImageEnhance, ImageFilter, ImageOps
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageOps
+
+from perturbation_codecs import round_trips
+from perturbation_random import CounterStream
+import seam_carving
 
 
 FillColor = int | tuple[int, ...]
-PointMapper = Callable[[float, float], tuple[float, float]]
+# Maps arrays of target coordinates to arrays of source coordinates.
+PointMapper = Callable[[np.ndarray, np.ndarray], tuple[np.ndarray, np.ndarray]]
+
+# Version of the seed-to-pixels contract for seeded draws. Bump it whenever
+# the same seed and arguments would produce different pixels, so that
+# manifests written under an older contract are not mistaken for current ones.
+#
+# Contract 2: every seeded transform draws from perturbation_random
+# CounterStreams keyed by (seed, transform name, stream name), at fixed
+# positions, so no draw depends on any other.
+#   additive_sensor_noise: stream "gaussian" holds one float32 standard normal
+#   per color channel at 3 * (row * width + column) + channel; streams "gate"
+#   and "polarity" hold one float64 uniform per pixel at row * width + column,
+#   drawn only when salt_pepper_probability > 0.
+#   elastic_deformation and mesh_warp: a uniform per mesh node axis at
+#   2 * (row * (mesh_columns + 1) + column) + axis.
+#   localized_swirl: the center's x and y at positions 0 and 1.
+#   random_patch_displacement: patch k draws at 4k to 4k + 3 (x, y, signed dx,
+#   signed dy); grid_cell_permutation: swap k draws at 3k to 3k + 2 (column,
+#   row, neighbor); random_non_targeted_cutout: cutout k draws at 4k to
+#   4k + 3 (width, height, x, y).
+SeedContractVersion = 2
+
+# palette_quantization and apply_dithering build their palette from a copy
+# reduced to at most this many pixels.
+PaletteSamplePixels = 1 << 20
+
+# Adaptive palettes kept in memory, keyed by the reduced sample and the color
+# count, so quantizing the same pixels again skips the median cut.
+PaletteCacheEntries = 32
+
+_palette_cache: OrderedDict[tuple[bytes, tuple[int, int], int], Image.Image] = OrderedDict()
+_palette_cache_lock = threading.Lock()
 
 
 __all__ = [
@@ -85,8 +124,11 @@ def _scaled_size(image: Image.Image, x_scale: float, y_scale: float) -> tuple[in
     return max(1, round(image.width * x_scale)), max(1, round(image.height * y_scale))
 
 
-def _clamp(value: float, low: float, high: float) -> float:
-    return max(low, min(high, value))
+# Rows per strip when remapping, which bounds the 16-tap gather working set.
+_RemapStripRows = 256
+
+# Modes the opt-in dense_remap path resamples itself; others always use MESH.
+_RemapModes = ("L", "LA", "RGB", "RGBA")
 
 
 def _mesh_transform(
@@ -96,89 +138,184 @@ def _mesh_transform(
     mapper: PointMapper,
     *,
     fill: FillColor | None = None,
+    dense_remap: bool = False,
 ) -> Image.Image:
     if columns < 1 or rows < 1:
         raise ValueError("mesh dimensions must be positive")
-
-    mesh: list[tuple[tuple[int, int, int, int], tuple[float, ...]]] = []
-    for row in range(rows):
-        y0 = round(row * image.height / rows)
-        y1 = round((row + 1) * image.height / rows)
-        for column in range(columns):
-            x0 = round(column * image.width / columns)
-            x1 = round((column + 1) * image.width / columns)
-            upper_left = mapper(x0, y0)
-            lower_left = mapper(x0, y1)
-            lower_right = mapper(x1, y1)
-            upper_right = mapper(x1, y0)
-            quad = (
-                upper_left[0],
-                upper_left[1],
-                lower_left[0],
-                lower_left[1],
-                lower_right[0],
-                lower_right[1],
-                upper_right[0],
-                upper_right[1],
-            )
-            mesh.append(((x0, y0, x1, y1), quad))
+    fill_color = _default_fill(image) if fill is None else fill
+    x_edges = np.rint(np.arange(columns + 1) * image.width / columns)
+    y_edges = np.rint(np.arange(rows + 1) * image.height / rows)
+    source_x, source_y = mapper(*np.meshgrid(x_edges, y_edges))
+    corners = np.stack((source_x, source_y), axis=-1)
+    if dense_remap and image.mode in _RemapModes:
+        return _remap(image, x_edges, y_edges, corners, fill_color)
+
+    quads = np.concatenate(
+        (
+            corners[:-1, :-1],
+            corners[1:, :-1],
+            corners[1:, 1:],
+            corners[:-1, 1:],
+        ),
+        axis=-1,
+    ).reshape(-1, 8)
+    left, right = x_edges[:-1], x_edges[1:]
+    top, bottom = y_edges[:-1], y_edges[1:]
+    boxes = np.stack(
+        np.broadcast_arrays(left[None, :], top[:, None], right[None, :], bottom[:, None]),
+        axis=-1,
+    ).reshape(-1, 4).astype(int)
+    # A mesh finer than the image has empty boxes; they cover no pixels, and
+    # PIL cannot set up a quad for them.
+    nonempty = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    mesh = list(zip(map(tuple, boxes[nonempty].tolist()), map(tuple, quads[nonempty].tolist())))
 
     return image.transform(
         image.size,
         Image.Transform.MESH,
         mesh,
         resample=Image.Resampling.BICUBIC,
-        fillcolor=_default_fill(image) if fill is None else fill,
+        fillcolor=fill_color,
+    )
+
+
+def _bicubic_weights(fraction: np.ndarray) -> np.ndarray:
+    # Cubic convolution with a = -1, the kernel PIL's transforms use for BICUBIC.
+    squared = fraction * fraction
+    cubed = squared * fraction
+    return np.stack(
+        (
+            -fraction + 2 * squared - cubed,
+            1 - 2 * squared + cubed,
+            fraction + squared - cubed,
+            cubed - squared,
+        )
     )
 
 
+def _inverse_sizes(edges: np.ndarray) -> np.ndarray:
+    """1 / size of each mesh box along one axis; 0 for empty boxes."""
+    sizes = np.diff(edges)
+    return np.where(sizes > 0, 1.0 / np.where(sizes > 0, sizes, 1), 0.0)
+
+
+def _remap(
+    image: Image.Image,
+    x_edges: np.ndarray,
+    y_edges: np.ndarray,
+    corners: np.ndarray,
+    fill: FillColor,
+) -> Image.Image:
+    """Resample the mesh with array arithmetic instead of one PIL call per quad.
+
+    Source points are interpolated from the quad corners with the same
+    bilinear formula, operation order, and pixel-center offsets as PIL's MESH
+    transform. Output pixels therefore fall outside the image, and take the
+    fill color, exactly where MESH fills them. Values inside use PIL's
+    bicubic taps, 8-bit premultiplied alpha, and truncation, and stay within
+    2 levels of MESH. Only used when a transform asks for dense_remap.
+    """
+    pixels = np.asarray(image, dtype=np.int64)
+    if pixels.ndim == 2:
+        pixels = pixels[..., None]
+    height, width, bands = pixels.shape
+    has_alpha = image.mode in ("LA", "RGBA")
+    if has_alpha:
+        # PIL resamples premultiplied RGBa / La, rounded to 8 bits.
+        pixels = pixels.copy()
+        scaled = pixels[..., :-1] * pixels[..., -1:] + 128
+        pixels[..., :-1] = (scaled + (scaled >> 8)) >> 8
+    pixels = pixels.astype(np.float64)
+    fill_pixel = np.array(fill if isinstance(fill, tuple) else (fill,), dtype=np.uint8)
+
+    # PIL's QUAD coefficients for each box, in PIL's operation order.
+    inverse_width = _inverse_sizes(x_edges)[None, :, None]
+    inverse_height = _inverse_sizes(y_edges)[:, None, None]
+    north_west, south_west = corners[:-1, :-1], corners[1:, :-1]
+    south_east, north_east = corners[1:, 1:], corners[:-1, 1:]
+    constant = north_west
+    along_x = (north_east - north_west) * inverse_width
+    along_y = (south_west - north_west) * inverse_height
+    cross = (south_east - south_west - north_east + north_west) * inverse_width * inverse_height
+
+    # Each pixel's box, and its center relative to the box origin.
+    columns = np.arange(width)
+    box_x = np.searchsorted(x_edges, columns, side="right") - 1
+    local_x = (columns - x_edges[box_x] + 0.5)[None, :, None]
+
+    result = np.empty((height, width, bands), dtype=np.uint8)
+    for strip_top in range(0, height, _RemapStripRows):
+        strip_rows = np.arange(strip_top, min(height, strip_top + _RemapStripRows))
+        box_y = np.searchsorted(y_edges, strip_rows, side="right") - 1
+        local_y = (strip_rows - y_edges[box_y] + 0.5)[:, None, None]
+        boxes = (box_y[:, None], box_x[None, :])
+        source = (
+            constant[boxes]
+            + along_x[boxes] * local_x
+            + along_y[boxes] * local_y
+            + cross[boxes] * local_x * local_y
+        )
+        source_x, source_y = source[..., 0], source[..., 1]
+        outside = (source_x < 0) | (source_x >= width) | (source_y < 0) | (source_y >= height)
+
+        sample_x = source_x - 0.5
+        sample_y = source_y - 0.5
+        base_x = np.floor(sample_x)
+        base_y = np.floor(sample_y)
+        x_weights = _bicubic_weights(sample_x - base_x)
+        y_weights = _bicubic_weights(sample_y - base_y)
+        base_x = base_x.astype(np.intp)
+        base_y = base_y.astype(np.intp)
+
+        strip = np.zeros(source_x.shape + (bands,))
+        for row_tap in range(4):
+            tap_y = np.clip(base_y + row_tap - 1, 0, height - 1)
+            row_sum = np.zeros_like(strip)
+            for column_tap in range(4):
+                tap_x = np.clip(base_x + column_tap - 1, 0, width - 1)
+                row_sum += x_weights[column_tap][..., None] * pixels[tap_y, tap_x]
+            strip += y_weights[row_tap][..., None] * row_sum
+
+        # PIL truncates the clamped result, fills in premultiplied space, and
+        # un-premultiplies with integer division, leaving fully opaque and
+        # transparent pixels as is.
+        strip = np.clip(strip, 0, 255).astype(np.uint8)
+        strip[outside] = fill_pixel
+        if has_alpha:
+            alpha = strip[..., -1:].astype(np.int64)
+            partial = (alpha > 0) & (alpha < 255)
+            colour = strip[..., :-1].astype(np.int64) * 255 // np.where(partial, alpha, 1)
+            strip[..., :-1] = np.where(partial, np.minimum(colour, 255), strip[..., :-1])
+        result[strip_top : strip_top + strip.shape[0]] = strip
+
+    return Image.fromarray(result if bands > 1 else result[..., 0])
+
+
 def _smooth_displacement_grid(
     columns: int,
     rows: int,
     amplitude: float,
-    rng: random.Random,
+    stream: CounterStream,
     passes: int,
-) -> list[list[tuple[float, float]]]:
-    grid = [
-        [
-            (
-                rng.uniform(-amplitude, amplitude),
-                rng.uniform(-amplitude, amplitude),
-            )
-            for _ in range(columns + 1)
-        ]
-        for _ in range(rows + 1)
-    ]
-
-    for x in range(columns + 1):
-        grid[0][x] = (0.0, 0.0)
-        grid[rows][x] = (0.0, 0.0)
-    for y in range(rows + 1):
-        grid[y][0] = (0.0, 0.0)
-        grid[y][columns] = (0.0, 0.0)
-
+) -> np.ndarray:
+    """Return a (rows + 1, columns + 1, 2) field of pinned-border offsets."""
+    grid = stream.uniform(0, (rows + 1) * (columns + 1) * 2, -amplitude, amplitude)
+    grid = grid.reshape(rows + 1, columns + 1, 2)
+    interior = (slice(1, -1), slice(1, -1))
+    pinned = np.zeros_like(grid)
+    pinned[interior] = grid[interior]
+    grid = pinned
+
+    # Five-point averaging stencil; the border stays pinned at zero.
     for _ in range(passes):
-        smoothed: list[list[tuple[float, float]]] = []
-        for y in range(rows + 1):
-            smoothed_row: list[tuple[float, float]] = []
-            for x in range(columns + 1):
-                if x in (0, columns) or y in (0, rows):
-                    smoothed_row.append((0.0, 0.0))
-                    continue
-                neighbors = [
-                    grid[y][x],
-                    grid[y - 1][x],
-                    grid[y + 1][x],
-                    grid[y][x - 1],
-                    grid[y][x + 1],
-                ]
-                smoothed_row.append(
-                    (
-                        sum(point[0] for point in neighbors) / len(neighbors),
-                        sum(point[1] for point in neighbors) / len(neighbors),
-                    )
-                )
-            smoothed.append(smoothed_row)
+        smoothed = np.zeros_like(grid)
+        smoothed[interior] = (
+            grid[1:-1, 1:-1]
+            + grid[:-2, 1:-1]
+            + grid[2:, 1:-1]
+            + grid[1:-1, :-2]
+            + grid[1:-1, 2:]
+        ) / 5
         grid = smoothed
 
     return grid
@@ -188,33 +325,23 @@ def _grid_mapper(
     image: Image.Image,
     columns: int,
     rows: int,
-    grid: list[list[tuple[float, float]]],
+    grid: np.ndarray,
 ) -> PointMapper:
-    def mapper(x: float, y: float) -> tuple[float, float]:
-        gx = _clamp(x / image.width * columns, 0, columns)
-        gy = _clamp(y / image.height * rows, 0, rows)
-        column = min(columns - 1, int(gx))
-        row = min(rows - 1, int(gy))
-        tx = gx - column
-        ty = gy - row
-
-        top_left = grid[row][column]
-        top_right = grid[row][column + 1]
-        bottom_left = grid[row + 1][column]
-        bottom_right = grid[row + 1][column + 1]
-        dx = (
-            top_left[0] * (1 - tx) * (1 - ty)
-            + top_right[0] * tx * (1 - ty)
-            + bottom_left[0] * (1 - tx) * ty
-            + bottom_right[0] * tx * ty
+    def mapper(x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        gx = np.clip(x / image.width * columns, 0, columns)
+        gy = np.clip(y / image.height * rows, 0, rows)
+        column = np.minimum(columns - 1, gx.astype(np.intp))
+        row = np.minimum(rows - 1, gy.astype(np.intp))
+        tx = (gx - column)[..., None]
+        ty = (gy - row)[..., None]
+
+        offset = (
+            grid[row, column] * (1 - tx) * (1 - ty)
+            + grid[row, column + 1] * tx * (1 - ty)
+            + grid[row + 1, column] * (1 - tx) * ty
+            + grid[row + 1, column + 1] * tx * ty
         )
-        dy = (
-            top_left[1] * (1 - tx) * (1 - ty)
-            + top_right[1] * tx * (1 - ty)
-            + bottom_left[1] * (1 - tx) * ty
-            + bottom_right[1] * tx * ty
-        )
-        return x + dx, y + dy
+        return x + offset[..., 0], y + offset[..., 1]
 
     return mapper
 
@@ -373,6 +500,7 @@ def radial_lens_distortion(
     strength: float = 0.08,
     mesh_size: int = 18,
     fill: FillColor | None = None,
+    dense_remap: bool = False,
 ) -> Image.Image:
     """Apply barrel (positive) or pincushion (negative) radial distortion."""
     _require_image(image)
@@ -382,14 +510,14 @@ def radial_lens_distortion(
     center_y = image.height / 2
     radius = max(center_x, center_y)
 
-    def mapper(x: float, y: float) -> tuple[float, float]:
+    def mapper(x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
         nx = (x - center_x) / radius
         ny = (y - center_y) / radius
         radius_squared = nx * nx + ny * ny
         factor = 1 + strength * radius_squared
         return center_x + nx * factor * radius, center_y + ny * factor * radius
 
-    return _mesh_transform(image, mesh_size, mesh_size, mapper, fill=fill)
+    return _mesh_transform(image, mesh_size, mesh_size, mapper, fill=fill, dense_remap=dense_remap)
 
 
 def elastic_deformation(
@@ -401,6 +529,7 @@ def elastic_deformation(
     smoothing_passes: int = 3,
     seed: int = 0,
     fill: FillColor | None = None,
+    dense_remap: bool = False,
 ) -> Image.Image:
     """Warp through a seeded, smoothed random displacement field."""
     _require_image(image)
@@ -412,11 +541,11 @@ def elastic_deformation(
         mesh_columns,
         mesh_rows,
         amplitude,
-        random.Random(seed),
+        CounterStream(seed, "elastic_deformation"),
         smoothing_passes,
     )
     mapper = _grid_mapper(image, mesh_columns, mesh_rows, grid)
-    return _mesh_transform(image, mesh_columns, mesh_rows, mapper, fill=fill)
+    return _mesh_transform(image, mesh_columns, mesh_rows, mapper, fill=fill, dense_remap=dense_remap)
 
 
 def wave_displacement(
@@ -427,6 +556,7 @@ def wave_displacement(
     angle_degrees: float = 0.0,
     mesh_size: int = 24,
     fill: FillColor | None = None,
+    dense_remap: bool = False,
 ) -> Image.Image:
     """Displace pixels with a smooth sinusoidal field."""
     _require_image(image)
@@ -436,12 +566,12 @@ def wave_displacement(
     direction_x = math.cos(angle)
     direction_y = math.sin(angle)
 
-    def mapper(x: float, y: float) -> tuple[float, float]:
+    def mapper(x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
         phase = 2 * math.pi * cycles * y / max(1, image.height)
-        offset = amplitude * math.sin(phase)
+        offset = amplitude * np.sin(phase)
         return x + direction_x * offset, y + direction_y * offset
 
-    return _mesh_transform(image, mesh_size, mesh_size, mapper, fill=fill)
+    return _mesh_transform(image, mesh_size, mesh_size, mapper, fill=fill, dense_remap=dense_remap)
 
 
 def mesh_warp(
@@ -452,6 +582,7 @@ def mesh_warp(
     mesh_rows: int = 6,
     seed: int = 0,
     fill: FillColor | None = None,
+    dense_remap: bool = False,
 ) -> Image.Image:
     """Move a seeded control mesh and interpolate smoothly between nodes."""
     _require_image(image)
@@ -461,11 +592,11 @@ def mesh_warp(
         mesh_columns,
         mesh_rows,
         amplitude,
-        random.Random(seed),
+        CounterStream(seed, "mesh_warp"),
         1,
     )
     mapper = _grid_mapper(image, mesh_columns, mesh_rows, grid)
-    return _mesh_transform(image, mesh_columns, mesh_rows, mapper, fill=fill)
+    return _mesh_transform(image, mesh_columns, mesh_rows, mapper, fill=fill, dense_remap=dense_remap)
 
 
 def localized_swirl(
@@ -476,33 +607,33 @@ def localized_swirl(
     mesh_size: int = 28,
     seed: int = 0,
     fill: FillColor | None = None,
+    dense_remap: bool = False,
 ) -> Image.Image:
     """Apply a seeded swirl at a random interior location."""
     _require_image(image)
     if not 0 < radius_fraction <= 1:
         raise ValueError("radius_fraction must be in (0, 1]")
-    rng = random.Random(seed)
-    center_x = rng.uniform(image.width * 0.3, image.width * 0.7)
-    center_y = rng.uniform(image.height * 0.3, image.height * 0.7)
+    stream = CounterStream(seed, "localized_swirl")
+    center_x = stream.uniform_at(0, image.width * 0.3, image.width * 0.7)
+    center_y = stream.uniform_at(1, image.height * 0.3, image.height * 0.7)
     radius = min(image.size) * radius_fraction
     maximum_angle = math.radians(strength_degrees)
 
-    def mapper(x: float, y: float) -> tuple[float, float]:
+    def mapper(x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
         dx = x - center_x
         dy = y - center_y
-        distance = math.hypot(dx, dy)
-        if distance >= radius:
-            return x, y
-        falloff = (1 - distance / radius) ** 2
+        distance = np.hypot(dx, dy)
+        falloff = np.clip(1 - distance / radius, 0, None) ** 2
         angle = maximum_angle * falloff
-        cosine = math.cos(angle)
-        sine = math.sin(angle)
+        cosine = np.cos(angle)
+        sine = np.sin(angle)
+        inside = distance < radius
         return (
-            center_x + cosine * dx - sine * dy,
-            center_y + sine * dx + cosine * dy,
+            np.where(inside, center_x + cosine * dx - sine * dy, x),
+            np.where(inside, center_y + sine * dx + cosine * dy, y),
         )
 
-    return _mesh_transform(image, mesh_size, mesh_size, mapper, fill=fill)
+    return _mesh_transform(image, mesh_size, mesh_size, mapper, fill=fill, dense_remap=dense_remap)
 
 
 def random_patch_displacement(
@@ -521,18 +652,22 @@ def random_patch_displacement(
         raise ValueError("patch_fraction must be in (0, 1)")
     _require_fraction("maximum_offset_fraction", maximum_offset_fraction)
 
-    rng = random.Random(seed)
+    stream = CounterStream(seed, "random_patch_displacement")
     result = image.copy()
     patch_width = max(1, round(image.width * patch_fraction))
     patch_height = max(1, round(image.height * patch_fraction))
     max_dx = max(1, round(image.width * maximum_offset_fraction))
     max_dy = max(1, round(image.height * maximum_offset_fraction))
 
-    for _ in range(patch_count):
-        x1 = rng.randint(0, image.width - patch_width)
-        y1 = rng.randint(0, image.height - patch_height)
-        dx = rng.choice((-1, 1)) * rng.randint(1, max_dx)
-        dy = rng.choice((-1, 1)) * rng.randint(1, max_dy)
+    def nonzero_offset(position: int, limit: int) -> int:
+        offset = stream.integer_at(position, -limit, limit)
+        return offset if offset < 0 else offset + 1
+
+    for patch in range(patch_count):
+        x1 = stream.integer_at(4 * patch, 0, image.width - patch_width + 1)
+        y1 = stream.integer_at(4 * patch + 1, 0, image.height - patch_height + 1)
+        dx = nonzero_offset(4 * patch + 2, max_dx)
+        dy = nonzero_offset(4 * patch + 3, max_dy)
         x2 = max(0, min(image.width - patch_width, x1 + dx))
         y2 = max(0, min(image.height - patch_height, y1 + dy))
         first_box = (x1, y1, x1 + patch_width, y1 + patch_height)
@@ -560,7 +695,7 @@ def grid_cell_permutation(
     if swap_count < 1:
         raise ValueError("swap_count must be positive")
 
-    rng = random.Random(seed)
+    stream = CounterStream(seed, "grid_cell_permutation")
     result = image.copy()
 
     def cell_box(column: int, row: int) -> tuple[int, int, int, int]:
@@ -571,9 +706,9 @@ def grid_cell_permutation(
             round((row + 1) * image.height / rows),
         )
 
-    for _ in range(swap_count):
-        column = rng.randrange(columns)
-        row = rng.randrange(rows)
+    for swap in range(swap_count):
+        column = stream.integer_at(3 * swap, 0, columns)
+        row = stream.integer_at(3 * swap + 1, 0, rows)
         neighbors = [
             (candidate_column, candidate_row)
             for candidate_column, candidate_row in (
@@ -584,7 +719,7 @@ def grid_cell_permutation(
             )
             if 0 <= candidate_column < columns and 0 <= candidate_row < rows
         ]
-        other_column, other_row = rng.choice(neighbors)
+        other_column, other_row = neighbors[stream.integer_at(3 * swap + 2, 0, len(neighbors))]
         first_box = cell_box(column, row)
         second_box = cell_box(other_column, other_row)
         first_patch = result.crop(first_box)
@@ -597,82 +732,35 @@ def grid_cell_permutation(
     return result
 
 
-def _pixel_luminance(pixel: int | tuple[int, ...]) -> int:
-    if isinstance(pixel, int):
-        return pixel
-    if len(pixel) < 3:
-        return pixel[0]
-    return round(0.299 * pixel[0] + 0.587 * pixel[1] + 0.114 * pixel[2])
-
-
-def _remove_one_vertical_seam(
-    pixel_rows: list[list[int | tuple[int, ...]]],
-    luminance_rows: list[list[int]],
-) -> None:
-    height = len(luminance_rows)
-    width = len(luminance_rows[0])
-    energy: list[list[int]] = [[0] * width for _ in range(height)]
-    for y in range(height):
-        above = max(0, y - 1)
-        below = min(height - 1, y + 1)
-        for x in range(width):
-            left = max(0, x - 1)
-            right = min(width - 1, x + 1)
-            energy[y][x] = (
-                abs(luminance_rows[y][right] - luminance_rows[y][left])
-                + abs(luminance_rows[below][x] - luminance_rows[above][x])
-            )
-
-    cumulative = energy[0][:]
-    parents: list[list[int]] = [[0] * width for _ in range(height)]
-    for y in range(1, height):
-        next_cumulative = [0] * width
-        for x in range(width):
-            candidates = range(max(0, x - 1), min(width, x + 2))
-            parent_x = min(candidates, key=lambda candidate: cumulative[candidate])
-            parents[y][x] = parent_x
-            next_cumulative[x] = energy[y][x] + cumulative[parent_x]
-        cumulative = next_cumulative
-
-    seam_x = min(range(width), key=lambda x: cumulative[x])
-    seam = [0] * height
-    seam[-1] = seam_x
-    for y in range(height - 1, 0, -1):
-        seam[y - 1] = parents[y][seam[y]]
-
-    for y, x in enumerate(seam):
-        del pixel_rows[y][x]
-        del luminance_rows[y][x]
-
-
 def content_aware_seam_compress(
     image: Image.Image,
     *,
     width_fraction: float = 0.02,
+    height_fraction: float = 0.0,
     restore_size: bool = True,
 ) -> Image.Image:
-    """Remove low-energy vertical seams, optionally restoring original size."""
+    """Remove low-energy seams, optionally restoring original size.
+
+    Vertical seams remove width_fraction of the columns; horizontal seams then
+    remove height_fraction of the rows.
+    """
     _require_image(image)
     if not 0 < width_fraction < 1:
         raise ValueError("width_fraction must be in (0, 1)")
-    seams = max(1, round(image.width * width_fraction))
-    if seams >= image.width:
+    _require_fraction("height_fraction", height_fraction)
+    vertical_seams = max(1, round(image.width * width_fraction))
+    horizontal_seams = (
+        max(1, round(image.height * height_fraction)) if height_fraction else 0
+    )
+    if vertical_seams >= image.width:
         raise ValueError("width_fraction removes the entire image")
+    if horizontal_seams >= image.height:
+        raise ValueError("height_fraction removes the entire image")
 
-    pixels = list(image.get_flattened_data())
-    pixel_rows = [
-        pixels[y * image.width : (y + 1) * image.width]
-        for y in range(image.height)
-    ]
-    luminance_rows = [
-        [_pixel_luminance(pixel) for pixel in row]
-        for row in pixel_rows
-    ]
-    for _ in range(seams):
-        _remove_one_vertical_seam(pixel_rows, luminance_rows)
-
-    compressed = Image.new(image.mode, (image.width - seams, image.height))
-    compressed.putdata([pixel for row in pixel_rows for pixel in row])
+    compressed = seam_carving.carve_to_size(
+        image,
+        (image.width - vertical_seams, image.height - horizontal_seams),
+    )
     if not restore_size:
         return compressed
     return compressed.resize(image.size, Image.Resampling.LANCZOS)
@@ -764,17 +852,12 @@ def jpeg_recompression(
         raise ValueError("quality must be in [1, 100]")
     if subsampling not in (0, 1, 2):
         raise ValueError("subsampling must be 0, 1, or 2")
-    buffer = BytesIO()
-    image.convert("RGB").save(
-        buffer,
-        format="JPEG",
-        quality=quality,
-        subsampling=subsampling,
-        optimize=False,
+    source = image if image.mode == "RGB" else image.convert("RGB")
+    return round_trips.run(
+        source,
+        "JPEG",
+        {"quality": quality, "subsampling": subsampling, "optimize": False},
     )
-    buffer.seek(0)
-    with Image.open(buffer) as decoded:
-        return decoded.copy()
 
 
 def webp_recompression(
@@ -789,11 +872,51 @@ def webp_recompression(
         raise ValueError("quality must be in [1, 100]")
     if not 0 <= method <= 6:
         raise ValueError("method must be in [0, 6]")
-    buffer = BytesIO()
-    image.save(buffer, format="WEBP", quality=quality, method=method, lossless=False)
-    buffer.seek(0)
-    with Image.open(buffer) as decoded:
-        return decoded.copy()
+    return round_trips.run(
+        image,
+        "WEBP",
+        {"quality": quality, "method": method, "lossless": False},
+    )
+
+
+def _palette_reduction(size: tuple[int, int]) -> int:
+    """Return the reduce factor that brings an image to PaletteSamplePixels."""
+    width, height = size
+    return max(1, math.ceil(math.sqrt(width * height / PaletteSamplePixels)))
+
+
+def _adaptive_palette(sample: Image.Image, colors: int) -> Image.Image:
+    """Return a 1x1 palette image holding the median-cut palette of an RGB sample."""
+    key = (hashlib.blake2b(sample.tobytes(), digest_size=16).digest(), sample.size, colors)
+    with _palette_cache_lock:
+        palette = _palette_cache.get(key)
+        if palette is not None:
+            _palette_cache.move_to_end(key)
+            return palette
+    quantized = sample.quantize(colors=colors, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+    palette = Image.new("P", (1, 1))
+    palette.putpalette(quantized.getpalette())
+    quantized.close()
+    # Evicted palettes are not closed; another thread may still be using one.
+    with _palette_cache_lock:
+        palette = _palette_cache.setdefault(key, palette)
+        _palette_cache.move_to_end(key)
+        if len(_palette_cache) > PaletteCacheEntries:
+            _palette_cache.popitem(last=False)
+    return palette
+
+
+def _quantize(image: Image.Image, colors: int, dither: Image.Dither) -> Image.Image:
+    # The palette comes from a reduced copy; mapping the full image onto it,
+    # with or without error diffusion, is one pass in Pillow.
+    _require_image(image)
+    if not 2 <= colors <= 256:
+        raise ValueError("colors must be in [2, 256]")
+    source = image.convert("RGB")
+    factor = _palette_reduction(source.size)
+    sample = source.reduce(factor) if factor > 1 else source
+    palette = _adaptive_palette(sample, colors)
+    return source.quantize(palette=palette, dither=dither).convert("RGB")
 
 
 def palette_quantization(
@@ -802,16 +925,7 @@ def palette_quantization(
     colors: int = 64,
 ) -> Image.Image:
     """Reduce the image to a limited adaptive palette and return RGB pixels."""
-    _require_image(image)
-    if not 2 <= colors <= 256:
-        raise ValueError("colors must be in [2, 256]")
-    source = image.convert("RGB")
-    quantized = source.quantize(
-        colors=colors,
-        method=Image.Quantize.MEDIANCUT,
-        dither=Image.Dither.NONE,
-    )
-    return quantized.convert("RGB")
+    return _quantize(image, colors, Image.Dither.NONE)
 
 
 def apply_dithering(
@@ -820,14 +934,7 @@ def apply_dithering(
     colors: int = 32,
 ) -> Image.Image:
     """Quantize with Floyd-Steinberg error-diffusion dithering."""
-    _require_image(image)
-    if not 2 <= colors <= 256:
-        raise ValueError("colors must be in [2, 256]")
-    return image.convert("RGB").quantize(
-        colors=colors,
-        method=Image.Quantize.MEDIANCUT,
-        dither=Image.Dither.FLOYDSTEINBERG,
-    ).convert("RGB")
+    return _quantize(image, colors, Image.Dither.FLOYDSTEINBERG)
 
 
 def gaussian_blur(
@@ -885,37 +992,79 @@ def additive_sensor_noise(
 ) -> Image.Image:
     """Add seeded Gaussian noise and optional salt-and-pepper impulses."""
     _require_image(image)
-    if standard_deviation < 0:
-        raise ValueError("standard_deviation must not be negative")
-    if not 0 <= salt_pepper_probability <= 1:
-        raise ValueError("salt_pepper_probability must be in [0, 1]")
+    _sensor_noise_settings(
+        standard_deviation=standard_deviation,
+        salt_pepper_probability=salt_pepper_probability,
+        seed=seed,
+    )
 
     original_mode = image.mode
     has_alpha = original_mode in ("RGBA", "LA")
     source = image.convert("RGBA" if has_alpha else "RGB")
-    rng = random.Random(seed)
-    result_pixels: list[tuple[int, ...]] = []
-
-    for pixel in source.get_flattened_data():
-        channels = list(pixel)
-        color_count = 3
-        if rng.random() < salt_pepper_probability:
-            impulse = 0 if rng.random() < 0.5 else 255
-            channels[:color_count] = [impulse] * color_count
-        else:
-            channels[:color_count] = [
-                round(_clamp(channel + rng.gauss(0, standard_deviation), 0, 255))
-                for channel in channels[:color_count]
-            ]
-        result_pixels.append(tuple(channels))
-
-    result = Image.new(source.mode, source.size)
-    result.putdata(result_pixels)
+    result = Image.fromarray(
+        _sensor_noise_array(
+            np.asarray(source),
+            standard_deviation,
+            salt_pepper_probability,
+            seed,
+        )
+    )
     if original_mode in ("RGB", "RGBA"):
         return result
     return result.convert(original_mode)
 
 
+def _sensor_noise_settings(**arguments: Any) -> tuple[float, float, int]:
+    """Validate additive_sensor_noise arguments and fill in its defaults.
+
+    Returns (standard_deviation, salt_pepper_probability, seed) for
+    _sensor_noise_array; the array kernels call this instead of keeping
+    their own copy of the defaults.
+    """
+    defaults = additive_sensor_noise.__kwdefaults__
+    unknown = sorted(set(arguments) - set(defaults))
+    if unknown:
+        raise TypeError(f"additive_sensor_noise got unexpected arguments: {', '.join(unknown)}")
+    settings = {**defaults, **arguments}
+    standard_deviation = settings["standard_deviation"]
+    salt_pepper_probability = settings["salt_pepper_probability"]
+    if standard_deviation < 0:
+        raise ValueError("standard_deviation must not be negative")
+    if not 0 <= salt_pepper_probability <= 1:
+        raise ValueError("salt_pepper_probability must be in [0, 1]")
+    return standard_deviation, salt_pepper_probability, settings["seed"]
+
+
+def _sensor_noise_array(
+    pixels: np.ndarray,
+    standard_deviation: float,
+    salt_pepper_probability: float,
+    seed: int,
+    top: int = 0,
+) -> np.ndarray:
+    # Draws are addressed by absolute pixel position, so a full-width strip
+    # whose first row is top gets the noise of those rows of the whole image,
+    # in any order and on any worker.
+    height, width = pixels.shape[:2]
+    first = top * width
+    noise = CounterStream(seed, "additive_sensor_noise", "gaussian").normal(3 * first, 3 * height * width)
+    noise = noise.reshape(height, width, 3)
+    noise *= standard_deviation
+    noise += pixels[..., :3]
+    np.rint(noise, out=noise)
+    np.clip(noise, 0, 255, out=noise)
+
+    result = pixels.copy()
+    result[..., :3] = noise
+    if salt_pepper_probability > 0:
+        gate_stream = CounterStream(seed, "additive_sensor_noise", "gate")
+        polarity_stream = CounterStream(seed, "additive_sensor_noise", "polarity")
+        impulses = gate_stream.uniform(first, height * width).reshape(height, width) < salt_pepper_probability
+        polarity = polarity_stream.uniform(first, height * width).reshape(height, width) < 0.5
+        result[impulses, :3] = np.where(polarity[impulses], 0, 255)[:, None]
+    return result
+
+
 def gamma_contrast_remap(
     image: Image.Image,
     *,
@@ -926,28 +1075,29 @@ def gamma_contrast_remap(
     _require_image(image)
     if gamma <= 0 or contrast < 0:
         raise ValueError("gamma must be positive and contrast must not be negative")
-    lookup = [
-        round(255 * ((value / 255) ** (1 / gamma)))
-        for value in range(256)
-    ]
+    source = image if image.mode in ("RGB", "RGBA") else image.convert("RGB")
+    alpha_table = list(range(256)) if source.mode == "RGBA" else []
+    mapped = source.point(_gamma_lookup(gamma).tolist() * 3 + alpha_table)
+
+    # ImageEnhance.Contrast blends toward the rounded mean luminance; as a
+    # table, the blend runs in the same single point pass as the gamma map.
+    with mapped.convert("L") as luminance:
+        histogram = luminance.histogram()
+    mean = int(sum(level * count for level, count in enumerate(histogram)) / (source.width * source.height) + 0.5)
+    adjusted = mapped.point(_contrast_lookup(mean, contrast).tolist() * 3 + alpha_table)
+    mapped.close()
+    return adjusted if adjusted.mode == image.mode else adjusted.convert(image.mode)
+
+
+def _gamma_lookup(gamma: float) -> np.ndarray:
+    return np.array([round(255 * ((value / 255) ** (1 / gamma))) for value in range(256)])
 
-    if image.mode == "RGBA":
-        red, green, blue, alpha = image.split()
-        remapped = Image.merge(
-            "RGB",
-            (red.point(lookup), green.point(lookup), blue.point(lookup)),
-        )
-        adjusted = ImageEnhance.Contrast(remapped).enhance(contrast)
-        adjusted.putalpha(alpha)
-        return adjusted
-    if image.mode == "RGB":
-        channels = [channel.point(lookup) for channel in image.split()]
-        return ImageEnhance.Contrast(Image.merge("RGB", channels)).enhance(contrast)
 
-    converted = image.convert("RGB")
-    channels = [channel.point(lookup) for channel in converted.split()]
-    adjusted = ImageEnhance.Contrast(Image.merge("RGB", channels)).enhance(contrast)
-    return adjusted.convert(image.mode)
+def _contrast_lookup(mean: int, contrast: float) -> np.ndarray:
+    # ImageEnhance.Contrast blends toward the mean gray in float32 and
+    # truncates, clipping only when it extrapolates.
+    blended = np.float32(mean) + np.float32(contrast) * (np.arange(256) - mean).astype(np.float32)
+    return np.clip(np.trunc(blended), 0, 255).astype(np.int64)
 
 
 def chroma_subsample_and_channel_shift(
@@ -1015,22 +1165,22 @@ def random_non_targeted_cutout(
     if shape not in ("rectangle", "ellipse"):
         raise ValueError("shape must be 'rectangle' or 'ellipse'")
 
-    rng = random.Random(seed)
+    stream = CounterStream(seed, "random_non_targeted_cutout")
     result = image.copy()
     draw = ImageDraw.Draw(result)
     cutout_fill = _default_fill(image) if fill is None else fill
 
-    for _ in range(count):
+    for cutout in range(count):
         width = max(
             1,
-            round(image.width * rng.uniform(minimum_fraction, maximum_fraction)),
+            round(image.width * stream.uniform_at(4 * cutout, minimum_fraction, maximum_fraction)),
         )
         height = max(
             1,
-            round(image.height * rng.uniform(minimum_fraction, maximum_fraction)),
+            round(image.height * stream.uniform_at(4 * cutout + 1, minimum_fraction, maximum_fraction)),
         )
-        x = rng.randint(0, image.width - width)
-        y = rng.randint(0, image.height - height)
+        x = stream.integer_at(4 * cutout + 2, 0, image.width - width + 1)
+        y = stream.integer_at(4 * cutout + 3, 0, image.height - height + 1)
         box = (x, y, x + width, y + height)
         if shape == "rectangle":
             draw.rectangle(box, fill=cutout_fill)
@@ -0,0 +1,184 @@
+"""Apply one perturbation to a stack of same-size images.
+
+A stack holds count images of one mode and size in a single contiguous uint8
+array shaped (count, height, width, bands). Mode conversion happens once when
+the stack is built, each image is handed to the transform as a view of the
+stack, and the output stack is allocated once after the first result fixes
+its shape and mode. Transforms with an array kernel skip PIL entirely.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import inspect
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+import image_perturbations as perturb
+
+
+StackBands = {"L": 1, "LA": 2, "RGB": 3, "RGBA": 4}
+
+ArrayKernel = Callable[..., np.ndarray]
+
+
+def _sensor_noise_kernel(pixels: np.ndarray, **arguments: Any) -> np.ndarray:
+    return perturb._sensor_noise_array(pixels, *perturb._sensor_noise_settings(**arguments))
+
+
+# Kernels that reproduce the PIL path exactly for the listed modes.
+ArrayKernels: dict[str, tuple[tuple[str, ...], ArrayKernel]] = {
+    "additive_sensor_noise": (("RGB", "RGBA"), _sensor_noise_kernel),
+}
+
+
+@dataclass(frozen=True)
+class ImageStack:
+    pixels: np.ndarray
+    mode: str
+
+    def __post_init__(self) -> None:
+        if self.mode not in StackBands:
+            raise ValueError(f"stack mode must be one of {sorted(StackBands)}")
+        if self.pixels.dtype != np.uint8 or self.pixels.ndim != 4:
+            raise ValueError("stack pixels must be a uint8 (count, height, width, bands) array")
+        if self.pixels.shape[3] != StackBands[self.mode]:
+            raise ValueError(f"mode {self.mode} needs {StackBands[self.mode]} bands")
+        if not self.pixels.flags.c_contiguous:
+            raise ValueError("stack pixels must be C-contiguous")
+
+    @classmethod
+    def from_images(cls, images: Sequence[Image.Image], mode: str) -> ImageStack:
+        if not images:
+            raise ValueError("images must not be empty")
+        if len({image.size for image in images}) != 1:
+            raise ValueError("every image in a stack must have the same size")
+        if mode not in StackBands:
+            raise ValueError(f"stack mode must be one of {sorted(StackBands)}")
+        width, height = images[0].size
+        pixels = np.empty((len(images), height, width, StackBands[mode]), dtype=np.uint8)
+        for index, image in enumerate(images):
+            converted = image if image.mode == mode else image.convert(mode)
+            pixels[index] = np.asarray(converted).reshape(height, width, -1)
+        return cls(pixels, mode)
+
+    @classmethod
+    def repeat(cls, image: Image.Image, count: int, mode: str) -> ImageStack:
+        """Stack count copies of one source, converting it only once."""
+        if count < 1:
+            raise ValueError("count must be positive")
+        single = cls.from_images([image], mode)
+        return cls(np.repeat(single.pixels, count, axis=0), mode)
+
+    @property
+    def count(self) -> int:
+        return self.pixels.shape[0]
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.pixels.shape[2], self.pixels.shape[1]
+
+    def view(self, index: int) -> Image.Image:
+        """Return image index; zero-copy for modes PIL can map directly."""
+        return Image.frombuffer(self.mode, self.size, self.pixels[index], "raw", self.mode, 0, 1)
+
+    def images(self) -> list[Image.Image]:
+        return [self.view(index).copy() for index in range(self.count)]
+
+
+def _per_image_arguments(
+    count: int,
+    seeds: Sequence[int] | None,
+    arguments: Mapping[str, Any] | Sequence[Mapping[str, Any]] | None,
+    accepts_seed: bool,
+) -> list[dict[str, Any]]:
+    if arguments is None:
+        per_image = [{} for _ in range(count)]
+    elif isinstance(arguments, Mapping):
+        per_image = [dict(arguments) for _ in range(count)]
+    else:
+        if len(arguments) != count:
+            raise ValueError(f"expected {count} argument mappings, got {len(arguments)}")
+        per_image = [dict(item) for item in arguments]
+
+    if seeds is not None:
+        if not accepts_seed:
+            raise ValueError("seeds were given for a transform without a seed parameter")
+        if len(seeds) != count:
+            raise ValueError(f"expected {count} seeds, got {len(seeds)}")
+        for item, seed in zip(per_image, seeds, strict=True):
+            if "seed" in item:
+                raise ValueError("seed must come from seeds or arguments, not both")
+            item["seed"] = seed
+    return per_image
+
+
+def apply_to_stack(
+    function_name: str,
+    stack: ImageStack,
+    *,
+    seeds: Sequence[int] | None = None,
+    arguments: Mapping[str, Any] | Sequence[Mapping[str, Any]] | None = None,
+    workers: int = 1,
+) -> ImageStack:
+    """Apply one transform to every image in a stack and return a new stack.
+
+    arguments is either one mapping shared by all images or one mapping per
+    image; seeds, when given, supplies the seed argument per image. Every
+    result must share one size and mode, or the batch fails.
+    """
+    if function_name not in perturb.__all__:
+        raise ValueError(f"Unknown perturbation: {function_name}")
+    if workers < 1:
+        raise ValueError("workers must be positive")
+    function = getattr(perturb, function_name)
+    accepts_seed = "seed" in inspect.signature(function).parameters
+    per_image = _per_image_arguments(stack.count, seeds, arguments, accepts_seed)
+
+    kernel_modes, kernel = ArrayKernels.get(function_name, ((), None))
+    if kernel is not None and stack.mode in kernel_modes:
+        output = np.empty_like(stack.pixels)
+
+        def run_kernel(index: int) -> None:
+            output[index] = kernel(stack.pixels[index], **per_image[index])
+
+        _run_indexed(run_kernel, range(stack.count), workers)
+        return ImageStack(output, stack.mode)
+
+    first = function(stack.view(0), **per_image[0])
+    if first.mode not in StackBands:
+        raise ValueError(f"{function_name} returned unsupported stack mode {first.mode}")
+    output = np.empty(
+        (stack.count, first.height, first.width, StackBands[first.mode]),
+        dtype=np.uint8,
+    )
+
+    def store(index: int, result: Image.Image) -> None:
+        if result.mode != first.mode or result.size != first.size:
+            raise ValueError(
+                f"{function_name} produced {result.mode} {result.size} for image "
+                f"{index}, expected {first.mode} {first.size}"
+            )
+        output[index] = np.asarray(result).reshape(output.shape[1:])
+        result.close()
+
+    def run_transform(index: int) -> None:
+        store(index, function(stack.view(index), **per_image[index]))
+
+    store(0, first)
+    _run_indexed(run_transform, range(1, stack.count), workers)
+    return ImageStack(output, first.mode)
+
+
+def _run_indexed(task: Callable[[int], None], indices: range, workers: int) -> None:
+    if workers == 1 or len(indices) < 2:
+        for index in indices:
+            task(index)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(task, index) for index in indices]:
+            future.result()
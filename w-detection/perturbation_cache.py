@@ -0,0 +1,252 @@
+"""Content-addressed on-disk cache of perturbation results.
+
+A result is keyed by the source image sha256, the ordered (function, recorded
+arguments) steps that produced it, and a module stamp. The stamp hashes the
+perturbation sources, the seed contract version, and the Pillow and NumPy
+versions, so any change that could alter pixels starts a fresh key space.
+
+Pixels are stored as raw image bytes, one file per key, and an SQLite index
+holds each entry's mode, size, palette, payload sha256, and last use. The
+cache evicts least-recently-used entries once its total payload exceeds
+max_bytes. Reads verify the payload hash and fail closed on a mismatch.
+
+Several processes may share one cache directory. Every change to the index
+and the object files it points at runs inside one BEGIN IMMEDIATE
+transaction, and a read whose object was evicted by another process counts
+as a miss.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+from pathlib import Path
+import sqlite3
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+import PIL
+from PIL import Image
+
+import image_perturbations as perturb
+
+if TYPE_CHECKING:
+    from generate_variants import TransformSpec
+
+
+CacheFormatVersion = 1
+
+DefaultMaxBytes = 4 * 1024**3
+
+_StampedModules = (
+    "image_perturbations.py",
+    "perturbation_codecs.py",
+    "perturbation_random.py",
+    "seam_carving.py",
+)
+
+
+def module_stamp() -> str:
+    """Hash everything besides the inputs that decides a result's pixels."""
+    digest = hashlib.sha256()
+    directory = Path(perturb.__file__).parent
+    for name in _StampedModules:
+        digest.update(name.encode("utf-8") + b"\0")
+        digest.update((directory / name).read_bytes())
+    versions = (
+        CacheFormatVersion,
+        perturb.SeedContractVersion,
+        PIL.__version__,
+        np.__version__,
+    )
+    digest.update(json.dumps(versions).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def canonical_steps(pipeline: Sequence[TransformSpec]) -> list[list[Any]]:
+    return [[spec.function_name, spec.recorded_arguments] for spec in pipeline]
+
+
+class PerturbationCache:
+    def __init__(self, directory: Path, *, max_bytes: int) -> None:
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be positive")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stamp = module_stamp()
+        (directory / "objects").mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(directory / "index.sqlite", timeout=60, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, "
+            "size INTEGER NOT NULL, "
+            "payload_sha256 TEXT NOT NULL, "
+            "mode TEXT NOT NULL, "
+            "width INTEGER NOT NULL, "
+            "height INTEGER NOT NULL, "
+            "palette_mode TEXT, "
+            "palette BLOB, "
+            "info TEXT NOT NULL, "
+            "last_used INTEGER NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> PerturbationCache:
+        return self
+
+    def __exit__(self, *exception: object) -> None:
+        self.close()
+
+    def key(self, source_sha256: str, pipeline: Sequence[TransformSpec]) -> str:
+        document = {
+            "source_sha256": source_sha256,
+            "steps": canonical_steps(pipeline),
+            "module_stamp": self.stamp,
+        }
+        text = json.dumps(document, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _object_path(self, key: str) -> Path:
+        return self.directory / "objects" / key[:2] / f"{key}.raw"
+
+    @contextmanager
+    def _write_transaction(self) -> Iterator[None]:
+        """Hold SQLite's write lock, which also guards the object files."""
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def get(self, key: str) -> Image.Image | None:
+        row = self._connection.execute(
+            "SELECT size, payload_sha256, mode, width, height, palette_mode, palette, info "
+            "FROM entries WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        size, payload_sha256, mode, width, height, palette_mode, palette, info = row
+        path = self._object_path(key)
+        try:
+            payload = path.read_bytes()
+        except FileNotFoundError:
+            self._forget_missing(key)
+            return None
+        if len(payload) != size or hashlib.sha256(payload).hexdigest() != payload_sha256:
+            raise ValueError(f"Cache object does not match its index entry: {path}")
+
+        image = Image.frombytes(mode, (width, height), payload)
+        if palette is not None:
+            image.putpalette(palette, rawmode=palette_mode)
+        for name, value in json.loads(info).items():
+            image.info[name] = tuple(value) if isinstance(value, list) else value
+        self._touch(key)
+        return image
+
+    def put(self, key: str, image: Image.Image) -> None:
+        payload = image.tobytes()
+        if len(payload) > self.max_bytes:
+            return
+        path = self._object_path(key)
+        path.parent.mkdir(exist_ok=True)
+        palette_mode = palette = None
+        if image.mode in ("P", "PA"):
+            palette_mode = image.palette.mode
+            palette = image.palette.tobytes()
+        # Only the transparency entry changes how a saved PNG decodes.
+        info = {"transparency": image.info["transparency"]} if "transparency" in image.info else {}
+
+        temporary = path.with_name(f".{path.name}.{os.getpid()}.partial")
+        try:
+            temporary.write_bytes(payload)
+            # Publishing the object and its row together keeps another
+            # process's eviction from unlinking it in between.
+            with self._write_transaction():
+                temporary.replace(path)
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, "
+                    "(SELECT COALESCE(MAX(last_used), 0) + 1 FROM entries))",
+                    (
+                        key,
+                        len(payload),
+                        hashlib.sha256(payload).hexdigest(),
+                        image.mode,
+                        image.width,
+                        image.height,
+                        palette_mode,
+                        palette,
+                        json.dumps(info),
+                    ),
+                )
+                self._evict()
+        finally:
+            temporary.unlink(missing_ok=True)
+
+    def _forget_missing(self, key: str) -> None:
+        """Drop the row of an object another process evicted, unless re-added."""
+        with self._write_transaction():
+            if not self._object_path(key).exists():
+                self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _touch(self, key: str) -> None:
+        self._connection.execute(
+            "UPDATE entries SET last_used = (SELECT MAX(last_used) + 1 FROM entries) WHERE key = ?",
+            (key,),
+        )
+
+    def _evict(self) -> None:
+        # Runs inside put's write transaction.
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM entries ORDER BY last_used"
+        ).fetchall():
+            self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._object_path(key).unlink(missing_ok=True)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    @property
+    def total_bytes(self) -> int:
+        return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def run(
+        self,
+        source_sha256: str,
+        source: Image.Image,
+        pipeline: Sequence[TransformSpec],
+    ) -> tuple[Image.Image, int]:
+        """Apply a pipeline, resuming from its longest cached prefix.
+
+        Every computed prefix is stored. Returns the result and the number of
+        leading steps that came from the cache.
+        """
+        keys = [self.key(source_sha256, pipeline[: length + 1]) for length in range(len(pipeline))]
+        result = None
+        cached_steps = 0
+        for length in range(len(pipeline), 0, -1):
+            result = self.get(keys[length - 1])
+            if result is not None:
+                cached_steps = length
+                break
+        if result is None:
+            result = source.copy()
+
+        for index in range(cached_steps, len(pipeline)):
+            transformed = pipeline[index].apply(result)
+            result.close()
+            result = transformed
+            self.put(keys[index], result)
+        return result, cached_steps
@@ -0,0 +1,112 @@
+"""In-memory codec round trips with memoized results and encode timings.
+
+jpeg_recompression and webp_recompression encode and decode through the
+shared round_trips service. A result is memoized by a digest of the input
+pixels (with mode, size, palette, and transparency), the codec, and its save
+parameters, in an LRU bounded by decoded bytes. Each thread reuses one
+encode buffer. The service is thread-safe, and Pillow releases the GIL while
+libjpeg and libwebp run, so perturbation_batch.apply_to_stack with several
+workers runs round trips concurrently.
+
+Encode and decode wall time, encoded bytes, and cache hits accumulate in
+statistics until reset, for the benchmark report.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+import hashlib
+from io import BytesIO
+import threading
+import time
+from typing import Any
+
+from PIL import Image
+
+
+CodecCacheBytes = 128 * 1024**2
+
+
+@dataclass
+class CodecStatistics:
+    calls: int = 0
+    hits: int = 0
+    encode_seconds: float = 0.0
+    decode_seconds: float = 0.0
+    encoded_bytes: int = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def _pixel_digest(image: Image.Image) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.mode} {image.size} {image.info.get('transparency')!r}".encode("utf-8"))
+    if image.mode in ("P", "PA"):
+        digest.update(image.palette.tobytes())
+    digest.update(image.tobytes())
+    return digest.digest()
+
+
+class CodecRoundTrips:
+    def __init__(self, max_bytes: int = CodecCacheBytes) -> None:
+        if max_bytes < 0:
+            raise ValueError("max_bytes must not be negative")
+        self.max_bytes = max_bytes
+        self.statistics = CodecStatistics()
+        self._entries: OrderedDict[tuple[Any, ...], Image.Image] = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def run(self, image: Image.Image, codec: str, parameters: dict[str, Any]) -> Image.Image:
+        """Encode image with Pillow's codec and parameters, decode, and return a new image."""
+        key = (_pixel_digest(image), codec, tuple(sorted(parameters.items())))
+        with self._lock:
+            self.statistics.calls += 1
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.statistics.hits += 1
+                return cached.copy()
+
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = BytesIO()
+        buffer.seek(0)
+        buffer.truncate()
+        started = time.perf_counter()
+        image.save(buffer, format=codec, **parameters)
+        encoded = time.perf_counter()
+        encoded_bytes = buffer.tell()
+        buffer.seek(0)
+        with Image.open(buffer) as opened:
+            decoded = opened.copy()
+        finished = time.perf_counter()
+
+        size = len(decoded.getbands()) * decoded.width * decoded.height
+        with self._lock:
+            self.statistics.encode_seconds += encoded - started
+            self.statistics.decode_seconds += finished - encoded
+            self.statistics.encoded_bytes += encoded_bytes
+            if size <= self.max_bytes and key not in self._entries:
+                self._entries[key] = decoded.copy()
+                self._cached_bytes += size
+                while self._cached_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._cached_bytes -= len(evicted.getbands()) * evicted.width * evicted.height
+                    evicted.close()
+        return decoded
+
+    def clear(self) -> None:
+        """Drop memoized results and reset the statistics."""
+        with self._lock:
+            for entry in self._entries.values():
+                entry.close()
+            self._entries.clear()
+            self._cached_bytes = 0
+            self.statistics = CodecStatistics()
+
+
+round_trips = CodecRoundTrips()
@@ -0,0 +1,266 @@
+"""Compile transform pipelines into fused stages that resample once.
+
+Consecutive geometric specs (translations, shear, micro-rotation, keystone)
+compose into one projective matrix and run as a single PIL transform, so the
+image is resampled once per run of geometric steps instead of once per step.
+Consecutive gamma/contrast specs compose into one lookup table and run as a
+single point operation. Every other spec, and any run of length one, runs
+through its own TransformSpec.apply unchanged.
+
+Fused geometric output is not byte-identical to sequential output: it skips
+the intermediate resamples, and the keystone quad is replaced by the
+homography through the same four corners. Fused lookup output is
+byte-identical to sequential output.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+import functools
+import inspect
+import math
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+from generate_variants import TransformSpec
+import image_perturbations as perturb
+
+
+# Output-to-input matrices use PIL's continuous coordinates, where pixel
+# centers sit at half-integer positions.
+Matrix = np.ndarray
+GeometricStep = Callable[[tuple[int, int], dict[str, Any]], tuple[tuple[int, int], Matrix]]
+
+
+@functools.cache
+def _defaults(function_name: str) -> dict[str, Any]:
+    parameters = inspect.signature(getattr(perturb, function_name)).parameters.values()
+    return {parameter.name: parameter.default for parameter in parameters if parameter.default is not parameter.empty}
+
+
+def _spec_arguments(spec: TransformSpec) -> dict[str, Any]:
+    """The spec's arguments over its function's own keyword defaults."""
+    return {**_defaults(spec.function_name), **spec.arguments}
+
+
+def _affine(a: float, b: float, c: float, d: float, e: float, f: float) -> Matrix:
+    return np.array([[a, b, c], [d, e, f], [0.0, 0.0, 1.0]])
+
+
+def _translate_and_pad(size: tuple[int, int], arguments: dict[str, Any]) -> tuple[tuple[int, int], Matrix]:
+    dx = size[0] * arguments["x_fraction"]
+    dy = size[1] * arguments["y_fraction"]
+    return size, _affine(1, 0, -dx, 0, 1, -dy)
+
+
+def _subpixel_translation(size: tuple[int, int], arguments: dict[str, Any]) -> tuple[tuple[int, int], Matrix]:
+    return size, _affine(1, 0, -arguments["x_pixels"], 0, 1, -arguments["y_pixels"])
+
+
+def _affine_shear(size: tuple[int, int], arguments: dict[str, Any]) -> tuple[tuple[int, int], Matrix]:
+    shear = math.tan(math.radians(arguments["x_degrees"]))
+    return size, _affine(1, -shear, shear * size[1] / 2, 0, 1, 0)
+
+
+def _micro_rotate(size: tuple[int, int], arguments: dict[str, Any]) -> tuple[tuple[int, int], Matrix]:
+    # Mirrors Image.rotate, including its canvas growth when expand is set.
+    degrees = arguments["degrees"]
+    angle = -degrees if arguments["clockwise"] else degrees
+    width, height = size
+    center_x, center_y = width / 2, height / 2
+    radians = -math.radians(angle % 360.0)
+    a = round(math.cos(radians), 15)
+    b = round(math.sin(radians), 15)
+    d = round(-math.sin(radians), 15)
+    e = round(math.cos(radians), 15)
+    c = a * -center_x + b * -center_y + center_x
+    f = d * -center_x + e * -center_y + center_y
+    if arguments["expand"]:
+        corners_x = [a * x + b * y + c for x, y in ((0, 0), (width, 0), (width, height), (0, height))]
+        corners_y = [d * x + e * y + f for x, y in ((0, 0), (width, 0), (width, height), (0, height))]
+        new_width = math.ceil(max(corners_x)) - math.floor(min(corners_x))
+        new_height = math.ceil(max(corners_y)) - math.floor(min(corners_y))
+        shift_x = -(new_width - width) / 2.0
+        shift_y = -(new_height - height) / 2.0
+        c, f = a * shift_x + b * shift_y + c, d * shift_x + e * shift_y + f
+        width, height = new_width, new_height
+    return (width, height), _affine(a, b, c, d, e, f)
+
+
+def _homography(targets: Sequence[tuple[float, float]], sources: Sequence[tuple[float, float]]) -> Matrix:
+    rows = []
+    values = []
+    for (x, y), (u, v) in zip(targets, sources, strict=True):
+        rows.append([x, y, 1, 0, 0, 0, -u * x, -u * y])
+        rows.append([0, 0, 0, x, y, 1, -v * x, -v * y])
+        values.extend((u, v))
+    coefficients = np.linalg.solve(np.array(rows, dtype=np.float64), np.array(values))
+    return np.append(coefficients, 1.0).reshape(3, 3)
+
+
+def _perspective_keystone(size: tuple[int, int], arguments: dict[str, Any]) -> tuple[tuple[int, int], Matrix]:
+    top_inset_fraction = arguments["top_inset_fraction"]
+    if not 0 <= top_inset_fraction < 0.5:
+        raise ValueError("top_inset_fraction must be in [0, 0.5)")
+    width, height = size
+    inset = width * top_inset_fraction
+    matrix = _homography(
+        ((0, 0), (0, height), (width, height), (width, 0)),
+        ((inset, 0), (0, height), (width, height), (width - inset, 0)),
+    )
+    return size, matrix
+
+
+GeometricSteps: dict[str, GeometricStep] = {
+    "affine_shear": _affine_shear,
+    "micro_rotate": _micro_rotate,
+    "perspective_keystone": _perspective_keystone,
+    "subpixel_translation": _subpixel_translation,
+    "translate_and_pad": _translate_and_pad,
+}
+
+LookupSteps = ("gamma_contrast_remap",)
+
+LookupModes = ("RGB", "RGBA")
+
+
+@dataclass(frozen=True)
+class CompiledStage:
+    kind: str
+    specs: tuple[TransformSpec, ...]
+
+    @property
+    def fused(self) -> bool:
+        return len(self.specs) > 1
+
+    def apply(self, image: Image.Image) -> Image.Image:
+        if not self.fused:
+            return self.specs[0].apply(image)
+        if self.kind == "geometric":
+            return _apply_geometric(image, self.specs)
+        if self.kind == "lookup" and image.mode in LookupModes:
+            return _apply_lookup(image, self.specs)
+        result = image
+        for spec in self.specs:
+            transformed = spec.apply(result)
+            if result is not image:
+                result.close()
+            result = transformed
+        return result
+
+
+@dataclass(frozen=True)
+class CompiledPipeline:
+    stages: tuple[CompiledStage, ...]
+
+    def apply(self, image: Image.Image) -> Image.Image:
+        result = image
+        for stage in self.stages:
+            transformed = stage.apply(result)
+            if result is not image:
+                result.close()
+            result = transformed
+        return result if result is not image else image.copy()
+
+    @property
+    def resample_count(self) -> int:
+        return sum(1 for stage in self.stages if stage.kind == "geometric")
+
+    def fusion_report(self) -> list[dict[str, Any]]:
+        """Describe each stage: its kind, whether it was fused, and its steps."""
+        return [
+            {
+                "kind": stage.kind,
+                "fused": stage.fused,
+                "steps": [spec.slug for spec in stage.specs],
+            }
+            for stage in self.stages
+        ]
+
+
+def _kind(spec: TransformSpec) -> str:
+    if spec.function_name in GeometricSteps:
+        return "geometric"
+    if spec.function_name in LookupSteps:
+        return "lookup"
+    return "single"
+
+
+def compile_pipeline(specs: Sequence[TransformSpec]) -> CompiledPipeline:
+    """Group consecutive fusible specs into stages.
+
+    Geometric specs only fuse when they share a fill argument, because a fused
+    transform can paint uncovered pixels with one color only.
+    """
+    stages: list[CompiledStage] = []
+    for spec in specs:
+        kind = _kind(spec)
+        previous = stages[-1] if stages else None
+        if (
+            previous is not None
+            and kind != "single"
+            and previous.kind == kind
+            and previous.specs[-1].arguments.get("fill") == spec.arguments.get("fill")
+        ):
+            stages[-1] = CompiledStage(kind, previous.specs + (spec,))
+        else:
+            stages.append(CompiledStage(kind, (spec,)))
+    return CompiledPipeline(tuple(stages))
+
+
+def _apply_geometric(image: Image.Image, specs: Sequence[TransformSpec]) -> Image.Image:
+    perturb._require_image(image)
+    size = image.size
+    matrix = np.identity(3)
+    for spec in specs:
+        size, step = GeometricSteps[spec.function_name](size, _spec_arguments(spec))
+        matrix = matrix @ step
+    matrix /= matrix[2, 2]
+
+    fill = specs[0].arguments.get("fill")
+    fill_color = perturb._default_fill(image) if fill is None else fill
+    if np.allclose(matrix[2, :2], 0.0, atol=1e-15):
+        return image.transform(
+            size,
+            Image.Transform.AFFINE,
+            tuple(matrix[:2].ravel()),
+            resample=Image.Resampling.BICUBIC,
+            fillcolor=fill_color,
+        )
+    return image.transform(
+        size,
+        Image.Transform.PERSPECTIVE,
+        tuple(matrix.ravel()[:8]),
+        resample=Image.Resampling.BICUBIC,
+        fillcolor=fill_color,
+    )
+
+
+def _apply_lookup(image: Image.Image, specs: Sequence[TransformSpec]) -> Image.Image:
+    """Run consecutive gamma_contrast_remap specs as one point operation.
+
+    Each contrast step needs the mean luminance of its own input, so the
+    composed table is applied to the channels to find that mean; the image
+    itself is remapped once at the end.
+    """
+    perturb._require_image(image)
+    pixels = np.asarray(image)
+    lookup = np.arange(256)
+    for spec in specs:
+        arguments = _spec_arguments(spec)
+        gamma, contrast = arguments["gamma"], arguments["contrast"]
+        if gamma <= 0 or contrast < 0:
+            raise ValueError("gamma must be positive and contrast must not be negative")
+        lookup = perturb._gamma_lookup(gamma)[lookup]
+        red, green, blue = (lookup[pixels[..., band]] for band in range(3))
+        luminance = (red * 19595 + green * 38470 + blue * 7471 + 0x8000) >> 16
+        mean = int(int(luminance.sum()) / luminance.size + 0.5)
+        lookup = perturb._contrast_lookup(mean, contrast)[lookup]
+
+    table = lookup.tolist() * 3
+    if image.mode == "RGBA":
+        table += list(range(256))
+    return image.point(table)
@@ -0,0 +1,416 @@
+"""Run local and pointwise perturbations in memory-bounded strips.
+
+The source is read as full-width horizontal strips. Each strip carries enough
+halo rows for the transform's neighborhood, is transformed, is trimmed back to
+its own rows, and is written into the output array. The strip height comes
+from a memory budget, so working memory depends on the image width and not
+its height. Transforms that need a global statistic first make a streaming
+pass over the source.
+
+With workers, strips are transformed concurrently on a thread pool and the
+budget is shared between them. Seeded draws are addressed by pixel position,
+so the result does not depend on the budget, the strip order, or the worker
+count.
+
+Pass a memory-mapped array (for example np.load(path, mmap_mode="r")) as the
+source, and np.lib.format.open_memmap as the output, to keep both out of
+memory; the budget covers working buffers only.
+
+Output is byte-identical to the whole-image function for every supported
+transform except one: chroma_subsample_and_channel_shift with a fractional
+vertical channel offset can differ by one level in rare pixels, because the
+strip origin changes the float rounding of the sample position.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import functools
+import inspect
+import math
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+import image_perturbations as perturb
+
+
+TiledBands = {"L": 1, "LA": 2, "RGB": 3, "RGBA": 4}
+
+DefaultMemoryBudget = 256 * 1024 * 1024
+
+# Pillow's fixed-point resampling precision for 8-bit bands.
+_ResamplePrecisionBits = 22
+
+StripFunction = Callable[[Image.Image, int], Image.Image]
+
+
+class _StripReader:
+    def __init__(self, source: Image.Image | np.ndarray, mode: str | None) -> None:
+        if isinstance(source, Image.Image):
+            if mode is not None and mode != source.mode:
+                raise ValueError("mode must match the source image mode")
+            mode = source.mode
+            self.width, self.height = source.size
+        elif isinstance(source, np.ndarray):
+            if mode is None:
+                raise ValueError("mode is required for an array source")
+            if source.dtype != np.uint8 or source.ndim != 3:
+                raise ValueError("array source must be a uint8 (height, width, bands) array")
+            if mode in TiledBands and source.shape[2] != TiledBands[mode]:
+                raise ValueError(f"mode {mode} needs {TiledBands[mode]} bands")
+            self.height, self.width = source.shape[:2]
+        else:
+            raise TypeError("source must be a PIL.Image.Image or a NumPy array")
+        if mode not in TiledBands:
+            raise ValueError(f"tiled mode must be one of {sorted(TiledBands)}")
+        self.source = source
+        self.mode = mode
+        self.bands = TiledBands[mode]
+
+    def rows(self, top: int, bottom: int) -> Image.Image:
+        if isinstance(self.source, Image.Image):
+            return self.source.crop((0, top, self.width, bottom))
+        strip = np.ascontiguousarray(self.source[top:bottom])
+        return Image.frombuffer(self.mode, (self.width, bottom - top), strip, "raw", self.mode, 0, 1)
+
+    def strips(self, rows: int, *, align: int = 1) -> Iterator[tuple[int, Image.Image]]:
+        """Yield (top, strip) for consecutive strips of at most rows rows.
+
+        Strip boundaries fall on multiples of align.
+        """
+        rows = max(align, rows - rows % align)
+        for top in range(0, self.height, rows):
+            bottom = min(self.height, top + rows)
+            yield top, self.rows(top, bottom)
+
+
+def _strip_rows(reader: _StripReader, budget: int, bytes_per_pixel: int, halo: int = 0) -> int:
+    rows = budget // (reader.width * bytes_per_pixel) - 2 * halo
+    if rows < 1:
+        raise ValueError(
+            f"memory budget of {budget} bytes cannot hold one strip of "
+            f"{reader.width} pixels with {halo} halo rows"
+        )
+    return rows
+
+
+@dataclass(frozen=True)
+class _Prepared:
+    transform: StripFunction
+    reserved_bytes: int = 0
+
+
+@dataclass(frozen=True)
+class TiledTransform:
+    # Rows of context needed above and below each output row.
+    halo: Callable[[Mapping[str, Any]], int]
+    # Conservative working bytes per source pixel while a strip is in flight.
+    bytes_per_pixel: int
+    prepare: Callable[[_StripReader, Mapping[str, Any], int], _Prepared]
+
+
+@functools.cache
+def _defaults(function_name: str) -> dict[str, Any]:
+    parameters = inspect.signature(getattr(perturb, function_name)).parameters.values()
+    return {parameter.name: parameter.default for parameter in parameters if parameter.default is not parameter.empty}
+
+
+def _whole_image(function_name: str) -> Callable[[_StripReader, Mapping[str, Any], int], _Prepared]:
+    def prepare(reader: _StripReader, arguments: Mapping[str, Any], budget: int) -> _Prepared:
+        function = getattr(perturb, function_name)
+        return _Prepared(lambda strip, top: function(strip, **arguments))
+
+    return prepare
+
+
+def _prepare_noise(reader: _StripReader, arguments: Mapping[str, Any], budget: int) -> _Prepared:
+    standard_deviation, salt_pepper_probability, seed = perturb._sensor_noise_settings(**arguments)
+    working_mode = "RGBA" if "A" in reader.mode else "RGB"
+
+    def transform(strip: Image.Image, top: int) -> Image.Image:
+        working = strip.convert(working_mode) if strip.mode != working_mode else strip
+        noisy = Image.fromarray(
+            perturb._sensor_noise_array(
+                np.asarray(working),
+                standard_deviation,
+                salt_pepper_probability,
+                seed,
+                top,
+            )
+        )
+        return noisy if noisy.mode == strip.mode else noisy.convert(strip.mode)
+
+    return _Prepared(transform)
+
+
+def _prepare_gamma(reader: _StripReader, arguments: Mapping[str, Any], budget: int) -> _Prepared:
+    # The contrast step blends toward the mean luminance of the whole
+    # gamma-mapped image, so a first pass accumulates its histogram strip by
+    # strip. Pillow does the mapping, so the pass holds 8-bit strips only.
+    gamma_table = perturb._gamma_lookup(arguments["gamma"])
+    gamma_bands = gamma_table.tolist() * 3
+    histogram = [0] * 256
+    rows = _strip_rows(reader, budget, TiledTransforms["gamma_contrast_remap"].bytes_per_pixel)
+    for _, strip in reader.strips(rows):
+        with strip.convert("RGB").point(gamma_bands) as mapped, mapped.convert("L") as luminance:
+            histogram = [total + count for total, count in zip(histogram, luminance.histogram())]
+        strip.close()
+    total = sum(level * count for level, count in enumerate(histogram))
+    mean = int(total / (reader.width * reader.height) + 0.5)
+    table = perturb._contrast_lookup(mean, arguments["contrast"])[gamma_table].tolist()
+
+    def transform(strip: Image.Image, top: int) -> Image.Image:
+        if strip.mode == "RGB":
+            return strip.point(table * 3)
+        if strip.mode == "RGBA":
+            return strip.point(table * 3 + list(range(256)))
+        return strip.convert("RGB").point(table * 3).convert(strip.mode)
+
+    return _Prepared(transform)
+
+
+def _resample_coefficients(
+    in_size: int,
+    out_size: int,
+    support: float,
+    kernel: Callable[[np.ndarray], np.ndarray],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return Pillow's per-output source row bounds and fixed-point weights."""
+    scale = in_size / out_size
+    filter_scale = max(scale, 1.0)
+    scaled_support = support * filter_scale
+    kernel_size = int(math.ceil(scaled_support)) * 2 + 1
+    center = (np.arange(out_size) + 0.5) * scale
+    first = np.maximum(np.trunc(center - scaled_support + 0.5).astype(np.int64), 0)
+    last = np.minimum(np.trunc(center + scaled_support + 0.5).astype(np.int64), in_size)
+    taps = np.arange(kernel_size)
+    weights = kernel(((taps + first[:, None]) - center[:, None] + 0.5) * (1.0 / filter_scale))
+    weights[taps >= (last - first)[:, None]] = 0.0
+    total = np.zeros(out_size)
+    for tap in range(kernel_size):
+        total += weights[:, tap]
+    weights = np.divide(weights, total[:, None], out=weights, where=total[:, None] != 0)
+    scaled = weights * (1 << _ResamplePrecisionBits)
+    fixed = np.where(scaled < 0, np.trunc(scaled - 0.5), np.trunc(scaled + 0.5)).astype(np.int64)
+    return first, last, fixed
+
+
+def _box_kernel(x: np.ndarray) -> np.ndarray:
+    return ((x > -0.5) & (x <= 0.5)).astype(np.float64)
+
+
+def _bilinear_kernel(x: np.ndarray) -> np.ndarray:
+    return np.maximum(1.0 - np.abs(x), 0.0)
+
+
+def _resample_rows(
+    rows: np.ndarray,
+    window_top: int,
+    first: np.ndarray,
+    weights: np.ndarray,
+) -> np.ndarray:
+    """Run Pillow's vertical 8-bit resampling pass for the given output rows.
+
+    rows holds the source rows starting at window_top; first and weights are
+    the coefficient rows for the wanted outputs.
+    """
+    accumulator = np.full((len(first), rows.shape[1]), 1 << (_ResamplePrecisionBits - 1), dtype=np.int64)
+    for tap in range(weights.shape[1]):
+        index = np.minimum(first + tap - window_top, rows.shape[0] - 1)
+        accumulator += rows[index].astype(np.int64) * weights[:, tap, None]
+    return np.clip(accumulator >> _ResamplePrecisionBits, 0, 255).astype(np.uint8)
+
+
+def _prepare_chroma(reader: _StripReader, arguments: Mapping[str, Any], budget: int) -> _Prepared:
+    # The reduced chroma planes are built once, in strips, by running the
+    # horizontal pass with Pillow and the vertical pass with its coefficients.
+    chroma_scale = arguments["chroma_scale"]
+    red_shift = arguments["red_shift"]
+    blue_shift = arguments["blue_shift"]
+    width, height = reader.width, reader.height
+    reduced_width = max(1, round(width * chroma_scale))
+    reduced_height = max(1, round(height * chroma_scale))
+    reserved = 2 * reduced_width * reduced_height
+    if reserved >= budget:
+        raise ValueError(f"memory budget of {budget} bytes cannot hold the reduced chroma planes")
+
+    down_first, down_last, down_weights = _resample_coefficients(
+        height, reduced_height, 0.5, _box_kernel
+    )
+    reduced = np.empty((2, reduced_height, reduced_width), dtype=np.uint8)
+    rows = _strip_rows(
+        reader,
+        budget - reserved,
+        TiledTransforms["chroma_subsample_and_channel_shift"].bytes_per_pixel,
+    )
+    block = max(1, rows * reduced_height // height)
+    for start in range(0, reduced_height, block):
+        stop = min(reduced_height, start + block)
+        top, bottom = int(down_first[start]), int(down_last[start:stop].max())
+        planes = reader.rows(top, bottom).convert("RGB").convert("YCbCr").split()[1:]
+        for index, plane in enumerate(planes):
+            narrowed = np.asarray(plane.resize((reduced_width, bottom - top), Image.Resampling.BOX))
+            reduced[index, start:stop] = _resample_rows(
+                narrowed, top, down_first[start:stop], down_weights[start:stop]
+            )
+
+    up_first, up_last, up_weights = _resample_coefficients(
+        reduced_height, height, 1.0, _bilinear_kernel
+    )
+
+    def upsample(plane: np.ndarray, top: int, bottom: int) -> Image.Image:
+        low, high = int(up_first[top]), int(up_last[top:bottom].max())
+        window = Image.fromarray(np.ascontiguousarray(plane[low:high]))
+        widened = np.asarray(window.resize((width, high - low), Image.Resampling.BILINEAR))
+        return Image.fromarray(_resample_rows(widened, low, up_first[top:bottom], up_weights[top:bottom]))
+
+    def shift(channel: Image.Image, offset: tuple[float, float]) -> Image.Image:
+        return channel.transform(
+            channel.size,
+            Image.Transform.AFFINE,
+            (1, 0, -offset[0], 0, 1, -offset[1]),
+            resample=Image.Resampling.BICUBIC,
+            fillcolor=255,
+        )
+
+    def transform(strip: Image.Image, top: int) -> Image.Image:
+        bottom = top + strip.height
+        alpha = strip.getchannel("A") if "A" in strip.getbands() else None
+        luminance = strip.convert("RGB").convert("YCbCr").getchannel("Y")
+        red, green, blue = Image.merge(
+            "YCbCr",
+            (luminance, upsample(reduced[0], top, bottom), upsample(reduced[1], top, bottom)),
+        ).convert("RGB").split()
+        result = Image.merge("RGB", (shift(red, red_shift), green, shift(blue, blue_shift)))
+        if alpha is not None:
+            result.putalpha(alpha)
+        return result
+
+    return _Prepared(transform, reserved)
+
+
+def _prepare_quantization(reader: _StripReader, arguments: Mapping[str, Any], budget: int) -> _Prepared:
+    colors = arguments["colors"]
+    # The same reduced sample and palette as the whole-image function.
+    factor = perturb._palette_reduction((reader.width, reader.height))
+    reduced_size = (math.ceil(reader.width / factor), math.ceil(reader.height / factor))
+    reserved = 2 * 3 * reduced_size[0] * reduced_size[1]
+    if reserved >= budget:
+        raise ValueError(f"memory budget of {budget} bytes cannot hold the palette sample")
+
+    # Strips aligned to the reduction factor reduce to the same rows as the
+    # whole image would, so the palette does not depend on the budget.
+    sample = Image.new("RGB", reduced_size)
+    rows = _strip_rows(reader, budget - reserved, TiledTransforms["palette_quantization"].bytes_per_pixel)
+    for top, strip in reader.strips(rows, align=factor):
+        sample.paste(strip.convert("RGB").reduce(factor), (0, top // factor))
+    palette = perturb._adaptive_palette(sample, colors)
+    sample.close()
+
+    def transform(strip: Image.Image, top: int) -> Image.Image:
+        return strip.convert("RGB").quantize(palette=palette, dither=Image.Dither.NONE).convert("RGB")
+
+    return _Prepared(transform, reserved)
+
+
+def _shift_halo(arguments: Mapping[str, Any]) -> int:
+    offsets = (arguments["red_shift"][1], arguments["blue_shift"][1])
+    return max(math.ceil(abs(offset)) for offset in offsets) + 2
+
+
+TiledTransforms: dict[str, TiledTransform] = {
+    "additive_sensor_noise": TiledTransform(lambda arguments: 0, 48, _prepare_noise),
+    "chroma_subsample_and_channel_shift": TiledTransform(_shift_halo, 64, _prepare_chroma),
+    "gamma_contrast_remap": TiledTransform(lambda arguments: 0, 24, _prepare_gamma),
+    # Pillow blurs with three box passes, each reaching int(r) + 1 rows for a
+    # box radius r below the Gaussian radius.
+    "gaussian_blur": TiledTransform(
+        lambda arguments: 3 * (int(arguments["radius"]) + 1),
+        16,
+        _whole_image("gaussian_blur"),
+    ),
+    "median_filter": TiledTransform(
+        lambda arguments: arguments["size"] // 2,
+        16,
+        _whole_image("median_filter"),
+    ),
+    "motion_blur": TiledTransform(
+        lambda arguments: arguments["length"] // 2,
+        16,
+        _whole_image("motion_blur"),
+    ),
+    "palette_quantization": TiledTransform(lambda arguments: 0, 16, _prepare_quantization),
+}
+
+
+def apply_tiled(
+    function_name: str,
+    source: Image.Image | np.ndarray,
+    *,
+    mode: str | None = None,
+    arguments: Mapping[str, Any] | None = None,
+    memory_budget: int = DefaultMemoryBudget,
+    output: np.ndarray | None = None,
+    workers: int = 1,
+) -> tuple[np.ndarray, str]:
+    """Apply one transform strip by strip and return (pixels, output mode).
+
+    source is an image, or a uint8 (height, width, bands) array of the given
+    mode. output, when given, must be a uint8 (height, width, bands) array
+    for the output mode; it receives the result strip by strip. workers
+    strips are in flight at once.
+    """
+    if function_name not in TiledTransforms:
+        raise ValueError(f"{function_name} has no tiled implementation; use one of {sorted(TiledTransforms)}")
+    if workers < 1:
+        raise ValueError("workers must be positive")
+    reader = _StripReader(source, mode)
+    arguments = dict(arguments or {})
+
+    # The whole-image function validates the arguments and fixes the output
+    # mode on a one-pixel probe.
+    output_mode = getattr(perturb, function_name)(Image.new(reader.mode, (1, 1)), **arguments).mode
+    shape = (reader.height, reader.width, TiledBands[output_mode])
+    if output is None:
+        output = np.empty(shape, dtype=np.uint8)
+    elif output.dtype != np.uint8 or output.shape != shape:
+        raise ValueError(f"output must be a uint8 array of shape {shape}")
+
+    # Omitted arguments take the whole-image function's own defaults.
+    arguments = {**_defaults(function_name), **arguments}
+    tiled = TiledTransforms[function_name]
+    prepared = tiled.prepare(reader, arguments, memory_budget)
+    halo = tiled.halo(arguments)
+    rows = _strip_rows(
+        reader,
+        (memory_budget - prepared.reserved_bytes) // workers,
+        tiled.bytes_per_pixel,
+        halo,
+    )
+
+    def run(top: int) -> None:
+        bottom = min(reader.height, top + rows)
+        read_top = max(0, top - halo)
+        strip = reader.rows(read_top, min(reader.height, bottom + halo))
+        result = prepared.transform(strip, read_top)
+        pixels = np.asarray(result).reshape(result.height, reader.width, -1)
+        output[top:bottom] = pixels[top - read_top : bottom - read_top]
+        strip.close()
+        result.close()
+
+    tops = range(0, reader.height, rows)
+    if workers == 1:
+        for top in tops:
+            run(top)
+    else:
+        # Load a lazy source once, before strips crop it concurrently.
+        if isinstance(source, Image.Image):
+            source.load()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(run, tops):
+                pass
+    return output, output_mode
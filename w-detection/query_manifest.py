@@ -0,0 +1,378 @@
+"""Filter, sort, and time variant manifests through an SQLite sidecar index.
+
+Each manifest.jsonl gets a manifest.jsonl.index.sqlite sidecar with one row
+per record: its byte offset and length in the manifest, and the fields used
+to filter and sort. Only the checkpointed prefix of a manifest is indexed.
+The sidecar keeps the byte length and sha256 of the prefix it covers, so a
+later query hashes that prefix and parses only the records committed since.
+If the prefix no longer matches, the sidecar is rebuilt. Matching records
+are read back by offset, so a query parses only the lines it prints.
+
+Timings group elapsed_seconds by the last transform of each record whose
+elapsed time covers one application of that transform: singles and ordered
+pairs whose last step was not served from the cache. Random pipeline records
+time several steps together and are left out.
+"""
+
+from __future__ import annotations
+
+import argparse
+from collections.abc import Sequence
+import hashlib
+import json
+from pathlib import Path
+import sqlite3
+import statistics
+from typing import Any, BinaryIO
+
+from variant_manifest import read_checkpoint
+
+
+IndexVersion = 1
+
+Kinds = ("single", "ordered_pair", "random")
+
+SortFields = (
+    "elapsed_seconds",
+    "size_bytes",
+    "psnr_db",
+    "ssim",
+    "mean_absolute_difference",
+    "width",
+    "height",
+    "step_count",
+)
+
+
+def index_path(manifest_path: Path) -> Path:
+    return manifest_path.with_name(manifest_path.name + ".index.sqlite")
+
+
+def manifest_paths(paths: Sequence[Path]) -> list[Path]:
+    """Expand run and corpus directories to their manifest files."""
+    manifests: list[Path] = []
+    for path in paths:
+        if path.is_file():
+            manifests.append(path)
+        elif (path / "manifest.jsonl").is_file():
+            manifests.append(path / "manifest.jsonl")
+        elif (path / "corpus.json").is_file():
+            corpus = json.loads((path / "corpus.json").read_text(encoding="utf-8"))
+            manifests.extend(path / entry["directory"] / "manifest.jsonl" for entry in corpus["sources"])
+        else:
+            raise FileNotFoundError(f"No manifest.jsonl or corpus.json in {path}")
+    return manifests
+
+
+def _hash_prefix(manifest: BinaryIO, length: int, digest: Any) -> bool:
+    """Hash the first length bytes into digest; False if the file is shorter."""
+    while length:
+        block = manifest.read(min(length, 1024 * 1024))
+        if not block:
+            return False
+        digest.update(block)
+        length -= len(block)
+    return True
+
+
+def _row(offset: int, line: bytes) -> tuple[Any, ...]:
+    record = json.loads(line)
+    order = record["application_order"]
+    # Records written before metrics were recorded have none.
+    metrics = record.get("metrics") or {}
+    cached_steps = record.get("cached_steps")
+    return (
+        offset,
+        len(line),
+        # Random pipeline records carry image_number in place of kind.
+        record.get("kind", "random"),
+        len(order),
+        order[0],
+        order[-1],
+        " ".join(order),
+        record["relative_path"],
+        record["width"],
+        record["height"],
+        record["size_bytes"],
+        record["elapsed_seconds"],
+        cached_steps,
+        metrics.get("psnr_db"),
+        metrics.get("ssim"),
+        metrics.get("mean_absolute_difference"),
+        # Elapsed time covers one application of the last transform.
+        "kind" in record and (cached_steps is None or cached_steps < len(order)),
+    )
+
+
+class ManifestIndex:
+    def __init__(self, manifest_path: Path) -> None:
+        self.manifest_path = manifest_path
+        self._connection = sqlite3.connect(index_path(manifest_path), timeout=60, isolation_level=None)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        # One writer at a time brings the sidecar up to date.
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            if self._meta("index_version") != str(IndexVersion):
+                self._reset()
+            self._update()
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> ManifestIndex:
+        return self
+
+    def __exit__(self, *exception: object) -> None:
+        self.close()
+
+    def _meta(self, key: str) -> str | None:
+        row = self._connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _reset(self) -> None:
+        self._connection.execute("DROP TABLE IF EXISTS records")
+        self._connection.execute(
+            "CREATE TABLE records ("
+            "offset INTEGER PRIMARY KEY, "
+            "length INTEGER NOT NULL, "
+            "kind TEXT NOT NULL, "
+            "step_count INTEGER NOT NULL, "
+            "inner_slug TEXT NOT NULL, "
+            "outer_slug TEXT NOT NULL, "
+            "application_order TEXT NOT NULL, "
+            "relative_path TEXT NOT NULL, "
+            "width INTEGER NOT NULL, "
+            "height INTEGER NOT NULL, "
+            "size_bytes INTEGER NOT NULL, "
+            "elapsed_seconds REAL NOT NULL, "
+            "cached_steps INTEGER, "
+            "psnr_db REAL, "
+            "ssim REAL, "
+            "mean_absolute_difference REAL, "
+            "timed INTEGER NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX records_outer ON records (outer_slug, kind)")
+        self._connection.execute("CREATE INDEX records_inner ON records (inner_slug, kind)")
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+            (
+                ("index_version", str(IndexVersion)),
+                ("bytes", "0"),
+                ("sha256", hashlib.sha256().hexdigest()),
+            ),
+        )
+
+    def _update(self) -> None:
+        """Index the records committed since the sidecar was last updated."""
+        checkpoint = read_checkpoint(self.manifest_path)
+        indexed_bytes = int(self._meta("bytes"))
+        if indexed_bytes == checkpoint["bytes"] and self._meta("sha256") == checkpoint["sha256"]:
+            return
+
+        digest = hashlib.sha256()
+        with self.manifest_path.open("rb") as manifest:
+            if (
+                indexed_bytes > checkpoint["bytes"]
+                or not _hash_prefix(manifest, indexed_bytes, digest)
+                or digest.hexdigest() != self._meta("sha256")
+            ):
+                self._reset()
+                indexed_bytes = 0
+                digest = hashlib.sha256()
+                manifest.seek(0)
+            tail = manifest.read(checkpoint["bytes"] - indexed_bytes)
+        digest.update(tail)
+        if len(tail) != checkpoint["bytes"] - indexed_bytes or digest.hexdigest() != checkpoint["sha256"]:
+            raise ValueError(f"Manifest does not match its checkpoint: {self.manifest_path}")
+
+        rows = []
+        offset = indexed_bytes
+        for line in tail.splitlines(keepends=True):
+            rows.append(_row(offset, line))
+            offset += len(line)
+        self._connection.executemany(f"INSERT INTO records VALUES ({', '.join('?' * 17)})", rows)
+        self._connection.executemany(
+            "UPDATE meta SET value = ? WHERE key = ?",
+            ((str(checkpoint["bytes"]), "bytes"), (checkpoint["sha256"], "sha256")),
+        )
+
+    @property
+    def record_count(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def select(
+        self,
+        *,
+        kind: str | None = None,
+        inner: str | None = None,
+        outer: str | None = None,
+        steps: Sequence[str] = (),
+        sort: str | None = None,
+        descending: bool = False,
+        limit: int | None = None,
+    ) -> list[tuple[Any, int, int]]:
+        """Return (sort value, offset, length) of matching records.
+
+        inner and outer match the first and last step; every slug in steps
+        must appear somewhere in the application order. Records without a
+        value for the sort field come last.
+        """
+        if kind is not None and kind not in Kinds:
+            raise ValueError(f"kind must be one of {Kinds}")
+        if sort is not None and sort not in SortFields:
+            raise ValueError(f"sort must be one of {SortFields}")
+        clauses = []
+        parameters: list[Any] = []
+        for column, value in (("kind", kind), ("inner_slug", inner), ("outer_slug", outer)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                parameters.append(value)
+        for slug in steps:
+            clauses.append("instr(' ' || application_order || ' ', ?) > 0")
+            parameters.append(f" {slug} ")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        column = sort or "offset"
+        order = f"ORDER BY {column} IS NULL, {column} {'DESC' if descending else 'ASC'}, offset"
+        if limit is not None:
+            order += " LIMIT ?"
+            parameters.append(limit)
+        return self._connection.execute(
+            f"SELECT {column}, offset, length FROM records {where} {order}",
+            parameters,
+        ).fetchall()
+
+    def read(self, offset: int, length: int) -> dict[str, Any]:
+        with self.manifest_path.open("rb") as manifest:
+            manifest.seek(offset)
+            return json.loads(manifest.read(length))
+
+    def timings(self) -> dict[str, list[float]]:
+        """Return the timed elapsed_seconds of each last transform."""
+        timings: dict[str, list[float]] = {}
+        for slug, elapsed in self._connection.execute(
+            "SELECT outer_slug, elapsed_seconds FROM records WHERE timed ORDER BY offset"
+        ):
+            timings.setdefault(slug, []).append(elapsed)
+        return timings
+
+
+def query(
+    manifests: Sequence[Path],
+    *,
+    kind: str | None = None,
+    inner: str | None = None,
+    outer: str | None = None,
+    steps: Sequence[str] = (),
+    sort: str | None = None,
+    descending: bool = False,
+    limit: int | None = None,
+) -> list[tuple[Path, dict[str, Any]]]:
+    """Return (manifest, record) for matching records across manifests."""
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be positive")
+    matches: list[tuple[Any, int, Path, ManifestIndex, int, int]] = []
+    indexes = [ManifestIndex(path) for path in manifests]
+    try:
+        for number, index in enumerate(indexes):
+            for value, offset, length in index.select(
+                kind=kind,
+                inner=inner,
+                outer=outer,
+                steps=steps,
+                sort=sort,
+                descending=descending,
+                limit=limit,
+            ):
+                matches.append((value, number, index.manifest_path, index, offset, length))
+        if sort is not None:
+            # Merge the per-manifest orders; missing values still come last.
+            present = [match for match in matches if match[0] is not None]
+            present.sort(key=lambda match: match[0], reverse=descending)
+            matches = present + [match for match in matches if match[0] is None]
+        return [(path, index.read(offset, length)) for _, _, path, index, offset, length in matches[:limit]]
+    finally:
+        for index in indexes:
+            index.close()
+
+
+def timing_summary(manifests: Sequence[Path]) -> list[dict[str, Any]]:
+    """Aggregate timed elapsed_seconds per last transform across manifests."""
+    samples: dict[str, list[float]] = {}
+    runs: dict[str, int] = {}
+    for path in manifests:
+        with ManifestIndex(path) as index:
+            for slug, elapsed in index.timings().items():
+                samples.setdefault(slug, []).extend(elapsed)
+                runs[slug] = runs.get(slug, 0) + 1
+    summary = [
+        {
+            "transform": slug,
+            "runs": runs[slug],
+            "count": len(elapsed),
+            "total_seconds": round(sum(elapsed), 6),
+            "mean_seconds": round(statistics.fmean(elapsed), 6),
+            "median_seconds": round(statistics.median(elapsed), 6),
+            "max_seconds": round(max(elapsed), 6),
+        }
+        for slug, elapsed in samples.items()
+    ]
+    summary.sort(key=lambda entry: -entry["mean_seconds"])
+    return summary
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Filter and sort manifest records, or aggregate timing per transform, across runs."
+    )
+    parser.add_argument(
+        "paths",
+        type=Path,
+        nargs="+",
+        help="manifest.jsonl files, run directories, or corpus directories.",
+    )
+    parser.add_argument("--kind", choices=Kinds)
+    parser.add_argument("--inner", help="Slug of the first step.")
+    parser.add_argument("--outer", help="Slug of the last step.")
+    parser.add_argument(
+        "--step",
+        action="append",
+        default=[],
+        help="Slug that must appear in the application order; repeatable.",
+    )
+    parser.add_argument("--sort", choices=SortFields)
+    parser.add_argument("--descending", action="store_true")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print per-transform timing aggregates instead of records.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    manifests = manifest_paths(args.paths)
+    if args.timings:
+        for entry in timing_summary(manifests):
+            print(json.dumps(entry, sort_keys=True), flush=True)
+        return
+    for path, record in query(
+        manifests,
+        kind=args.kind,
+        inner=args.inner,
+        outer=args.outer,
+        steps=args.step,
+        sort=args.sort,
+        descending=args.descending,
+        limit=args.limit,
+    ):
+        print(json.dumps({"manifest": str(path), **record}, sort_keys=True), flush=True)
+
+
+if __name__ == "__main__":
+    main()
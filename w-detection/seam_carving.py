@@ -0,0 +1,193 @@
+"""Array-backed seam carving for content-aware resizing.
+
+Energy is the sum of absolute horizontal and vertical luminance differences.
+Seams come from a dynamic-programming pass that runs over whole rows at once.
+Removal uses a boolean keep-mask over the luminance, energy, and original
+column index arrays; pixels are gathered once at the end. After each removal,
+only the energy columns beside the removed seam are recomputed. Horizontal
+seams reuse the vertical code on transposed arrays.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+from PIL import Image
+
+
+__all__ = [
+    "carve_to_size",
+    "energy_map",
+    "find_vertical_seam",
+    "insert_vertical_seams",
+    "luminance",
+    "remove_vertical_seams",
+]
+
+
+# Columns to either side of a removed seam whose energy can change. The
+# horizontal gradient reaches one column; the vertical gradient sees the seams
+# of the neighboring rows, which are at most one column away.
+_RefreshOffsets = np.arange(-2, 2)
+
+
+def luminance(pixels: np.ndarray) -> np.ndarray:
+    """Return integer luminance for a (height, width[, channels]) pixel array."""
+    if pixels.ndim == 2:
+        return pixels.astype(np.int32)
+    if pixels.shape[2] < 3:
+        return pixels[..., 0].astype(np.int32)
+    red = pixels[..., 0].astype(np.float64)
+    green = pixels[..., 1].astype(np.float64)
+    blue = pixels[..., 2].astype(np.float64)
+    return np.rint(0.299 * red + 0.587 * green + 0.114 * blue).astype(np.int32)
+
+
+def energy_map(luminance_rows: np.ndarray) -> np.ndarray:
+    """Return the gradient energy of every pixel, clamping at the borders."""
+    height, width = luminance_rows.shape
+    x = np.arange(width)
+    y = np.arange(height)
+    horizontal = np.abs(
+        luminance_rows[:, np.minimum(x + 1, width - 1)]
+        - luminance_rows[:, np.maximum(x - 1, 0)]
+    )
+    vertical = np.abs(
+        luminance_rows[np.minimum(y + 1, height - 1), :]
+        - luminance_rows[np.maximum(y - 1, 0), :]
+    )
+    return horizontal + vertical
+
+
+def _refresh_energy(
+    energy: np.ndarray,
+    luminance_rows: np.ndarray,
+    seam: np.ndarray,
+) -> None:
+    height, width = luminance_rows.shape
+    rows = np.arange(height)[:, None]
+    columns = np.clip(seam[:, None] + _RefreshOffsets, 0, width - 1)
+    left = np.maximum(columns - 1, 0)
+    right = np.minimum(columns + 1, width - 1)
+    above = np.maximum(rows - 1, 0)
+    below = np.minimum(rows + 1, height - 1)
+    energy[rows, columns] = np.abs(
+        luminance_rows[rows, right] - luminance_rows[rows, left]
+    ) + np.abs(luminance_rows[below, columns] - luminance_rows[above, columns])
+
+
+def find_vertical_seam(energy: np.ndarray) -> np.ndarray:
+    """Return the column of the minimum-energy 8-connected seam in each row.
+
+    Ties resolve toward the left-most candidate, both between parents and for
+    the final column.
+    """
+    height, width = energy.shape
+    cumulative = np.empty((height, width), dtype=energy.dtype)
+    cumulative[0] = energy[0]
+    for y in range(1, height):
+        above = cumulative[y - 1]
+        row = cumulative[y]
+        row[0] = above[0]
+        np.minimum(above[1:], above[:-1], out=row[1:])
+        np.minimum(row[:-1], above[1:], out=row[:-1])
+        row += energy[y]
+
+    seam = np.empty(height, dtype=np.intp)
+    seam[-1] = int(np.argmin(cumulative[-1]))
+    for y in range(height - 1, 0, -1):
+        first = max(0, seam[y] - 1)
+        seam[y - 1] = first + int(np.argmin(cumulative[y - 1, first : seam[y] + 2]))
+    return seam
+
+
+def _carve_columns(pixels: np.ndarray, count: int) -> tuple[np.ndarray, np.ndarray]:
+    """Remove count seams and return (kept original columns, removed mask)."""
+    height, width = pixels.shape[:2]
+    if not 0 <= count < width:
+        raise ValueError("seam count must be in [0, width)")
+
+    luminance_rows = luminance(pixels)
+    energy = energy_map(luminance_rows)
+    columns = np.broadcast_to(np.arange(width, dtype=np.int32), (height, width)).copy()
+    removed = np.zeros((height, width), dtype=bool)
+    rows = np.arange(height)
+
+    for _ in range(count):
+        seam = find_vertical_seam(energy)
+        removed[rows, columns[rows, seam]] = True
+        keep = np.ones(luminance_rows.shape, dtype=bool)
+        keep[rows, seam] = False
+        new_width = luminance_rows.shape[1] - 1
+        luminance_rows = luminance_rows[keep].reshape(height, new_width)
+        energy = energy[keep].reshape(height, new_width)
+        columns = columns[keep].reshape(height, new_width)
+        _refresh_energy(energy, luminance_rows, seam)
+
+    return columns, removed
+
+
+def remove_vertical_seams(pixels: np.ndarray, count: int) -> np.ndarray:
+    """Remove count low-energy vertical seams from a pixel array."""
+    columns, _ = _carve_columns(pixels, count)
+    return pixels[np.arange(pixels.shape[0])[:, None], columns]
+
+
+def insert_vertical_seams(pixels: np.ndarray, count: int) -> np.ndarray:
+    """Widen a pixel array by duplicating its count lowest-energy seams.
+
+    Each inserted pixel is the rounded mean of the seam pixel and its right
+    neighbor. A single pass can add at most width - 1 seams.
+    """
+    height, width = pixels.shape[:2]
+    if not 0 <= count < width:
+        raise ValueError("a single insertion pass adds between 0 and width - 1 seams")
+    _, duplicated = _carve_columns(pixels, count)
+
+    flat = pixels.reshape(height * width, -1)
+    counts = 1 + duplicated.ravel().astype(np.intp)
+    source = np.repeat(np.arange(height * width), counts)
+    starts = np.cumsum(counts) - counts
+    inserted = starts[counts == 2] + 1
+
+    result = flat[source]
+    seam_pixels = source[inserted]
+    at_right_edge = seam_pixels % width == width - 1
+    neighbors = np.where(at_right_edge, seam_pixels, seam_pixels + 1)
+    mean = (flat[seam_pixels].astype(np.float64) + flat[neighbors]) / 2
+    result[inserted] = np.rint(mean).astype(pixels.dtype)
+    return result.reshape((height, width + count) + pixels.shape[2:])
+
+
+def _resize_width(pixels: np.ndarray, width: int) -> np.ndarray:
+    while pixels.shape[1] < width:
+        step = min(width - pixels.shape[1], pixels.shape[1] - 1)
+        if step < 1:
+            raise ValueError("cannot insert seams into a one-pixel-wide image")
+        pixels = insert_vertical_seams(pixels, step)
+    if pixels.shape[1] > width:
+        pixels = remove_vertical_seams(pixels, pixels.shape[1] - width)
+    return pixels
+
+
+def carve_to_size(image: Image.Image, size: tuple[int, int]) -> Image.Image:
+    """Seam-carve to an exact size, removing or inserting seams per axis.
+
+    Width changes use vertical seams first; height changes then use horizontal
+    seams. Modes whose NumPy layout differs from their raw layout ("1") are
+    carved as "L" and converted back.
+    """
+    if not isinstance(image, Image.Image):
+        raise TypeError("image must be a PIL.Image.Image")
+    width, height = size
+    if width < 1 or height < 1:
+        raise ValueError("target size must be positive")
+
+    working = image.convert("L") if image.mode == "1" else image
+    pixels = _resize_width(np.asarray(working), width)
+    pixels = np.swapaxes(_resize_width(np.swapaxes(pixels, 0, 1), height), 0, 1)
+
+    carved = Image.new(working.mode, (width, height))
+    carved.frombytes(np.ascontiguousarray(pixels).tobytes())
+    if working.mode == "P":
+        carved.putpalette(working.getpalette())
+    return carved.convert("1") if image.mode == "1" else carved
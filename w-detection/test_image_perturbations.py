@@ -1,9 +1,19 @@
 from __future__ import annotations
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import hashlib
 import importlib.util
+import io
+import itertools
+import json
+import multiprocessing
 from pathlib import Path
+import tempfile
+import tracemalloc
 import unittest
+from unittest import mock
 
+import numpy as np
 from PIL import Image
 
 
@@ -13,6 +23,21 @@ if SPEC is None or SPEC.loader is None:
     raise RuntimeError(f"Could not load {MODULE_PATH}")
 perturbations = importlib.util.module_from_spec(SPEC)
 SPEC.loader.exec_module(perturbations)
+seam_carving = perturbations.seam_carving
+
+import benchmark_perturbations  # noqa: E402
+import generate_random_variants  # noqa: E402
+import generate_variants  # noqa: E402
+import perturbation_batch  # noqa: E402
+import perturbation_cache  # noqa: E402
+import perturbation_codecs  # noqa: E402
+import perturbation_pipeline  # noqa: E402
+import perturbation_random  # noqa: E402
+import perturbation_tiles  # noqa: E402
+import query_manifest  # noqa: E402
+import variant_manifest  # noqa: E402
+import variant_metrics  # noqa: E402
+import variant_output  # noqa: E402
 
 
 def make_pattern(width: int = 48, height: int = 40) -> Image.Image:
@@ -113,6 +138,173 @@ class ImagePerturbationTests(unittest.TestCase):
                 self.assertEqual(first.size, second.size)
                 self.assertEqual(first.tobytes(), second.tobytes())
 
+    def test_additive_sensor_noise_follows_seed_contract(self) -> None:
+        self.assertEqual(2, perturbations.SeedContractVersion)
+        gate, polarity, gaussian = (
+            perturbation_random.CounterStream(41, "additive_sensor_noise", name)
+            for name in ("gate", "polarity", "gaussian")
+        )
+        source = np.asarray(self.image)
+        pixels = source.shape[0] * source.shape[1]
+        noise = gaussian.normal(0, 3 * pixels).reshape(source.shape) * np.float32(6.0)
+        expected = np.clip(np.rint(source + noise), 0, 255).astype(np.uint8)
+        impulses = gate.uniform(0, pixels).reshape(source.shape[:2]) < 0.1
+        dark = polarity.uniform(0, pixels).reshape(source.shape[:2]) < 0.5
+        expected[impulses & dark] = 0
+        expected[impulses & ~dark] = 255
+
+        result = perturbations.additive_sensor_noise(
+            self.image,
+            standard_deviation=6.0,
+            salt_pepper_probability=0.1,
+            seed=41,
+        )
+        np.testing.assert_array_equal(expected, np.asarray(result))
+
+    def test_additive_sensor_noise_keeps_mode_and_alpha(self) -> None:
+        for mode in ("L", "LA", "RGB", "RGBA"):
+            with self.subTest(mode=mode):
+                source = self.image.convert(mode)
+                result = perturbations.additive_sensor_noise(source, seed=3)
+                self.assertEqual(mode, result.mode)
+                self.assertEqual(source.size, result.size)
+                if "A" in mode:
+                    self.assertEqual(
+                        source.getchannel("A").tobytes(),
+                        result.getchannel("A").tobytes(),
+                    )
+
+    def test_seam_search_matches_reference_dynamic_program(self) -> None:
+        rng = np.random.default_rng(5)
+        for _ in range(20):
+            energy = rng.integers(0, 4, (9, 7)).astype(np.int32)
+            rows = energy.tolist()
+            cumulative = rows[0][:]
+            parents = []
+            for row in rows[1:]:
+                row_parents = [
+                    min(
+                        range(max(0, x - 1), min(len(row), x + 2)),
+                        key=lambda candidate: cumulative[candidate],
+                    )
+                    for x in range(len(row))
+                ]
+                cumulative = [row[x] + cumulative[row_parents[x]] for x in range(len(row))]
+                parents.append(row_parents)
+            expected = [min(range(len(cumulative)), key=lambda x: cumulative[x])]
+            for row_parents in reversed(parents):
+                expected.insert(0, row_parents[expected[0]])
+
+            self.assertEqual(expected, seam_carving.find_vertical_seam(energy).tolist())
+
+    def test_seam_energy_refresh_matches_full_recompute(self) -> None:
+        luminance = seam_carving.luminance(np.asarray(self.image))
+        energy = seam_carving.energy_map(luminance)
+        rows = np.arange(luminance.shape[0])
+        for _ in range(8):
+            seam = seam_carving.find_vertical_seam(energy)
+            keep = np.ones(luminance.shape, dtype=bool)
+            keep[rows, seam] = False
+            width = luminance.shape[1] - 1
+            luminance = luminance[keep].reshape(-1, width)
+            energy = energy[keep].reshape(-1, width)
+            seam_carving._refresh_energy(energy, luminance, seam)
+            np.testing.assert_array_equal(seam_carving.energy_map(luminance), energy)
+
+    def test_seam_carving_removes_and_inserts_on_both_axes(self) -> None:
+        for mode in ("L", "RGB", "RGBA", "P"):
+            source = self.image.convert(mode)
+            for size in ((40, 40), (48, 33), (60, 40), (48, 52), (30, 70)):
+                with self.subTest(mode=mode, size=size):
+                    carved = seam_carving.carve_to_size(source, size)
+                    self.assertEqual(mode, carved.mode)
+                    self.assertEqual(size, carved.size)
+
+        compressed = perturbations.content_aware_seam_compress(
+            self.image,
+            width_fraction=0.1,
+            height_fraction=0.1,
+            restore_size=False,
+        )
+        self.assertEqual((43, 36), compressed.size)
+        self.assertEqual(self.original_bytes, self.image.tobytes())
+
+    def test_dense_mesh_remap_tracks_pil_mesh(self) -> None:
+        ramp = np.linspace(0, 255, 64)
+        gradient = np.stack(
+            (
+                np.add.outer(ramp[:48] / 2, ramp / 2),
+                np.add.outer(ramp[:48], np.zeros(64)),
+                np.add.outer(np.zeros(48), ramp),
+                np.add.outer(255 - ramp[:48] / 2, np.zeros(64)),
+            ),
+            axis=-1,
+        ).astype(np.uint8)
+        noise = np.random.default_rng(3).integers(0, 256, (40, 31, 4), dtype=np.uint8)
+        operations = [
+            lambda image, **options: perturbations.wave_displacement(image, mesh_size=40, **options),
+            lambda image, **options: perturbations.localized_swirl(
+                image, strength_degrees=30, mesh_size=40, **options
+            ),
+            lambda image, **options: perturbations.radial_lens_distortion(image, mesh_size=40, **options),
+            lambda image, **options: perturbations.elastic_deformation(
+                image, mesh_columns=40, mesh_rows=40, **options
+            ),
+            # These sample outside the image, so part of the output is fill.
+            lambda image, **options: perturbations.radial_lens_distortion(image, strength=0.3, **options),
+            lambda image, **options: perturbations.radial_lens_distortion(
+                image, strength=0.3, fill=(9, 200, 40, 128)[: len(image.getbands())], **options
+            ),
+            lambda image, **options: perturbations.wave_displacement(
+                image, amplitude_fraction=0.1, angle_degrees=35, **options
+            ),
+        ]
+        for name, pixels in (("gradient", gradient), ("noise", noise)):
+            for mode in ("L", "LA", "RGB", "RGBA"):
+                source = Image.fromarray(pixels, "RGBA").convert(mode)
+                for index, operation in enumerate(operations):
+                    with self.subTest(source=name, mode=mode, index=index):
+                        remapped = np.asarray(operation(source, dense_remap=True), dtype=int)
+                        meshed = np.asarray(operation(source), dtype=int)
+                        self.assertLessEqual(np.abs(remapped - meshed).max(), 2)
+
+    def test_mesh_transforms_default_to_pil_mesh(self) -> None:
+        with mock.patch.object(perturbations, "_remap") as remap:
+            perturbations.radial_lens_distortion(self.image)
+            perturbations.mesh_warp(self.image, mesh_columns=60, mesh_rows=60)
+        remap.assert_not_called()
+
+    def test_palettes_come_from_a_reduced_sample_and_are_cached(self) -> None:
+        image = make_pattern(40, 30)
+        perturbations._palette_cache.clear()
+        with mock.patch.object(perturbations, "PaletteSamplePixels", 100):
+            for function, dither in (
+                (perturbations.palette_quantization, Image.Dither.NONE),
+                (perturbations.apply_dithering, Image.Dither.FLOYDSTEINBERG),
+            ):
+                sample = image.reduce(4)
+                palette = sample.quantize(colors=16, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+                expected = image.quantize(palette=palette, dither=dither).convert("RGB")
+                with self.subTest(function=function.__name__):
+                    np.testing.assert_array_equal(np.asarray(expected), np.asarray(function(image, colors=16)))
+        self.assertEqual(1, len(perturbations._palette_cache))
+
+    def test_palette_cache_is_shared_safely_between_threads(self) -> None:
+        images = [make_pattern(20 + index, 16) for index in range(12)]
+        expected = [np.asarray(perturbations.palette_quantization(image, colors=8)) for image in images]
+        perturbations._palette_cache.clear()
+        with mock.patch.object(perturbations, "PaletteCacheEntries", 4):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(
+                    executor.map(
+                        lambda image: np.asarray(perturbations.palette_quantization(image, colors=8)),
+                        images * 8,
+                    )
+                )
+            self.assertLessEqual(len(perturbations._palette_cache), 4)
+        for index, result in enumerate(results):
+            np.testing.assert_array_equal(expected[index % len(images)], result)
+
     def test_invalid_ranges_fail_closed(self) -> None:
         with self.assertRaises(ValueError):
             perturbations.asymmetric_edge_crop(self.image, left=0.6, right=0.5)
@@ -124,5 +316,861 @@ class ImagePerturbationTests(unittest.TestCase):
             perturbations.random_non_targeted_cutout(self.image, shape="targeted")
 
 
+class PerturbationBatchTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.batch = perturbation_batch
+        pattern = make_pattern()
+        self.sources = [
+            pattern,
+            pattern.rotate(180),
+            pattern.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+        ]
+
+    def test_stack_results_match_single_image_calls(self) -> None:
+        cases = [
+            ("additive_sensor_noise", "RGB", {"standard_deviation": 4.0, "salt_pepper_probability": 0.05}),
+            ("additive_sensor_noise", "L", {}),
+            ("gaussian_blur", "RGBA", {"radius": 1.5}),
+            ("palette_quantization", "RGBA", {"colors": 16}),
+            ("mesh_warp", "RGB", {}),
+        ]
+        for function_name, mode, arguments in cases:
+            with self.subTest(function=function_name, mode=mode):
+                stack = self.batch.ImageStack.from_images(self.sources, mode)
+                function = getattr(self.batch.perturb, function_name)
+                accepts_seed = function_name in ("additive_sensor_noise", "mesh_warp")
+                seeds = [11, 12, 13] if accepts_seed else None
+                result = self.batch.apply_to_stack(
+                    function_name,
+                    stack,
+                    seeds=seeds,
+                    arguments=arguments,
+                    workers=2,
+                )
+                for index, source in enumerate(self.sources):
+                    extra = {"seed": seeds[index]} if seeds else {}
+                    expected = function(source.convert(mode), **arguments, **extra)
+                    self.assertEqual(expected.mode, result.mode)
+                    np.testing.assert_array_equal(
+                        np.asarray(expected).reshape(result.pixels.shape[1:]),
+                        result.pixels[index],
+                    )
+
+    def test_per_image_arguments_and_mismatches_fail_closed(self) -> None:
+        stack = self.batch.ImageStack.repeat(self.sources[0], 3, "RGB")
+        self.assertEqual(3, stack.count)
+        with self.assertRaises(ValueError):
+            self.batch.apply_to_stack("gaussian_blur", stack, seeds=[1, 2, 3])
+        with self.assertRaises(ValueError):
+            self.batch.apply_to_stack("additive_sensor_noise", stack, seeds=[1, 2])
+        with self.assertRaises(ValueError):
+            self.batch.apply_to_stack(
+                "asymmetric_edge_crop",
+                stack,
+                arguments=[{"right": 0.1}, {"right": 0.2}, {"right": 0.1}],
+            )
+        cropped = self.batch.apply_to_stack(
+            "asymmetric_edge_crop",
+            stack,
+            arguments=[{"right": 0.1}] * 3,
+        )
+        self.assertEqual((43, 40), cropped.size)
+
+    def test_sensor_noise_kernels_share_the_function_defaults_and_checks(self) -> None:
+        perturb = self.batch.perturb
+        source = self.sources[0]
+        stack = self.batch.ImageStack.from_images([source], "RGB")
+
+        def run_all(arguments: dict) -> list[np.ndarray]:
+            return [
+                np.asarray(perturb.additive_sensor_noise(source, **arguments)),
+                self.batch.apply_to_stack("additive_sensor_noise", stack, arguments=arguments).pixels[0],
+                perturbation_tiles.apply_tiled("additive_sensor_noise", source, arguments=arguments)[0],
+            ]
+
+        with mock.patch.dict(perturb.additive_sensor_noise.__kwdefaults__, {"standard_deviation": 20.0, "seed": 9}):
+            defaulted = run_all({})
+        explicit = run_all({"standard_deviation": 20.0, "seed": 9})
+        for result, expected in zip(defaulted, explicit):
+            np.testing.assert_array_equal(expected, result)
+        for arguments in ({"standard_deviation": -1.0}, {"salt_pepper_probability": 1.5}):
+            with self.subTest(arguments=arguments):
+                with self.assertRaises(ValueError):
+                    perturb._sensor_noise_settings(**arguments)
+                with self.assertRaises(ValueError):
+                    self.batch._sensor_noise_kernel(np.asarray(source), **arguments)
+        with self.assertRaises(TypeError):
+            perturb._sensor_noise_settings(sigma=2.0)
+
+
+class CounterStreamTests(unittest.TestCase):
+    def test_draws_depend_only_on_key_and_position(self) -> None:
+        stream = perturbation_random.CounterStream(7, "transform", "stream")
+        normals = stream.normal(0, 64)
+        uniforms = stream.uniform(0, 64)
+        integers = stream.integers(0, 64, -3, 4)
+        for start, count in ((0, 1), (1, 4), (5, 0), (6, 17), (13, 51)):
+            with self.subTest(start=start, count=count):
+                np.testing.assert_array_equal(normals[start : start + count], stream.normal(start, count))
+                np.testing.assert_array_equal(uniforms[start : start + count], stream.uniform(start, count))
+                np.testing.assert_array_equal(integers[start : start + count], stream.integers(start, count, -3, 4))
+        self.assertEqual(float(uniforms[9]), stream.uniform_at(9))
+        self.assertEqual(int(integers[9]), stream.integer_at(9, -3, 4))
+        self.assertTrue(((-3 <= integers) & (integers < 4)).all())
+        self.assertTrue(((0 <= uniforms) & (uniforms < 1)).all())
+
+        for other in (
+            perturbation_random.CounterStream(8, "transform", "stream"),
+            perturbation_random.CounterStream(7, "other", "stream"),
+            perturbation_random.CounterStream(7, "transform", "other"),
+        ):
+            self.assertFalse(np.array_equal(uniforms, other.uniform(0, 64)))
+        with self.assertRaises(TypeError):
+            perturbation_random.CounterStream(1.5, "transform")
+        with self.assertRaises(ValueError):
+            stream.uniform(-1, 2)
+
+
+class CodecRoundTripTests(unittest.TestCase):
+    def test_round_trips_match_direct_encoding_and_memoize(self) -> None:
+        image = make_pattern(48, 32)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=70, subsampling=1, optimize=False)
+        with Image.open(buffer) as decoded:
+            expected = np.asarray(decoded.convert("RGB"))
+
+        service = perturbation_codecs.CodecRoundTrips(max_bytes=2 * 48 * 32 * 3)
+        parameters = {"quality": 70, "subsampling": 1, "optimize": False}
+        first = service.run(image, "JPEG", parameters)
+        second = service.run(image, "JPEG", parameters)
+        np.testing.assert_array_equal(expected, np.asarray(first))
+        np.testing.assert_array_equal(expected, np.asarray(second))
+        self.assertIsNot(first, second)
+        self.assertEqual((2, 1, buffer.tell()), (
+            service.statistics.calls,
+            service.statistics.hits,
+            service.statistics.encoded_bytes,
+        ))
+
+        for quality in (50, 60):
+            service.run(image, "JPEG", {**parameters, "quality": quality})
+        service.run(image, "JPEG", parameters)
+        self.assertEqual(1, service.statistics.hits)
+
+        stack = perturbation_batch.ImageStack.repeat(image, 4, "RGB")
+        threaded = perturbation_batch.apply_to_stack("webp_recompression", stack, workers=3)
+        for index in range(stack.count):
+            np.testing.assert_array_equal(
+                np.asarray(perturbations.webp_recompression(image)),
+                threaded.pixels[index],
+            )
+
+
+class PerturbationPipelineTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.pipeline = perturbation_pipeline
+        self.TransformSpec = perturbation_pipeline.TransformSpec
+        self.image = make_pattern()
+
+    def run_sequential(self, specs, image: Image.Image) -> Image.Image:
+        result = image
+        for spec in specs:
+            result = spec.apply(result)
+        return result
+
+    def test_fused_lookup_matches_sequential_output(self) -> None:
+        specs = [
+            self.TransformSpec(1, "gamma-a", "gamma_contrast_remap", {"gamma": 1.3, "contrast": 1.4}),
+            self.TransformSpec(2, "gamma-b", "gamma_contrast_remap", {"gamma": 0.8, "contrast": 0.6}),
+            self.TransformSpec(3, "gamma-c", "gamma_contrast_remap", {}),
+        ]
+        compiled = self.pipeline.compile_pipeline(specs)
+        self.assertEqual(
+            [{"kind": "lookup", "fused": True, "steps": ["gamma-a", "gamma-b", "gamma-c"]}],
+            compiled.fusion_report(),
+        )
+        for mode in ("RGB", "RGBA", "L"):
+            with self.subTest(mode=mode):
+                source = self.image.convert(mode)
+                np.testing.assert_array_equal(
+                    np.asarray(self.run_sequential(specs, source)),
+                    np.asarray(compiled.apply(source)),
+                )
+
+    def test_fused_geometry_resamples_once_and_tracks_sequential(self) -> None:
+        specs = [
+            self.TransformSpec(1, "translate", "translate_and_pad", {"x_fraction": 0.02, "y_fraction": 0.02}),
+            self.TransformSpec(2, "rotate", "micro_rotate", {"degrees": 0.3, "clockwise": True, "expand": True}),
+            self.TransformSpec(3, "shear", "affine_shear", {"x_degrees": 2.0}),
+            self.TransformSpec(4, "subpixel", "subpixel_translation", {"x_pixels": 0.35, "y_pixels": 0.35}),
+            self.TransformSpec(5, "gamma", "gamma_contrast_remap", {}),
+            self.TransformSpec(6, "keystone", "perspective_keystone", {"top_inset_fraction": 0.04}),
+            self.TransformSpec(7, "padded", "translate_and_pad", {"fill": (255, 0, 0)}),
+        ]
+        compiled = self.pipeline.compile_pipeline(specs)
+        self.assertEqual(
+            [
+                ("geometric", ["translate", "rotate", "shear", "subpixel"]),
+                ("lookup", ["gamma"]),
+                ("geometric", ["keystone"]),
+                ("geometric", ["padded"]),
+            ],
+            [(stage["kind"], stage["steps"]) for stage in compiled.fusion_report()],
+        )
+        self.assertEqual(3, compiled.resample_count)
+
+        source = self.image.resize((160, 120))
+        sequential = np.asarray(self.run_sequential(specs[:4], source), dtype=np.int16)
+        fused = np.asarray(self.pipeline.compile_pipeline(specs[:4]).apply(source), dtype=np.int16)
+        self.assertEqual(sequential.shape, fused.shape)
+        self.assertLess(float(np.median(np.abs(sequential - fused))), 8.0)
+
+    def test_omitted_arguments_follow_the_function_defaults(self) -> None:
+        perturb = self.pipeline.perturb
+        self.addCleanup(self.pipeline._defaults.cache_clear)
+        changed = {
+            "translate_and_pad": {"x_fraction": 0.05},
+            "subpixel_translation": {"y_pixels": 0.6},
+            "affine_shear": {"x_degrees": 4.0},
+            "micro_rotate": {"degrees": 1.5, "expand": False},
+            "perspective_keystone": {"top_inset_fraction": 0.1},
+            "gamma_contrast_remap": {"gamma": 0.8, "contrast": 1.3},
+        }
+        for function_name, defaults in changed.items():
+            with self.subTest(function=function_name):
+                explicit = [self.TransformSpec(number, "explicit", function_name, dict(defaults)) for number in (1, 2)]
+                omitted = [self.TransformSpec(number, "omitted", function_name, {}) for number in (1, 2)]
+                expected = self.pipeline.compile_pipeline(explicit).apply(self.image)
+                self.pipeline._defaults.cache_clear()
+                with mock.patch.dict(getattr(perturb, function_name).__kwdefaults__, defaults):
+                    fused = self.pipeline.compile_pipeline(omitted).apply(self.image)
+                self.pipeline._defaults.cache_clear()
+                np.testing.assert_array_equal(np.asarray(expected), np.asarray(fused))
+
+
+class PerturbationTileTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tiles = perturbation_tiles
+        pattern = np.asarray(make_pattern(61, 97).convert("RGBA")).copy()
+        pattern[..., 3] = np.arange(61, dtype=np.uint8)[None, :] * 4
+        self.image = Image.fromarray(pattern)
+        # Room for a few rows per strip, so every image spans many strips.
+        self.budget = 61 * 64 * 12
+
+    def test_strips_match_whole_image_functions(self) -> None:
+        cases = [
+            ("additive_sensor_noise", {"salt_pepper_probability": 0.05, "seed": 4}),
+            ("gaussian_blur", {"radius": 2.7}),
+            ("median_filter", {"size": 5}),
+            ("motion_blur", {"angle_degrees": 60.0}),
+            ("gamma_contrast_remap", {"gamma": 0.7, "contrast": 1.6}),
+            ("chroma_subsample_and_channel_shift", {"chroma_scale": 0.3, "red_shift": (1.5, 2.0)}),
+            ("palette_quantization", {"colors": 12}),
+        ]
+        for mode in ("L", "LA", "RGB", "RGBA"):
+            source = self.image.convert(mode)
+            for (function_name, arguments), workers in itertools.product(cases, (1, 3)):
+                with self.subTest(mode=mode, function=function_name, workers=workers):
+                    expected = getattr(perturbations, function_name)(source, **arguments)
+                    pixels, output_mode = self.tiles.apply_tiled(
+                        function_name,
+                        np.asarray(source).reshape(97, 61, -1),
+                        mode=mode,
+                        arguments=arguments,
+                        memory_budget=self.budget * workers,
+                        workers=workers,
+                    )
+                    self.assertEqual(expected.mode, output_mode)
+                    np.testing.assert_array_equal(
+                        np.asarray(expected).reshape(pixels.shape),
+                        pixels,
+                    )
+
+    def test_omitted_arguments_follow_the_function_defaults(self) -> None:
+        perturb = self.tiles.perturb
+        self.addCleanup(self.tiles._defaults.cache_clear)
+        changed = {
+            "gaussian_blur": {"radius": 3.1},
+            "median_filter": {"size": 7},
+            "motion_blur": {"length": 3},
+            "gamma_contrast_remap": {"gamma": 0.7, "contrast": 1.6},
+            "chroma_subsample_and_channel_shift": {"chroma_scale": 0.3, "red_shift": (1.0, 3.0)},
+            "palette_quantization": {"colors": 12},
+        }
+        for function_name, defaults in changed.items():
+            with self.subTest(function=function_name):
+                expected = getattr(perturb, function_name)(self.image, **defaults)
+                self.tiles._defaults.cache_clear()
+                with mock.patch.dict(getattr(perturb, function_name).__kwdefaults__, defaults):
+                    pixels, _ = self.tiles.apply_tiled(function_name, self.image, memory_budget=self.budget)
+                self.tiles._defaults.cache_clear()
+                np.testing.assert_array_equal(np.asarray(expected).reshape(pixels.shape), pixels)
+
+    def test_working_memory_stays_within_the_budget(self) -> None:
+        # NumPy reports its buffers to tracemalloc; the source and output
+        # arrays are allocated before tracing, as the budget excludes them.
+        arguments = {"additive_sensor_noise": {"salt_pepper_probability": 0.05}}
+        budget = 1 << 20
+        generator = np.random.default_rng(6)
+        for mode, function_name, workers in itertools.product(
+            ("L", "RGB", "RGBA"), self.tiles.TiledTransforms, (1, 2)
+        ):
+            with self.subTest(mode=mode, function=function_name, workers=workers):
+                source = generator.integers(0, 256, (200, 300, self.tiles.TiledBands[mode]), dtype=np.uint8)
+                output_mode = getattr(perturbations, function_name)(Image.new(mode, (1, 1))).mode
+                output = np.empty((200, 300, self.tiles.TiledBands[output_mode]), dtype=np.uint8)
+                tracemalloc.start()
+                try:
+                    self.tiles.apply_tiled(
+                        function_name,
+                        source,
+                        mode=mode,
+                        arguments=arguments.get(function_name, {}),
+                        memory_budget=budget,
+                        output=output,
+                        workers=workers,
+                    )
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                self.assertLessEqual(peak, budget)
+
+    def test_quantization_palette_does_not_depend_on_budget(self) -> None:
+        output = np.zeros((97, 61, 3), dtype=np.uint8)
+        small, mode = self.tiles.apply_tiled(
+            "palette_quantization",
+            self.image,
+            arguments={"colors": 8},
+            memory_budget=self.budget * 2,
+            output=output,
+        )
+        large, _ = self.tiles.apply_tiled("palette_quantization", self.image, arguments={"colors": 8})
+        self.assertIs(output, small)
+        self.assertEqual("RGB", mode)
+        np.testing.assert_array_equal(small, large)
+        self.assertLessEqual(len(np.unique(small.reshape(-1, 3), axis=0)), 8)
+
+    def test_unsupported_requests_fail_closed(self) -> None:
+        with self.assertRaises(ValueError):
+            self.tiles.apply_tiled("mesh_warp", self.image)
+        with self.assertRaises(ValueError):
+            self.tiles.apply_tiled("gaussian_blur", self.image, memory_budget=1024)
+        with self.assertRaises(ValueError):
+            self.tiles.apply_tiled("gaussian_blur", self.image, arguments={"radius": -1.0})
+        with self.assertRaises(ValueError):
+            self.tiles.apply_tiled("gaussian_blur", self.image.convert("P"))
+        with self.assertRaises(ValueError):
+            self.tiles.apply_tiled("gaussian_blur", self.image, output=np.empty((97, 61, 3), dtype=np.uint8))
+
+
+class BenchmarkTests(unittest.TestCase):
+    def test_cases_cover_singles_and_ordered_pairs(self) -> None:
+        benchmark = benchmark_perturbations
+        singles = benchmark.plan_cases(sizes=((32, 24),), modes=("L", "RGB"), pairs=False)
+        every = benchmark.plan_cases(sizes=((32, 24),), modes=("RGB",), pairs=True)
+        self.assertEqual(2 * 30, len(singles))
+        self.assertEqual(30 + 30 * 30, len(every))
+        blurs = benchmark.plan_cases(sizes=((32, 24),), modes=("RGB",), pairs=True, only=("blur",))
+        self.assertIn(("RGB", (32, 24), ("gaussian-blur", "motion-blur")), blurs)
+        self.assertTrue(all("blur" in slug for _, _, slugs in blurs for slug in slugs))
+
+        result = benchmark.run_case("RGBA", (32, 24), ("gaussian-blur", "motion-blur"), 2)
+        self.assertEqual(["gaussian-blur", "motion-blur"], result["steps"])
+        self.assertGreaterEqual(result["peak_rss_bytes"], result["setup_peak_rss_bytes"])
+        self.assertLessEqual(result["wall_seconds_min"], result["wall_seconds_median"])
+
+    def test_compare_flags_only_meaningful_regressions(self) -> None:
+        def report(seconds: float, growth: int) -> dict:
+            return {
+                "cases": {
+                    "RGB 32x24 dithering": {
+                        "wall_seconds_min": seconds,
+                        "setup_peak_rss_bytes": 1 << 26,
+                        "peak_rss_bytes": (1 << 26) + growth,
+                    }
+                }
+            }
+
+        baseline = report(0.010, 8 << 20)
+        compare = benchmark_perturbations.compare
+        self.assertEqual([], compare(report(0.0115, 9 << 20), baseline))
+        self.assertEqual([], compare(report(0.0001, 0), report(0.00001, 0)))
+        flagged = compare(report(0.020, 16 << 20), baseline)
+        self.assertEqual(
+            ["wall_seconds_min", "pipeline_rss_growth_bytes"],
+            [regression["metric"] for regression in flagged],
+        )
+
+
+def churn_cache(directory: str, worker: int) -> int:
+    """Read and write a few keys in a cache too small to hold them all."""
+    image = make_pattern()
+    expected = image.tobytes()
+    hits = 0
+    with perturbation_cache.PerturbationCache(Path(directory), max_bytes=2 * len(expected)) as cache:
+        for step in range(60):
+            key = f"key-{(step * (worker + 1)) % 5}"
+            cached = cache.get(key)
+            if cached is None:
+                cache.put(key, image)
+            else:
+                if cached.tobytes() != expected:
+                    raise AssertionError(f"{key} returned different pixels")
+                hits += 1
+    return hits
+
+
+class PerturbationCacheTests(unittest.TestCase):
+    def setUp(self) -> None:
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        self.directory = Path(temporary.name)
+        self.image = make_pattern()
+        by_slug = {spec.slug: spec for spec in generate_variants.Transforms}
+        self.pipeline = [by_slug["gaussian-blur"], by_slug["micro-rotate"], by_slug["dithering"]]
+
+    def open_cache(self, max_bytes: int = 1 << 30):
+        cache = perturbation_cache.PerturbationCache(self.directory, max_bytes=max_bytes)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_longest_prefix_is_reused_and_results_round_trip(self) -> None:
+        expected = self.image
+        for spec in self.pipeline:
+            expected = spec.apply(expected)
+
+        cache = self.open_cache()
+        first, cached_steps = cache.run("source", self.image, self.pipeline[:2])
+        self.assertEqual(0, cached_steps)
+        result, cached_steps = cache.run("source", self.image, self.pipeline)
+        self.assertEqual(2, cached_steps)
+        np.testing.assert_array_equal(np.asarray(expected), np.asarray(result))
+        self.assertEqual(3, cache.run("source", self.image, self.pipeline)[1])
+        self.assertEqual(0, cache.run("other-source", self.image, self.pipeline[:1])[1])
+
+        paletted = self.image.quantize(colors=8)
+        paletted.info["transparency"] = 3
+        cache.put("paletted", paletted)
+        restored = self.open_cache().get("paletted")
+        self.assertEqual("P", restored.mode)
+        self.assertEqual(paletted.getpalette(), restored.getpalette())
+        self.assertEqual(3, restored.info["transparency"])
+        np.testing.assert_array_equal(np.asarray(paletted), np.asarray(restored))
+
+    def test_eviction_is_least_recently_used_and_corruption_fails_closed(self) -> None:
+        entry_bytes = len(self.image.tobytes())
+        cache = self.open_cache(max_bytes=2 * entry_bytes)
+        cache.put("a", self.image)
+        cache.put("b", self.image)
+        self.assertIsNotNone(cache.get("a"))
+        cache.put("c", self.image)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertEqual(2 * entry_bytes, cache.total_bytes)
+
+        path = self.directory / "objects" / "c" / "c.raw"
+        path.write_bytes(b"\0" * entry_bytes)
+        with self.assertRaises(ValueError):
+            cache.get("c")
+
+    def test_processes_sharing_a_cache_never_read_an_evicted_object(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=4, mp_context=context) as executor:
+            hits = list(executor.map(churn_cache, [str(self.directory)] * 4, range(4)))
+        self.assertGreater(sum(hits), 0)
+
+        cache = self.open_cache(max_bytes=2 * len(self.image.tobytes()))
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+        for (key,) in cache._connection.execute("SELECT key FROM entries"):
+            self.assertTrue(cache._object_path(key).exists(), key)
+
+        cache._object_path(key).unlink()
+        self.assertIsNone(cache.get(key))
+        self.assertIsNone(cache._connection.execute("SELECT key FROM entries WHERE key = ?", (key,)).fetchone())
+
+
+class SharedImageTests(unittest.TestCase):
+    def test_published_images_attach_with_pixels_palette_and_transparency(self) -> None:
+        paletted = make_pattern().quantize(colors=8)
+        paletted.info["transparency"] = 2
+        for image in (make_pattern().convert("L"), make_pattern().convert("RGBA"), paletted):
+            with self.subTest(mode=image.mode):
+                segment, shared = generate_variants._publish_image(image)
+                try:
+                    attached_segment, attached = generate_variants._attach_image(shared)
+                    self.assertEqual(image.mode, attached.mode)
+                    self.assertEqual(image.getpalette(), attached.getpalette())
+                    self.assertEqual(image.info.get("transparency"), attached.info.get("transparency"))
+                    np.testing.assert_array_equal(np.asarray(image), np.asarray(attached))
+                    attached.close()
+                    del attached
+                    attached_segment.close()
+                finally:
+                    segment.close()
+                    segment.unlink()
+
+
+class ManifestWriterTests(unittest.TestCase):
+    def test_readers_and_resume_trust_only_the_checkpointed_prefix(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "manifest.jsonl"
+            with variant_manifest.ManifestWriter(path, commit_records=2, commit_seconds=3600) as writer:
+                for number in range(3):
+                    writer.append({"image_number": number})
+                self.assertEqual(
+                    [{"image_number": 0}, {"image_number": 1}],
+                    variant_manifest.read_checkpointed(path),
+                )
+            self.assertEqual(3, len(variant_manifest.read_checkpointed(path)))
+
+            with path.open("ab") as manifest:
+                manifest.write(b'{"image_number": 3, "tor')
+            with variant_manifest.ManifestWriter(path, resume=True) as writer:
+                writer.append({"image_number": 3})
+            records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+            self.assertEqual([{"image_number": number} for number in range(4)], records)
+            self.assertEqual(records, variant_manifest.read_checkpointed(path))
+
+            path.write_bytes(path.read_bytes().replace(b"1", b"7", 1))
+            with self.assertRaises(ValueError):
+                variant_manifest.read_checkpointed(path)
+            with self.assertRaises(FileExistsError):
+                variant_manifest.ManifestWriter(path)
+
+
+def manifest_record(order: list[str], elapsed: float, *, kind: str = "ordered_pair", cached_steps: int | None = None) -> dict:
+    record = {
+        "kind": kind,
+        "application_order": order,
+        "relative_path": f"{kind}/{'__'.join(order)}.png",
+        "width": 8,
+        "height": 6,
+        "size_bytes": 100,
+        "elapsed_seconds": elapsed,
+        "metrics": {"psnr_db": None, "ssim": 1.0 - elapsed, "mean_absolute_difference": 0.0},
+    }
+    if cached_steps is not None:
+        record["cached_steps"] = cached_steps
+    return record
+
+
+class ManifestQueryTests(unittest.TestCase):
+    def test_sidecar_index_filters_sorts_and_updates_incrementally(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            first, second = Path(directory) / "first", Path(directory) / "second"
+            first.mkdir()
+            second.mkdir()
+            with variant_manifest.ManifestWriter(first / "manifest.jsonl") as writer:
+                writer.append(manifest_record(["motion-blur"], 0.5, kind="single"))
+                writer.append(manifest_record(["gaussian-blur", "motion-blur"], 0.3))
+                writer.append(manifest_record(["motion-blur", "gaussian-blur"], 0.1))
+                writer.append(manifest_record(["median-filter", "motion-blur"], 0.2, cached_steps=2))
+            manifests = query_manifest.manifest_paths([first])
+
+            matches = query_manifest.query(manifests, kind="ordered_pair", outer="motion-blur", sort="elapsed_seconds")
+            self.assertEqual([0.2, 0.3], [record["elapsed_seconds"] for _, record in matches])
+            matches = query_manifest.query(manifests, steps=["motion-blur"], sort="ssim", descending=True, limit=2)
+            self.assertEqual([0.1, 0.2], [record["elapsed_seconds"] for _, record in matches])
+
+            # Only records committed after the last query are parsed, and an
+            # uncommitted tail is not indexed.
+            with variant_manifest.ManifestWriter(first / "manifest.jsonl", resume=True) as writer:
+                writer.append(manifest_record(["gaussian-blur"], 0.4, kind="single", cached_steps=0))
+            with (first / "manifest.jsonl").open("ab") as manifest:
+                manifest.write(b'{"kind": "single", "tor')
+            row = query_manifest._row
+            with mock.patch.object(query_manifest, "_row", side_effect=row) as parsed:
+                with query_manifest.ManifestIndex(first / "manifest.jsonl") as index:
+                    self.assertEqual(5, index.record_count)
+            self.assertEqual(1, parsed.call_count)
+
+            with variant_manifest.ManifestWriter(second / "manifest.jsonl") as writer:
+                writer.append(manifest_record(["motion-blur"], 0.7, kind="single", cached_steps=1))
+                writer.append(manifest_record(["gaussian-blur", "motion-blur"], 0.9, cached_steps=1))
+            summary = query_manifest.timing_summary(query_manifest.manifest_paths([first, second]))
+            self.assertEqual(
+                [("motion-blur", 2, 3, 0.566667), ("gaussian-blur", 1, 2, 0.25)],
+                [(entry["transform"], entry["runs"], entry["count"], entry["mean_seconds"]) for entry in summary],
+            )
+
+            # A rewritten manifest rebuilds its sidecar.
+            (second / "manifest.jsonl").unlink()
+            with variant_manifest.ManifestWriter(second / "manifest.jsonl") as writer:
+                writer.append(manifest_record(["dithering"], 0.1, kind="single"))
+            matches = query_manifest.query([second / "manifest.jsonl"])
+            self.assertEqual([["dithering"]], [record["application_order"] for _, record in matches])
+
+            (second / "manifest.jsonl").write_bytes(b"{}" + (second / "manifest.jsonl").read_bytes()[2:])
+            with self.assertRaises(ValueError):
+                query_manifest.query([second / "manifest.jsonl"])
+            with self.assertRaises(ValueError):
+                query_manifest.query(manifests, sort="offset; DROP TABLE records")
+
+
+class ResumeTests(unittest.TestCase):
+    def interrupt(self, output: Path, kept: int) -> list[dict]:
+        """Cut a finished run back to its first kept records, as a crash would."""
+        manifest_path = output / "manifest.jsonl"
+        records = [json.loads(line) for line in manifest_path.read_text(encoding="utf-8").splitlines()]
+        manifest_path.unlink()
+        variant_manifest.checkpoint_path(manifest_path).unlink()
+        with variant_manifest.ManifestWriter(manifest_path) as writer:
+            for record in records[:kept]:
+                writer.append(record)
+        for record in records[kept:]:
+            (output / record["relative_path"]).unlink()
+        return records
+
+    def test_resumed_runs_fill_in_only_missing_images(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            source = root / "source.png"
+            make_pattern(24, 18).save(source)
+            output = root / "pairs"
+            generate_variants.generate(source, output, 1)
+            records = self.interrupt(output, 100)
+            kept_file = output / records[0]["relative_path"]
+            kept_bytes = kept_file.read_bytes()
+
+            with self.assertRaises(ValueError):
+                generate_variants.generate(
+                    source, output, 1, output_format=variant_output.OutputFormat("npy"), resume=True
+                )
+            with mock.patch.object(generate_variants, "MetricsVersion", 0):
+                with self.assertRaises(ValueError):
+                    generate_variants.generate(source, output, 1, resume=True)
+            kept_file.write_bytes(kept_bytes[:-1])
+            with self.assertRaises(ValueError):
+                generate_variants.generate(source, output, 1, resume=True)
+            kept_file.write_bytes(kept_bytes)
+
+            generate_variants.generate(source, output, 1, resume=True)
+            resumed = variant_manifest.read_checkpointed(output / "manifest.jsonl")
+            by_order = {tuple(record["application_order"]): record["sha256"] for record in resumed}
+            self.assertEqual(len(records), len(resumed))
+            self.assertEqual(
+                {tuple(record["application_order"]): record["sha256"] for record in records},
+                by_order,
+            )
+            run = json.loads((output / "run.json").read_text(encoding="utf-8"))
+            self.assertEqual(("success", 100, 1), (run["status"], run["records_kept"], len(run["resumes"])))
+
+            output = root / "random"
+            arguments = {"count": 8, "minimum_steps": 1, "maximum_steps": 3, "seed": 5}
+            generate_random_variants.generate(source, output, **arguments)
+            records = self.interrupt(output, 3)
+            with self.assertRaises(ValueError):
+                generate_random_variants.generate(source, output, **{**arguments, "seed": 6}, resume=True)
+            with mock.patch.object(generate_random_variants, "MetricsVersion", 0):
+                with self.assertRaises(ValueError):
+                    generate_random_variants.generate(source, output, **arguments, resume=True)
+            generate_random_variants.generate(source, output, **arguments, resume=True)
+            resumed = variant_manifest.read_checkpointed(output / "manifest.jsonl")
+            for record in records + resumed:
+                del record["elapsed_seconds"]
+            self.assertEqual(records, resumed)
+
+
+class CorpusTests(unittest.TestCase):
+    def test_corpus_matches_single_source_runs(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            corpus = root / "corpus"
+            corpus.mkdir()
+            make_pattern(20, 14).save(corpus / "wide.png")
+            make_pattern(12, 16).convert("RGBA").save(corpus / "tall.png")
+            (corpus / "notes.txt").write_text("not an image", encoding="utf-8")
+            sources = generate_variants.corpus_sources([corpus])
+            self.assertEqual(["tall.png", "wide.png"], [source.name for source in sources])
+
+            generate_variants.generate_corpus(sources, root / "corpus-output", 2)
+            index = json.loads((root / "corpus-output" / "corpus.json").read_text(encoding="utf-8"))
+            self.assertEqual("success", index["status"])
+            for entry, source in zip(index["sources"], sources, strict=True):
+                self.assertEqual(("success", source.stem), (entry["status"], entry["directory"]))
+                generate_variants.generate(source, root / source.stem, 1)
+                expected = variant_manifest.read_checkpointed(root / source.stem / "manifest.jsonl")
+                actual = variant_manifest.read_checkpointed(
+                    root / "corpus-output" / source.stem / "manifest.jsonl"
+                )
+                self.assertEqual(
+                    sorted((record["relative_path"], record["sha256"]) for record in expected),
+                    sorted((record["relative_path"], record["sha256"]) for record in actual),
+                )
+
+            (corpus / "other").mkdir()
+            make_pattern(8, 8).save(corpus / "other" / "wide.png")
+            with self.assertRaises(ValueError):
+                generate_variants.generate_corpus(
+                    [corpus / "wide.png", corpus / "other" / "wide.png"], root / "duplicate", 1
+                )
+
+
+    def test_cached_steps_count_only_steps_read_from_the_cache(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            source = root / "source.png"
+            make_pattern(12, 10).save(source)
+
+            def cached_steps(manifest: Path) -> dict[str, set[int]]:
+                steps: dict[str, set[int]] = {"single": set(), "ordered_pair": set()}
+                for record in variant_manifest.read_checkpointed(manifest):
+                    steps[record["kind"]].add(record["cached_steps"])
+                return steps
+
+            cache = root / "cache"
+            generate_variants.generate(source, root / "cold", 1, cache_directory=cache)
+            self.assertEqual({"single": {0}, "ordered_pair": {0}}, cached_steps(root / "cold" / "manifest.jsonl"))
+            # Only the singles are cached, so each pair reads its inner step.
+            singles = root / "singles"
+            with perturbation_cache.PerturbationCache(singles, max_bytes=1 << 30) as warm, Image.open(source) as image:
+                for spec in generate_variants.Transforms:
+                    warm.run(variant_manifest.sha256_file(source), image, [spec])[0].close()
+            generate_variants.generate_corpus([source], root / "corpus", 1, cache_directory=singles)
+            self.assertEqual(
+                {"single": {1}, "ordered_pair": {1}},
+                cached_steps(root / "corpus" / "source" / "manifest.jsonl"),
+            )
+            generate_variants.generate(source, root / "warm", 1, cache_directory=cache)
+            self.assertEqual({"single": {1}, "ordered_pair": {2}}, cached_steps(root / "warm" / "manifest.jsonl"))
+
+
+class VariantOutputTests(unittest.TestCase):
+    def test_formats_round_trip_pixels_and_hash_the_written_bytes(self) -> None:
+        image = make_pattern(32, 24).convert("RGBA")
+        image.putalpha(make_pattern(32, 24).convert("L"))
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            for name in variant_output.FormatExtensions:
+                with self.subTest(name=name):
+                    output_format = variant_output.OutputFormat(name)
+                    with variant_output.OutputWriter(output_format) as writer:
+                        written = writer.submit(image.copy(), root / name).result()
+                    self.assertEqual(root / f"{name}{output_format.extension}", written.path)
+                    payload = written.path.read_bytes()
+                    self.assertEqual(hashlib.sha256(payload).hexdigest(), written.sha256)
+                    if name == "npy":
+                        pixels = np.load(written.path, allow_pickle=False)
+                    else:
+                        with Image.open(written.path) as saved:
+                            self.assertEqual("RGBA", saved.mode)
+                            pixels = np.asarray(saved)
+                    np.testing.assert_array_equal(np.asarray(image), pixels)
+
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            self.assertEqual(buffer.getvalue(), (root / "png.png").read_bytes())
+
+    def test_unsupported_modes_and_levels_fail_closed(self) -> None:
+        with self.assertRaises(ValueError):
+            variant_output.OutputFormat("webp-lossless").encode(Image.new("L", (4, 4)))
+        with self.assertRaises(ValueError):
+            variant_output.OutputFormat("npy").encode(Image.new("P", (4, 4)))
+        with self.assertRaises(ValueError):
+            variant_output.OutputFormat("png", 10)
+        with self.assertRaises(ValueError):
+            variant_output.OutputFormat("tiff")
+
+
+class DifferenceMetricTests(unittest.TestCase):
+    def test_metrics_match_direct_definitions(self) -> None:
+        source = make_pattern(23, 19)
+        variant = perturbations.gaussian_blur(source, radius=1.5)
+        reference = variant_metrics.DifferenceReference(source)
+
+        def luma(image: Image.Image) -> np.ndarray:
+            return np.asarray(image, dtype=np.float64) @ np.array([0.299, 0.587, 0.114])
+
+        windows = []
+        for top in range(19 - 6):
+            for left in range(23 - 6):
+                x = luma(source)[top : top + 7, left : left + 7]
+                y = luma(variant)[top : top + 7, left : left + 7]
+                covariance = ((x - x.mean()) * (y - y.mean())).mean()
+                windows.append(
+                    (2 * x.mean() * y.mean() + 6.5025)
+                    * (2 * covariance + 58.5225)
+                    / ((x.mean() ** 2 + y.mean() ** 2 + 6.5025) * (x.var() + y.var() + 58.5225))
+                )
+        difference = np.asarray(source, dtype=np.float64) - np.asarray(variant, dtype=np.float64)
+        metrics = reference.measure(variant)
+        self.assertAlmostEqual(np.mean(windows), metrics["ssim"], places=5)
+        self.assertAlmostEqual(np.abs(difference).mean(), metrics["mean_absolute_difference"], places=5)
+        self.assertAlmostEqual(
+            10 * np.log10(255**2 / np.square(difference).mean()),
+            metrics["psnr_db"],
+            places=5,
+        )
+
+        self.assertEqual(
+            {"psnr_db": None, "ssim": 1.0, "mean_absolute_difference": 0.0},
+            reference.measure(source.convert("RGBA")),
+        )
+        resized = source.resize((9, 4), Image.Resampling.LANCZOS)
+        self.assertIsNone(reference.measure(resized)["psnr_db"])
+
+        with tempfile.TemporaryDirectory() as directory:
+            with variant_output.OutputWriter(variant_output.OutputFormat()) as writer:
+                written = writer.submit(variant.copy(), Path(directory) / "blur", reference.measure).result()
+                plain = writer.submit(variant.copy(), Path(directory) / "plain").result()
+        self.assertEqual(metrics, written.metrics)
+        self.assertIsNone(plain.metrics)
+
+    def test_prepared_sizes_are_bounded_by_bytes(self) -> None:
+        reference = variant_metrics.DifferenceReference(make_pattern(23, 19))
+        nbytes = {size: reference._prepare(size).nbytes for size in ((10, 8), (12, 8))}
+        reference = variant_metrics.DifferenceReference(make_pattern(23, 19))
+        # Room for the 10 x 8 and 12 x 8 sizes, but not a third or the full size.
+        with mock.patch.object(variant_metrics, "PreparedBytes", sum(nbytes.values())):
+            for size in ((10, 8), (11, 8), (10, 8), (12, 8), (23, 19)):
+                reference.measure(Image.new("RGB", size))
+        self.assertEqual([(10, 8), (12, 8)], list(reference._prepared))
+        self.assertEqual(sum(nbytes.values()), reference._prepared_bytes)
+        for prepared in reference._prepared.values():
+            self.assertEqual(
+                [np.float32] * 4,
+                [plane.dtype for plane in (prepared.rgb, prepared.luma, prepared.mean, prepared.variance)],
+            )
+
+
+class RandomVariantTests(unittest.TestCase):
+    def test_prefix_trie_counts_shared_steps_once(self) -> None:
+        one, two, three = generate_variants.Transforms[:3]
+        trie = generate_random_variants.build_prefix_trie(
+            [(1, (one, two)), (2, (one, two, three)), (3, (one, three)), (4, (two,))]
+        )
+        self.assertEqual(5, trie.application_count)
+        self.assertEqual([1], trie.children[one.number].children[two.number].image_numbers)
+
+    def test_trie_run_matches_sequential_pipelines(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            source = root / "source.png"
+            make_pattern(32, 24).save(source)
+            generate_random_variants.generate(
+                source,
+                root / "output",
+                count=12,
+                minimum_steps=1,
+                maximum_steps=3,
+                seed=7,
+                workers=2,
+            )
+            records = [
+                json.loads(line)
+                for line in (root / "output" / "manifest.jsonl").read_text(encoding="utf-8").splitlines()
+            ]
+            pipelines = generate_random_variants.draw_pipelines(7, 12, 1, 3)
+            self.assertEqual(list(range(1, 13)), [record["image_number"] for record in records])
+            for record, pipeline in zip(records, pipelines, strict=True):
+                expected = make_pattern(32, 24)
+                for spec in pipeline:
+                    expected = spec.apply(expected)
+                with Image.open(root / "output" / record["relative_path"]) as saved:
+                    np.testing.assert_array_equal(np.asarray(expected), np.asarray(saved))
+                saved_bytes = (root / "output" / record["relative_path"]).read_bytes()
+                self.assertEqual(hashlib.sha256(saved_bytes).hexdigest(), record["sha256"])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,211 @@
+"""Append manifest records with group commit and a durable checkpoint.
+
+Records are buffered and made durable together: once CommitRecords records
+are waiting, or CommitSeconds have passed since the last commit, the manifest
+is fsynced and a checkpoint sidecar is replaced atomically. The checkpoint
+holds the record count, byte length, and sha256 of the durable manifest
+prefix. Anything after that prefix may be lost or torn by a crash and is not
+trusted: readers stop at the checkpoint, and a resumed writer truncates the
+manifest back to it.
+
+A resumed run keeps the checkpointed records only after every one of their
+output files matches the recorded size and sha256, and only when run.json
+describes the same run.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from datetime import datetime, timezone
+import hashlib
+import json
+import os
+from pathlib import Path
+import time
+from typing import Any
+
+
+CheckpointVersion = 1
+
+CommitRecords = 64
+CommitSeconds = 2.0
+
+
+def checkpoint_path(manifest_path: Path) -> Path:
+    return manifest_path.with_name(manifest_path.name + ".checkpoint")
+
+
+def _encode(record: dict[str, Any]) -> bytes:
+    return (json.dumps(record, sort_keys=True, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def read_checkpoint(manifest_path: Path) -> dict[str, Any]:
+    """Return the manifest's checkpoint, failing if it is missing or another version."""
+    path = checkpoint_path(manifest_path)
+    if not path.is_file():
+        raise FileNotFoundError(f"Manifest checkpoint does not exist: {path}")
+    checkpoint = json.loads(path.read_text(encoding="utf-8"))
+    if checkpoint.get("checkpoint_version") != CheckpointVersion:
+        raise ValueError(
+            f"{path} has checkpoint_version {checkpoint.get('checkpoint_version')}, "
+            f"expected {CheckpointVersion}"
+        )
+    return checkpoint
+
+
+def _durable_prefix(manifest_path: Path) -> tuple[bytes, dict[str, Any]]:
+    checkpoint = read_checkpoint(manifest_path)
+    with manifest_path.open("rb") as manifest:
+        prefix = manifest.read(checkpoint["bytes"])
+    if len(prefix) != checkpoint["bytes"] or hashlib.sha256(prefix).hexdigest() != checkpoint["sha256"]:
+        raise ValueError(f"Manifest does not match its checkpoint: {manifest_path}")
+    return prefix, checkpoint
+
+
+def read_checkpointed(manifest_path: Path) -> list[dict[str, Any]]:
+    """Return the records up to the last durable checkpoint."""
+    prefix, checkpoint = _durable_prefix(manifest_path)
+    records = [json.loads(line) for line in prefix.decode("utf-8").splitlines()]
+    if len(records) != checkpoint["records"]:
+        raise ValueError(f"Manifest checkpoint record count does not match: {manifest_path}")
+    return records
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as source:
+        for block in iter(lambda: source.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def verify_outputs(output: Path, records: Sequence[dict[str, Any]]) -> None:
+    """Check each record's output file by size, then by sha256."""
+    for record in records:
+        path = output / record["relative_path"]
+        if not path.is_file():
+            raise FileNotFoundError(f"Manifest record has no output file: {path}")
+        if path.stat().st_size != record["size_bytes"] or sha256_file(path) != record["sha256"]:
+            raise ValueError(f"Output file does not match its manifest record: {path}")
+
+
+def resume_run(
+    run_path: Path,
+    run_metadata: dict[str, Any],
+    identity_keys: Sequence[str],
+) -> dict[str, Any]:
+    """Check that run.json describes the same run and return the merged metadata.
+
+    The original start time is kept and each resume is listed under resumes.
+    """
+    if not run_path.is_file():
+        raise FileNotFoundError(f"Nothing to resume: {run_path} does not exist")
+    stored = json.loads(run_path.read_text(encoding="utf-8"))
+    for key in identity_keys:
+        if stored.get(key) != run_metadata[key]:
+            raise ValueError(
+                f"Cannot resume: {key} is {stored.get(key)!r} in {run_path}, "
+                f"expected {run_metadata[key]!r}"
+            )
+    merged = dict(run_metadata)
+    merged["started_at_utc"] = stored["started_at_utc"]
+    merged["resumes"] = stored.get("resumes", []) + [datetime.now(timezone.utc).isoformat()]
+    return merged
+
+
+def _fsync_directory(directory: Path) -> None:
+    # Windows cannot open a directory for fsync; its rename is durable once
+    # MoveFileEx returns.
+    if os.name != "posix":
+        return
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class ManifestWriter:
+    """Append JSONL records and commit them in groups.
+
+    With resume, the manifest is truncated to its last checkpoint and
+    appending continues from there; otherwise the manifest must not exist.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        resume: bool = False,
+        commit_records: int = CommitRecords,
+        commit_seconds: float = CommitSeconds,
+    ) -> None:
+        if commit_records < 1 or commit_seconds < 0:
+            raise ValueError("commit_records must be positive and commit_seconds must not be negative")
+        self.path = path
+        self.commit_records = commit_records
+        self.commit_seconds = commit_seconds
+        self._digest = hashlib.sha256()
+        self.records = 0
+        if resume:
+            prefix, checkpoint = _durable_prefix(path)
+            self._digest.update(prefix)
+            self.records = checkpoint["records"]
+            self._file = path.open("r+b")
+            self._file.truncate(len(prefix))
+            self._file.seek(len(prefix))
+        else:
+            self._file = path.open("xb")
+        self.bytes = self._file.tell()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+        if not resume:
+            self.commit()
+
+    def append(self, record: dict[str, Any]) -> None:
+        line = _encode(record)
+        self._file.write(line)
+        self._digest.update(line)
+        self.bytes += len(line)
+        self.records += 1
+        self._uncommitted += 1
+        if (
+            self._uncommitted >= self.commit_records
+            or time.monotonic() - self._last_commit >= self.commit_seconds
+        ):
+            self.commit()
+
+    def commit(self) -> None:
+        """Make every appended record durable and move the checkpoint to it."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        checkpoint = {
+            "checkpoint_version": CheckpointVersion,
+            "records": self.records,
+            "bytes": self.bytes,
+            "sha256": self._digest.hexdigest(),
+        }
+        path = checkpoint_path(self.path)
+        temporary = path.with_name(f".{path.name}.partial")
+        with temporary.open("w", encoding="utf-8") as sidecar:
+            sidecar.write(json.dumps(checkpoint, sort_keys=True) + "\n")
+            sidecar.flush()
+            os.fsync(sidecar.fileno())
+        temporary.replace(path)
+        _fsync_directory(path.parent)
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        try:
+            self.commit()
+        finally:
+            self._file.close()
+
+    def __enter__(self) -> ManifestWriter:
+        return self
+
+    def __exit__(self, *exception: object) -> None:
+        self.close()
@@ -0,0 +1,141 @@
+"""Difference metrics between a variant and its source, computed in memory.
+
+Metrics:
+    psnr_db                    PSNR over the RGB channels, peak 255. None when
+                               the pixels are identical, since it is infinite.
+    ssim                       Mean SSIM of Rec. 601 luminance over every 7x7
+                               window (uniform weights, K1 = 0.01, K2 = 0.03).
+    mean_absolute_difference   Mean absolute RGB difference, in levels.
+
+Alpha is ignored. A variant whose size differs from the source is compared
+with the source resized to the variant's size with Lanczos. The source side
+of each size is prepared once and shared by every variant of that size; the
+most recently used sizes are kept up to PreparedBytes.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import math
+import threading
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+
+MetricsVersion = 2
+
+# Prepared source bytes kept per reference. Runs produce a handful of sizes,
+# so this only bounds runs that sweep many, or very large sources.
+PreparedBytes = 256 * 1024**2
+
+SsimWindow = 7
+_SsimC1 = (0.01 * 255) ** 2
+_SsimC2 = (0.03 * 255) ** 2
+_LumaWeights = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def _rgb(image: Image.Image) -> np.ndarray:
+    return np.asarray(image if image.mode == "RGB" else image.convert("RGB"), dtype=np.float32)
+
+
+def _window_means(values: np.ndarray, window: int) -> np.ndarray:
+    """Mean of every window x window block, from a summed-area table."""
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1))
+    np.cumsum(values, axis=0, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+    return (
+        table[window:, window:]
+        - table[:-window, window:]
+        - table[window:, :-window]
+        + table[:-window, :-window]
+    ) / (window * window)
+
+
+def _luma_statistics(rgb: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Luma and its window means and variances, stored as float32."""
+    luma = rgb @ _LumaWeights
+    mean = _window_means(luma, window).astype(np.float32)
+    variance = _window_means(np.square(luma, dtype=np.float64), window) - mean * mean
+    return luma, mean, variance.astype(np.float32)
+
+
+@dataclass(frozen=True)
+class _Prepared:
+    rgb: np.ndarray
+    luma: np.ndarray
+    mean: np.ndarray
+    variance: np.ndarray
+    window: int
+
+    @property
+    def nbytes(self) -> int:
+        return self.rgb.nbytes + self.luma.nbytes + self.mean.nbytes + self.variance.nbytes
+
+
+class DifferenceReference:
+    """Measure variants against one source image; safe to share across threads."""
+
+    def __init__(self, source: Image.Image) -> None:
+        self._source = source.convert("RGB")
+        self._prepared: OrderedDict[tuple[int, int], _Prepared] = OrderedDict()
+        self._prepared_bytes = 0
+        self._lock = threading.Lock()
+
+    def _prepare(self, size: tuple[int, int]) -> _Prepared:
+        with self._lock:
+            prepared = self._prepared.get(size)
+            if prepared is not None:
+                self._prepared.move_to_end(size)
+                return prepared
+
+        # Resize and window passes run unlocked, so other sizes are not held
+        # up; when two threads prepare the same size, the first insert wins.
+        resized = self._source
+        if size != resized.size:
+            resized = resized.resize(size, Image.Resampling.LANCZOS)
+        rgb = _rgb(resized)
+        window = min(SsimWindow, *rgb.shape[:2])
+        prepared = _Prepared(rgb, *_luma_statistics(rgb, window), window)
+
+        with self._lock:
+            cached = self._prepared.get(size)
+            if cached is not None:
+                self._prepared.move_to_end(size)
+                return cached
+            if prepared.nbytes <= PreparedBytes:
+                self._prepared[size] = prepared
+                self._prepared_bytes += prepared.nbytes
+                while self._prepared_bytes > PreparedBytes:
+                    _, evicted = self._prepared.popitem(last=False)
+                    self._prepared_bytes -= evicted.nbytes
+        return prepared
+
+    def measure(self, image: Image.Image) -> dict[str, Any]:
+        reference = self._prepare(image.size)
+        rgb = _rgb(image)
+        difference = rgb - reference.rgb
+        np.abs(difference, out=difference)
+        mean_absolute = float(difference.mean(dtype=np.float64))
+        squared_error = float(np.square(difference).mean(dtype=np.float64))
+
+        luma, mean, variance = _luma_statistics(rgb, reference.window)
+        covariance = (
+            _window_means(np.multiply(luma, reference.luma, dtype=np.float64), reference.window)
+            - mean * reference.mean
+        )
+        ssim = (
+            (2 * mean * reference.mean + _SsimC1)
+            * (2 * covariance + _SsimC2)
+            / (
+                (mean * mean + reference.mean * reference.mean + _SsimC1)
+                * (variance + reference.variance + _SsimC2)
+            )
+        )
+        return {
+            "psnr_db": None if squared_error == 0 else round(10 * math.log10(255**2 / squared_error), 6),
+            "ssim": round(float(ssim.mean()), 6),
+            "mean_absolute_difference": round(mean_absolute, 6),
+        }
@@ -0,0 +1,200 @@
+"""Encode and write variant images on a writer thread pool.
+
+Formats:
+    png            PNG at a chosen zlib compress level (Pillow's default is 6).
+    png-store      PNG with compress level 0: stored blocks, fastest to write.
+    webp-lossless  Lossless WebP, keeping the RGB of fully transparent pixels.
+                   RGB and RGBA only, since WebP has no other modes. An
+                   RGBA image whose alpha is fully opaque decodes as RGB.
+    npy            NumPy array. Modes whose array holds every pixel value only;
+                   palette images are refused.
+
+Each image is encoded in memory, hashed, and written atomically on a worker
+thread, so transforms on the calling thread overlap with zlib and WebP
+encoding, which release the GIL. A measure callable passed with the image
+runs on the same thread, before the image is closed.
+"""
+
+from __future__ import annotations
+
+import argparse
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+import hashlib
+import io
+from pathlib import Path
+import threading
+import time
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+
+FormatExtensions = {
+    "png": ".png",
+    "png-store": ".png",
+    "webp-lossless": ".webp",
+    "npy": ".npy",
+}
+
+WebpModes = ("RGB", "RGBA")
+NpyModes = ("1", "L", "LA", "I", "I;16", "F", "RGB", "RGBA")
+
+DefaultWriterThreads = 2
+
+# Images queued per writer thread before submit blocks, so a fast transform
+# loop cannot pile decoded images up in memory.
+PendingPerThread = 2
+
+
+@dataclass(frozen=True)
+class OutputFormat:
+    name: str = "png"
+    png_compress_level: int = 6
+
+    def __post_init__(self) -> None:
+        if self.name not in FormatExtensions:
+            raise ValueError(f"output format must be one of {sorted(FormatExtensions)}")
+        if not 0 <= self.png_compress_level <= 9:
+            raise ValueError("png_compress_level must be in [0, 9]")
+
+    @property
+    def extension(self) -> str:
+        return FormatExtensions[self.name]
+
+    def manifest_entry(self) -> dict[str, Any]:
+        entry: dict[str, Any] = {"name": self.name, "extension": self.extension}
+        if self.name == "png":
+            entry["compress_level"] = self.png_compress_level
+        if self.name == "png-store":
+            entry["compress_level"] = 0
+        return entry
+
+    def encode(self, image: Image.Image) -> bytes:
+        buffer = io.BytesIO()
+        if self.name == "png":
+            image.save(buffer, format="PNG", compress_level=self.png_compress_level)
+        elif self.name == "png-store":
+            image.save(buffer, format="PNG", compress_level=0)
+        elif self.name == "webp-lossless":
+            if image.mode not in WebpModes:
+                raise ValueError(f"webp-lossless cannot store mode {image.mode}")
+            image.save(buffer, format="WEBP", lossless=True, exact=True, method=0)
+        else:
+            if image.mode not in NpyModes:
+                raise ValueError(f"npy cannot store mode {image.mode}")
+            np.save(buffer, np.asarray(image), allow_pickle=False)
+        return buffer.getvalue()
+
+
+@dataclass(frozen=True)
+class WrittenOutput:
+    path: Path
+    sha256: str
+    size_bytes: int
+    encode_seconds: float
+    width: int
+    height: int
+    mode: str
+    metrics: dict[str, Any] | None = None
+
+
+def write_atomic(image: Image.Image, destination: Path, output_format: OutputFormat) -> WrittenOutput:
+    """Encode in memory, write atomically, and hash the written bytes."""
+    started = time.perf_counter()
+    encoded = output_format.encode(image)
+    temporary = destination.with_name(f".{destination.name}.partial")
+    try:
+        temporary.write_bytes(encoded)
+        temporary.replace(destination)
+    except Exception:
+        temporary.unlink(missing_ok=True)
+        raise
+    return WrittenOutput(
+        destination,
+        hashlib.sha256(encoded).hexdigest(),
+        len(encoded),
+        time.perf_counter() - started,
+        image.width,
+        image.height,
+        image.mode,
+    )
+
+
+class OutputWriter:
+    """Encode and write images on a thread pool.
+
+    submit takes ownership of the image and closes it after it is written;
+    pass a copy when the caller still needs the pixels.
+    """
+
+    def __init__(self, output_format: OutputFormat, threads: int = DefaultWriterThreads) -> None:
+        if threads < 1:
+            raise ValueError("writer threads must be positive")
+        self.output_format = output_format
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._slots = threading.BoundedSemaphore(threads * PendingPerThread)
+
+    def submit(
+        self,
+        image: Image.Image,
+        stem: Path,
+        measure: Callable[[Image.Image], dict[str, Any]] | None = None,
+    ) -> Future[WrittenOutput]:
+        """Write image to stem plus the format's extension.
+
+        The result carries measure(image) as its metrics when measure is given.
+        """
+        destination = stem.with_name(stem.name + self.output_format.extension)
+
+        def write() -> WrittenOutput:
+            try:
+                written = write_atomic(image, destination, self.output_format)
+                if measure is None:
+                    return written
+                return replace(written, metrics=measure(image))
+            finally:
+                image.close()
+                self._slots.release()
+
+        self._slots.acquire()
+        return self._executor.submit(write)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> OutputWriter:
+        return self
+
+    def __exit__(self, *exception: object) -> None:
+        self.close()
+
+
+def add_output_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--format",
+        choices=sorted(FormatExtensions),
+        default="png",
+        help="Output encoding; png-store and npy are fastest to write.",
+    )
+    parser.add_argument(
+        "--png-level",
+        type=int,
+        help="zlib compress level for --format png (default: 6).",
+    )
+    parser.add_argument(
+        "--writer-threads",
+        type=int,
+        default=DefaultWriterThreads,
+        help="Threads per process that encode and write outputs.",
+    )
+
+
+def output_format_from_arguments(args: argparse.Namespace) -> OutputFormat:
+    if args.png_level is None:
+        return OutputFormat(args.format)
+    if args.format != "png":
+        raise ValueError("--png-level only applies to --format png")
+    return OutputFormat(args.format, args.png_level)